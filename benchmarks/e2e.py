@@ -0,0 +1,359 @@
+"""End-to-end benchmark of port-16 against mock central system started in
+separate process, so CPU time of this process is port-16 only. Measures
+connect rate, latency percentiles of boot notification (with status
+notification of connector), heartbeat, authorize, start and stop
+transaction commands, and CPU utilisation of steady phase in which every
+charge point sends heartbeats and MeterValues of its running transaction,
+from which chargers per core are estimated. Results are written as JSON and
+could be compared with results of previous run.
+
+Usage: python -m benchmarks.e2e --chargers 1000 --steady 30
+    --output results.json --compare previous.json
+"""
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+import platform
+import subprocess
+from pathlib import Path
+from datetime import datetime, timezone
+from collections import defaultdict
+
+import numpy
+from fastapi.exceptions import HTTPException
+
+from port_16 import config, event_handler
+from port_16.api.charge_point import ChargingPointModel, HeartbeatModel
+from port_16.api.charge_point.bulk import BulkProvisioningJob
+from port_16.api.common import cp_db, heartbeat
+from port_16.api.common.ocpp_metrics import CALL_RESPONSE_TIME
+from port_16.api.commands.operations import (
+    execute_authorize, execute_boot_notification, execute_start_transaction,
+    execute_stop_transaction
+)
+from port_16.api.commands.schemas import StartTransaction, StopTransaction
+
+PERCENTILES = (50, 90, 99)
+RESULTS_DIR = Path(__file__).parent / 'results'
+#: Compared values of operation results, higher is better for rates
+COMPARED = ('rate', 'p50', 'p99')
+
+
+def timestamp() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def summary(values) -> dict:
+    if not values:
+        return {}
+
+    data = numpy.asarray(values) * 1000
+    result = {'mean_ms': float(data.mean())}
+    for percentile, value in zip(
+        PERCENTILES, numpy.percentile(data, PERCENTILES)
+    ):
+        result['p{}_ms'.format(percentile)] = float(value)
+    result['max_ms'] = float(data.max())
+    return result
+
+
+async def measure(cps, operation, concurrency: int) -> dict:
+    """
+    Runs operation for every charge point, at most concurrency at once.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = defaultdict(int)
+
+    async def run_one(cp):
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await operation(cp)
+            except HTTPException as e:
+                errors[str(e.status_code)] += 1
+                return
+            except Exception as e:
+                errors[type(e).__name__] += 1
+                return
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+    await asyncio.gather(*(run_one(cp) for cp in cps))
+    duration = time.perf_counter() - start
+    cpu = time.process_time() - cpu_start
+    return {
+        'count': len(latencies),
+        'errors': dict(errors),
+        'seconds': duration,
+        'rate': len(latencies) / duration,
+        'cpu_ms_per_operation': cpu / max(len(cps), 1) * 1000,
+        'latency': summary(latencies),
+    }
+
+
+async def start_mock_csms(args):
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, '-m', 'port_16.mock_csms',
+        '--host', args.host, '--port', '0',
+        '--delay', str(args.csms_delay),
+        '--heartbeat-interval', str(args.heartbeat_interval),
+        '--stats-interval', '3600',
+        stdout=asyncio.subprocess.PIPE
+    )
+    line = await asyncio.wait_for(process.stdout.readline(), 30)
+    if not line.startswith(b'listening'):
+        process.kill()
+        raise RuntimeError('Mock central system did not start')
+
+    return process, 'ws://{}:{}'.format(args.host, int(line.split()[1]))
+
+
+async def connect(args, ws_host: str) -> dict:
+    cp_models = [
+        ChargingPointModel(
+            identity='E2E-{:06d}'.format(number),
+            ws_host=ws_host,
+            connector_number=1,
+            heartbeat=HeartbeatModel(timeout=args.heartbeat_interval)
+        )
+        for number in range(args.chargers)
+    ]
+    job = BulkProvisioningJob(
+        cp_models, connect_rate=args.connect_rate,
+        max_concurrency=args.concurrency
+    ).start()
+    cpu_start = time.process_time()
+    await job.wait()
+    cpu = time.process_time() - cpu_start
+    progress = job.to_dict()
+    duration = progress['phases'].get('connect', 0.0)
+    return {
+        'chargers': args.chargers,
+        'connected': progress['connected'],
+        'failed': progress['failed'],
+        'seconds': duration,
+        'rate': progress['connected'] / duration if duration else 0.0,
+        'cpu_ms_per_operation': cpu / args.chargers * 1000,
+        'connect_time_avg_ms': progress['connect_time_avg'] * 1000,
+        'connect_time_max_ms': progress['connect_time_max'] * 1000,
+    }
+
+
+async def steady(args, cps) -> dict:
+    """
+    Measures CPU utilisation while charge points send heartbeats and
+    MeterValues of running transactions.
+    """
+    for cp in cps:
+        await heartbeat(cp)
+    # first heartbeats are spread over first interval
+    await asyncio.sleep(args.heartbeat_interval)
+
+    calls = (
+        CALL_RESPONSE_TIME.labels('Heartbeat'),
+        CALL_RESPONSE_TIME.labels('MeterValues'),
+    )
+    counts = [child.count for child in calls]
+    sums = [child.sum for child in calls]
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+    await asyncio.sleep(args.steady)
+    duration = time.perf_counter() - start
+    cpu = time.process_time() - cpu_start
+
+    heartbeats, meter_values = (
+        child.count - count for child, count in zip(calls, counts)
+    )
+    total = heartbeats + meter_values
+    response_time = sum(
+        child.sum - value for child, value in zip(calls, sums)
+    )
+    utilisation = cpu / duration
+    return {
+        'chargers': len(cps),
+        'seconds': duration,
+        'heartbeat_interval': args.heartbeat_interval,
+        'meter_value_sample_interval': config.METER_VALUE_SAMPLE_INTERVAL,
+        'heartbeats': heartbeats,
+        'meter_values': meter_values,
+        'rate': total / duration,
+        'response_time_mean_ms': response_time / total * 1000 if total else 0,
+        'cpu_utilisation': utilisation,
+        'cpu_ms_per_call': cpu / total * 1000 if total else 0.0,
+        # chargers with same heartbeat and sampling intervals which would
+        # saturate one core
+        'chargers_per_core': len(cps) / utilisation if utilisation else 0,
+    }
+
+
+async def run(args) -> dict:
+    config.STORAGE_BACKEND = args.storage
+    config.METER_VALUE_SAMPLE_INTERVAL = args.sample_interval
+    # closed connections must not be reopened at the end
+    config.RECONNECT_ENABLED = False
+    process = None
+    ws_host = args.csms
+    if ws_host is None:
+        process, ws_host = await start_mock_csms(args)
+
+    await event_handler.startup_handler()
+    logging.getLogger().setLevel(args.log_level)
+    results = {}
+    try:
+        results['connect'] = await connect(args, ws_host)
+        cps = cp_db.all_cps()
+        tags = {cp.id: 'TAG-{}'.format(cp.id) for cp in cps}
+        transactions = {}
+
+        async def start_transaction(cp):
+            response = await execute_start_transaction(
+                cp.id, StartTransaction(
+                    connector_id=1, id_tag=tags[cp.id],
+                    start_time=timestamp(), meter_start=0
+                )
+            )
+            transactions[cp.id] = response['transaction_id']
+
+        results['boot_notification'] = await measure(
+            cps, lambda cp: execute_boot_notification(cp.id),
+            args.concurrency
+        )
+        results['heartbeat'] = await measure(
+            cps, lambda cp: cp.send_heartbeat(), args.concurrency
+        )
+        results['authorize'] = await measure(
+            cps, lambda cp: execute_authorize(cp.id, tags[cp.id]),
+            args.concurrency
+        )
+        results['start_transaction'] = await measure(
+            cps, start_transaction, args.concurrency
+        )
+        if args.steady > 0:
+            results['steady'] = await steady(args, cps)
+        results['stop_transaction'] = await measure(
+            [cp for cp in cps if cp.id in transactions],
+            lambda cp: execute_stop_transaction(cp.id, StopTransaction(
+                transaction_id=transactions[cp.id],
+                stop_time=timestamp(), id_tag=tags[cp.id]
+            )),
+            args.concurrency
+        )
+
+        for cp in cps:
+            await cp.close_connection()
+    finally:
+        await event_handler.shutdown_handler()
+        if process is not None:
+            process.terminate()
+            await process.wait()
+
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, check=True, text=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: dict, previous: dict) -> None:
+    print('{:<20} {:<8} {:>12} {:>12} {:>8}'.format(
+        'operation', 'value', 'previous', 'current', 'change'
+    ))
+    for name, result in results.items():
+        old = previous.get(name)
+        if not old:
+            continue
+
+        for key in COMPARED:
+            if key == 'rate':
+                current, before = result.get(key), old.get(key)
+            else:
+                current = result.get('latency', {}).get(key + '_ms')
+                before = old.get('latency', {}).get(key + '_ms')
+            if current is None or not before:
+                continue
+
+            print('{:<20} {:<8} {:>12.3f} {:>12.3f} {:>+7.1f}%'.format(
+                name, key, before, current, (current / before - 1) * 100
+            ))
+
+
+def main(args):
+    started = timestamp()
+    results = asyncio.run(run(args))
+    report = {
+        'benchmark': 'e2e',
+        'timestamp': started,
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'parameters': {
+            key: value for key, value in vars(args).items()
+            if key not in ('output', 'compare')
+        },
+        'results': results,
+    }
+    output = args.output
+    if output is None:
+        RESULTS_DIR.mkdir(exist_ok=True)
+        output = RESULTS_DIR / 'e2e-{}.json'.format(
+            datetime.now().strftime('%Y%m%dT%H%M%S')
+        )
+    with open(output, 'w') as output_file:
+        json.dump(report, output_file, indent=2)
+
+    print(json.dumps(results, indent=2))
+    print('Results written to {}'.format(output))
+    if args.compare:
+        with open(args.compare) as previous_file:
+            compare(results, json.load(previous_file)['results'])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--chargers', type=int, default=1000)
+    parser.add_argument(
+        '--connect-rate', type=float, default=1000,
+        help='Connections opened per second'
+    )
+    parser.add_argument(
+        '--concurrency', type=int, default=200,
+        help='Max connections or commands in progress at once'
+    )
+    parser.add_argument(
+        '--steady', type=float, default=30,
+        help='Seconds of steady phase, 0 skips it'
+    )
+    parser.add_argument(
+        '--heartbeat-interval', type=int, default=10,
+        help='Heartbeat interval of charge points in steady phase'
+    )
+    parser.add_argument(
+        '--sample-interval', type=int, default=10,
+        help='MeterValues sample interval of transactions in steady phase'
+    )
+    parser.add_argument(
+        '--csms', help='Central system URL, mock is started if not provided'
+    )
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument(
+        '--csms-delay', type=float, default=0.0,
+        help='Response delay of mock central system'
+    )
+    parser.add_argument(
+        '--storage', default='memory', help='Storage backend of port-16'
+    )
+    parser.add_argument('--log-level', default='WARNING')
+    parser.add_argument('--output', help='Path of JSON results')
+    parser.add_argument('--compare', help='JSON results of previous run')
+    main(parser.parse_args())
@@ -0,0 +1,148 @@
+"""Measures heartbeat throughput of charge points connected to mock central
+system with synchronous logging (records written by event loop thread),
+queued logging (records written by background thread) and queued logging
+with sampled per charger loggers. Every charge point sends heartbeats one
+after another for duration of every mode. Log file is written to temporary
+directory and console output of debug mode is discarded.
+
+Usage: python -m benchmarks.logging_heartbeat --chargers 200 --duration 10
+    --sampling ocpp=0.01,websockets=0.01
+"""
+import os
+import time
+import asyncio
+import argparse
+import tempfile
+import contextlib
+from pathlib import Path
+
+from port_16 import config, event_handler
+from port_16.logs import configure_logging, stop_logging, RECORDS_DROPPED
+from port_16.api.common import cp_db
+from port_16.mock_csms.__main__ import action_map
+from benchmarks.e2e import start_mock_csms, connect, summary
+
+APPLICATION = 'port-16-benchmark'
+#: Benchmarked modes, name, queued logging and sampling of loggers
+MODES = (
+    ('sync', False, False),
+    ('queued', True, False),
+    ('queued + sampled', True, True),
+)
+
+
+async def send_heartbeats(cps, duration: float) -> dict:
+    loop = asyncio.get_event_loop()
+    end = loop.time() + duration
+    latencies = []
+    errors = 0
+
+    async def run_cp(cp):
+        nonlocal errors
+        while loop.time() < end:
+            start = time.perf_counter()
+            try:
+                await cp.send_heartbeat()
+            except Exception:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+    await asyncio.gather(*(run_cp(cp) for cp in cps))
+    seconds = time.perf_counter() - start
+    # includes CPU time of log writer thread
+    cpu = time.process_time() - cpu_start
+    return {
+        'heartbeats': len(latencies),
+        'errors': errors,
+        'rate': len(latencies) / seconds,
+        'cpu_ms_per_heartbeat': cpu / max(len(latencies), 1) * 1000,
+        'latency': summary(latencies),
+    }
+
+
+async def run(args):
+    config.STORAGE_BACKEND = 'memory'
+    config.RECONNECT_ENABLED = False
+    # measured loop is saturated on purpose
+    config.LOOP_SHED_THRESHOLD = 0
+    process, ws_host = await start_mock_csms(args)
+    await event_handler.startup_handler()
+    log_dir = tempfile.mkdtemp()
+    log_file = Path(log_dir) / 'log' / '{}.log'.format(APPLICATION)
+    # console handler keeps this stream, so it is not closed
+    console = open(os.devnull, 'w')
+    results = {}
+    try:
+        await connect(args, ws_host)
+        cps = cp_db.all_cps()
+        for name, queued, sampled in MODES:
+            config.LOG_SAMPLING = args.sampling if sampled else {}
+            with contextlib.redirect_stderr(console):
+                configure_logging(APPLICATION, log_dir, True, queued=queued)
+            size = log_file.stat().st_size
+            dropped = RECORDS_DROPPED.labels().value
+            result = await send_heartbeats(cps, args.duration)
+            start = time.perf_counter()
+            stop_logging()
+            result['drain_seconds'] = time.perf_counter() - start
+            result['log_bytes'] = log_file.stat().st_size - size
+            result['dropped'] = RECORDS_DROPPED.labels().value - dropped
+            results[name] = result
+
+        for cp in cps:
+            await cp.close_connection()
+    finally:
+        await event_handler.shutdown_handler()
+        process.terminate()
+        await process.wait()
+
+    return results
+
+
+def main(args):
+    results = asyncio.run(run(args))
+    base = results['sync']['rate']
+    print('{:<18} {:>10} {:>8} {:>10} {:>10} {:>10} {:>8}'.format(
+        'mode', 'hb/s', 'change', 'cpu ms/hb', 'p99 ms', 'log MB',
+        'dropped'
+    ))
+    for name, result in results.items():
+        print(
+            '{:<18} {:>10.1f} {:>+7.1f}% {:>10.3f} {:>10.2f} {:>10.2f} '
+            '{:>8.0f}'.format(
+                name, result['rate'], (result['rate'] / base - 1) * 100,
+                result['cpu_ms_per_heartbeat'],
+                result['latency'].get('p99_ms', 0.0),
+                result['log_bytes'] / 2 ** 20, result['dropped']
+            )
+        )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--chargers', type=int, default=200)
+    parser.add_argument(
+        '--duration', type=float, default=10,
+        help='Seconds of heartbeats of every mode'
+    )
+    parser.add_argument(
+        '--sampling', type=action_map,
+        default='ocpp=0.01,websockets=0.01,port_16.api.common.ocpp=0.01',
+        help='LOG_SAMPLING of sampled mode'
+    )
+    parser.add_argument('--connect-rate', type=float, default=1000)
+    parser.add_argument(
+        '--concurrency', type=int, default=200,
+        help='Max connections being opened at once'
+    )
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument(
+        '--csms-delay', type=float, default=0.0,
+        help='Response delay of mock central system'
+    )
+    # scheduled heartbeats do not disturb measured ones
+    parser.add_argument('--heartbeat-interval', type=int, default=3600)
+    main(parser.parse_args())
@@ -0,0 +1,43 @@
+"""Runs load scenario from YAML or JSON file within this process, without
+REST API, and prints its latency and throughput report. Storage backend and
+other settings are read from environment like by application, scenario
+should provision its charging points. Requires central system.
+
+Usage: python -m benchmarks.scenario benchmarks/scenarios/sessions.yaml
+    --report report.json
+"""
+import json
+import asyncio
+import argparse
+import logging
+
+from port_16 import event_handler
+from port_16.api.scenario import ScenarioRun, load_scenario
+
+
+async def run(args):
+    scenario = load_scenario(args.scenario)
+    if args.seed is not None:
+        scenario.seed = args.seed
+
+    await event_handler.startup_handler()
+    try:
+        report = await ScenarioRun(scenario).start().wait()
+    finally:
+        await event_handler.shutdown_handler()
+
+    if args.report:
+        with open(args.report, 'w') as report_file:
+            json.dump(report, report_file, indent=2)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('scenario', help='Scenario file (YAML or JSON)')
+    parser.add_argument('--report', help='Path of written JSON report')
+    parser.add_argument('--seed', type=int, help='Seed of random arrivals')
+    parser.add_argument('--log-level', default='WARNING')
+    arguments = parser.parse_args()
+    logging.basicConfig(level=arguments.log_level)
+    asyncio.run(run(arguments))
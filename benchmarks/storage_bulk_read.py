@@ -0,0 +1,83 @@
+"""Compares sequential per key reads with chunked bulk reads of stored
+entities. Requires running redis server.
+
+Usage: python -m benchmarks.storage_bulk_read --entities 10000 --chunk 500
+"""
+import time
+import asyncio
+import argparse
+
+import inject
+import aioredis
+
+from port_16.api.common.service.storage import StorageService
+from port_16.api.common.service.backend import RedisBackend
+
+BENCH_PATH = 'BENCH_CHARGE_POINT'
+
+
+async def sequential_read(service: StorageService) -> int:
+    count = 0
+    for identity in await service.get_all_keys():
+        data = await service.get_storage_entity(
+            '{}-{}'.format(service.storage_path, identity)
+        )
+        count += data is not None
+
+    return count
+
+
+async def bulk_read(service: StorageService, chunk_size: int) -> int:
+    count = 0
+    async for _ in service.iter_storage_entities(chunk_size):
+        count += 1
+
+    return count
+
+
+async def run(args):
+    redis = await aioredis.create_redis_pool(args.redis, db=args.db)
+    inject.clear_and_configure(lambda binder: (
+        binder.bind('storage_backend', RedisBackend(redis))
+        .bind('storage_cache', None)
+    ))
+    service = StorageService(identity='', storage_path=BENCH_PATH)
+    try:
+        for i in range(args.entities):
+            service.identity = 'CP-{}'.format(i)
+            await service.store_storage_entity({
+                'identity': service.identity,
+                'state': 'ACCEPTED',
+                'connector_number': 3,
+            })
+
+        start = time.perf_counter()
+        sequential_count = await sequential_read(service)
+        sequential_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        bulk_count = await bulk_read(service, args.chunk)
+        bulk_time = time.perf_counter() - start
+
+        print('entities: {}, chunk size: {}'.format(args.entities, args.chunk))
+        print('sequential: {} entities in {:.3f}s'.format(
+            sequential_count, sequential_time
+        ))
+        print('bulk:       {} entities in {:.3f}s ({:.1f}x)'.format(
+            bulk_count, bulk_time, sequential_time / bulk_time
+        ))
+    finally:
+        async for identity in redis.isscan(service.all_keys_key):
+            await redis.delete('{}-{}'.format(BENCH_PATH, identity.decode()))
+        await redis.delete(service.all_keys_key)
+        redis.close()
+        await redis.wait_closed()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--redis', default='redis://localhost')
+    parser.add_argument('--db', type=int, default=15)
+    parser.add_argument('--entities', type=int, default=10000)
+    parser.add_argument('--chunk', type=int, default=500)
+    asyncio.run(run(parser.parse_args()))
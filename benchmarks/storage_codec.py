@@ -0,0 +1,65 @@
+"""Measures encode/decode time of storage codecs for typical charge point,
+connector and auth tag documents. Does not require redis server.
+
+Usage: python -m benchmarks.storage_codec --number 100000
+"""
+import timeit
+import argparse
+
+from port_16.api.common.service.backend.codecs import CODECS, CodecRegistry
+
+DOCUMENTS = {
+    'charge_point': {
+        'identity': 'CP-000001',
+        'protocol': 'ocpp1.6',
+        'ws_host': 'ws://localhost:8020',
+        'ws_path': 'websocket/v16',
+        'heartbeat': {
+            'timeout': 5,
+            'model': 'Dummy model',
+            'vendor': 'Some vendor',
+            'serial_number': '123456789',
+        },
+        'state': 'ACCEPTED',
+        'connector_number': 3,
+    },
+    'connector': {'1': 'Available', '2': 'Charging', '3': 'Available'},
+    'auth_tag': {
+        'status': 'Accepted',
+        'expiry_date': '2030-01-01T00:00:00.000Z',
+        'parent_id_tag': 'PARENT-TAG',
+    },
+}
+
+
+def run(args):
+    print('{:<10} {:<14} {:>10} {:>10} {:>7}'.format(
+        'codec', 'document', 'encode us', 'decode us', 'bytes'
+    ))
+    for name, codec_cls in CODECS.items():
+        try:
+            registry = CodecRegistry(codec_cls())
+        except RuntimeError as e:
+            print('{:<10} skipped: {}'.format(name, e))
+            continue
+
+        for doc_name, document in DOCUMENTS.items():
+            encoded = registry.encode(document)
+            encode_time = timeit.timeit(
+                lambda: registry.encode(document), number=args.number
+            )
+            decode_time = timeit.timeit(
+                lambda: registry.decode(encoded), number=args.number
+            )
+            print('{:<10} {:<14} {:>10.3f} {:>10.3f} {:>7}'.format(
+                name, doc_name,
+                encode_time / args.number * 1e6,
+                decode_time / args.number * 1e6,
+                len(encoded)
+            ))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--number', type=int, default=100000)
+    run(parser.parse_args())
@@ -0,0 +1,122 @@
+"""Measures TLS connect rate of charge points against local TLS server with
+new SSL context per connection (previous behaviour), shared SSL context and
+shared SSL context with session resumption. Self-signed certificate is
+generated with openssl command unless --cert and --key are provided. Does
+not require central system.
+
+Usage: python -m benchmarks.tls_connect --connections 2000 --concurrency 50
+"""
+import ssl
+import time
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+
+from port_16.api.common.tls import create_ssl_context, record_handshake
+
+#: Benchmarked modes, name, shared context and session resumption
+MODES = (
+    ('per connection', False, False),
+    ('shared', True, False),
+    ('shared + resumption', True, True),
+)
+
+
+def generate_certificate(directory: str):
+    cert = str(Path(directory) / 'cert.pem')
+    key = str(Path(directory) / 'key.pem')
+    subprocess.run(
+        [
+            'openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes',
+            '-keyout', key, '-out', cert, '-days', '1',
+            '-subj', '/CN=localhost',
+        ],
+        check=True, capture_output=True
+    )
+    return cert, key
+
+
+async def handle(reader, writer):
+    # stand-in for central system, closes connection after first message
+    await reader.read(1)
+    writer.close()
+
+
+async def connect_all(args, port: int, shared: bool, resumption: bool):
+    loop = asyncio.get_event_loop()
+    shared_context = create_ssl_context(verify=False, resumption=resumption)
+    semaphore = asyncio.Semaphore(args.concurrency)
+    resumed = 0
+
+    async def connect():
+        nonlocal resumed
+        async with semaphore:
+            context = shared_context if shared else create_ssl_context(
+                verify=False, resumption=False
+            )
+            transport, _ = await loop.create_connection(
+                asyncio.Protocol, args.host, port, ssl=context,
+                server_hostname='localhost'
+            )
+            record_handshake(context, transport)
+            resumed += transport.get_extra_info('ssl_object').session_reused
+            transport.write(b'x')
+            # wait for TLS 1.3 session ticket, like connection which is used
+            await asyncio.sleep(0.01)
+            context.save_session(transport.get_extra_info('ssl_object'))
+            transport.close()
+
+    # first connection creates session which is resumed by others
+    await connect()
+    resumed = 0
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+    await asyncio.gather(*(connect() for _ in range(args.connections)))
+    return (
+        time.perf_counter() - start, time.process_time() - cpu_start, resumed
+    )
+
+
+async def run(args):
+    with tempfile.TemporaryDirectory() as directory:
+        if args.cert:
+            cert, key = args.cert, args.key
+        else:
+            cert, key = generate_certificate(directory)
+
+        server_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        server_context.load_cert_chain(cert, key)
+        server = await asyncio.start_server(
+            handle, args.host, 0, ssl=server_context
+        )
+        port = server.sockets[0].getsockname()[1]
+
+        # client and server share process, cpu time includes both sides
+        print('{:<20} {:>8} {:>10} {:>12} {:>10} {:>8}'.format(
+            'context', 'conns', 'seconds', 'cpu ms/conn', 'conns/s',
+            'resumed'
+        ))
+        for name, shared, resumption in MODES:
+            duration, cpu, resumed = await connect_all(
+                args, port, shared, resumption
+            )
+            print('{:<20} {:>8} {:>10.3f} {:>12.3f} {:>10.1f} {:>8}'.format(
+                name, args.connections, duration,
+                cpu / args.connections * 1000,
+                args.connections / duration, resumed
+            ))
+
+        server.close()
+        await server.wait_closed()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--connections', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--cert', help='Server certificate (PEM)')
+    parser.add_argument('--key', help='Server private key (PEM)')
+    asyncio.run(run(parser.parse_args()))
@@ -4,13 +4,14 @@ from .commands.handlers import misc
 from .commands.handlers import authorize
 from .commands.handlers import transaction
 from .charge_point import handlers as cp_handlers
+from .scenario import handlers as scenario_handlers
 
 from .commands import handlers as commands_handlers
 
 
 def attach_cp_routes(app: FastAPI) -> None:
     """
-    Attach charge point and commands routes to app
+    Attach charge point, commands and scenario routes to app
     :param app: App object
     """
     app.include_router(
@@ -33,3 +34,8 @@ def attach_cp_routes(app: FastAPI) -> None:
         tags=['authorize-commands'],
         router=authorize.router
     )
+    app.include_router(
+        prefix='/scenarios',
+        tags=['scenarios'],
+        router=scenario_handlers.router
+    )
@@ -0,0 +1,2 @@
+from .schemas import TaskGroupModel, TasksModel
+from .profiler import StackSampler, profile, dump_tasks
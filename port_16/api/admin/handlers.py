@@ -0,0 +1,54 @@
+from typing import Dict, Any, Optional
+
+from fastapi import APIRouter, Query
+from starlette.responses import PlainTextResponse
+
+from port_16 import config
+from .schemas import TasksModel
+from .profiler import profile, dump_tasks
+
+router = APIRouter()
+
+
+@router.get(
+    path='/profile',
+    response_class=PlainTextResponse,
+    summary='Profile',
+    description=(
+        'Samples stacks of event loop thread for provided number of seconds '
+        'and returns them in collapsed stack format for flame graphs'
+    ),
+    response_description='Collapsed stacks',
+)
+async def get_profile(
+    seconds: float = Query(10, gt=0, le=config.PROFILE_MAX_DURATION),
+    interval: Optional[float] = Query(None, gt=0, le=1)
+) -> PlainTextResponse:
+    """Profiles running application without stopping event loop, e.g.
+    `curl 'localhost:8016/admin/profile?seconds=30' > port-16.folded`.
+    :return: Collapsed stacks
+    """
+    return PlainTextResponse(
+        await profile(seconds, interval),
+        headers={
+            'Content-Disposition': 'attachment; filename="port-16.folded"'
+        }
+    )
+
+
+@router.get(
+    path='/tasks',
+    response_model=TasksModel,
+    summary='Pending tasks',
+    description=(
+        'Returns pending asyncio tasks grouped by coroutine with locations '
+        'where they are waiting'
+    ),
+    response_description='Task groups',
+)
+async def get_tasks() -> Dict[str, Any]:
+    """Shows what tasks of running application are doing, e.g. heartbeat
+    ticks, charge point listeners and background tasks.
+    :return: Task groups
+    """
+    return await dump_tasks()
@@ -0,0 +1,209 @@
+import os
+import sys
+import time
+import asyncio
+import logging
+import threading
+from pathlib import Path
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+from fastapi import HTTPException, status
+
+from port_16 import config
+
+logger = logging.getLogger(__name__)
+
+#: Number of tasks inspected before other callbacks of event loop run
+TASKS_CHUNK_SIZE = 1000
+_PROJECT_DIR = str(Path(__file__).parents[3]) + os.sep
+_SITE_PACKAGES = 'site-packages' + os.sep
+_profiling = False
+
+
+def _short_path(filename: str) -> str:
+    if filename.startswith(_PROJECT_DIR):
+        return filename[len(_PROJECT_DIR):]
+
+    _, found, package_path = filename.rpartition(_SITE_PACKAGES)
+    return package_path if found else os.path.basename(filename)
+
+
+def describe_code(code: Any) -> str:
+    return '{} ({}:{})'.format(
+        code.co_name, _short_path(code.co_filename), code.co_firstlineno
+    )
+
+
+def describe_frame(frame: Any) -> str:
+    return '{} ({}:{})'.format(
+        frame.f_code.co_name, _short_path(frame.f_code.co_filename),
+        frame.f_lineno
+    )
+
+
+class StackSampler:
+    """
+    Sampling profiler which records stacks of event loop thread from other
+    thread every interval. Profiled thread is not interrupted, so event loop
+    keeps serving charge points while it is profiled. Stacks are counted as
+    tuples of code objects and described only when result is rendered.
+    """
+
+    def __init__(
+        self,
+        thread_id: Optional[int] = None,
+        interval: Optional[float] = None
+    ):
+        self.thread_id = thread_id or threading.get_ident()
+        self.interval = interval or config.PROFILE_INTERVAL
+        self.samples = 0
+        self.stacks: Counter = Counter()
+
+    def sample(self, duration: float) -> None:
+        """
+        Records stacks of profiled thread for duration seconds. Runs in
+        sampling thread.
+
+        :param duration: Seconds of profiling.
+        """
+        next_time = time.monotonic()
+        end = next_time + duration
+        while next_time < end:
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                break
+
+            stack = []
+            while frame is not None:
+                stack.append(frame.f_code)
+                frame = frame.f_back
+            self.stacks[tuple(stack)] += 1
+            self.samples += 1
+
+            next_time += self.interval
+            delay = next_time - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+    def collapsed(self) -> str:
+        """
+        Renders recorded stacks in collapsed stack format, one line per
+        stack with frames from root separated by semicolons and number of
+        samples, which is read by flamegraph.pl, speedscope and similar
+        tools.
+
+        :return: Collapsed stacks.
+        """
+        names = {}
+        lines = []
+        for stack, count in self.stacks.most_common():
+            frames = []
+            for code in reversed(stack):
+                name = names.get(code)
+                if name is None:
+                    name = names[code] = describe_code(code)
+                frames.append(name)
+            lines.append('{} {}'.format(';'.join(frames), count))
+
+        return '\n'.join(lines) + '\n'
+
+
+async def profile(seconds: float, interval: Optional[float] = None) -> str:
+    """
+    Samples stacks of event loop thread for provided number of seconds in
+    executor thread. Only one profiling runs at once.
+
+    :param seconds: Seconds of profiling.
+    :param interval: Seconds between samples, PROFILE_INTERVAL if not
+        provided.
+    :return: Collapsed stacks.
+    """
+    global _profiling
+    if _profiling:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail='Profiling is already running'
+        )
+
+    _profiling = True
+    try:
+        sampler = StackSampler(interval=interval)
+        logger.info('Profiling event loop thread for {} seconds'.format(
+            seconds
+        ))
+        await asyncio.get_event_loop().run_in_executor(
+            None, sampler.sample, seconds
+        )
+    finally:
+        _profiling = False
+
+    logger.info('Profiling done, {} samples of {} stacks'.format(
+        sampler.samples, len(sampler.stacks)
+    ))
+    return sampler.collapsed()
+
+
+def _await_frames(coro: Any) -> List[Any]:
+    """
+    Returns frames of suspended coroutine and coroutines it awaits, from
+    outermost to innermost.
+    """
+    frames = []
+    while coro is not None:
+        frame = getattr(coro, 'cr_frame', None) or getattr(
+            coro, 'gi_frame', None
+        )
+        if frame is None:
+            break
+
+        frames.append(frame)
+        coro = getattr(coro, 'cr_await', None) or getattr(
+            coro, 'gi_yieldfrom', None
+        )
+    return frames
+
+
+async def dump_tasks() -> Dict[str, Any]:
+    """
+    Groups pending asyncio tasks by theirs coroutine and counts where tasks
+    of every group are waiting. Tasks are inspected in chunks, so event
+    loop keeps running with many thousands of tasks.
+
+    :return: Number of tasks and task groups ordered by size.
+    """
+    current = asyncio.current_task()
+    groups: Dict[str, Dict[str, Any]] = {}
+    for index, task in enumerate(list(asyncio.all_tasks()), 1):
+        if index % TASKS_CHUNK_SIZE == 0:
+            await asyncio.sleep(0)
+        if task is current or task.done():
+            continue
+
+        coro = task.get_coro()
+        frames = _await_frames(coro)
+        name = describe_code(frames[0].f_code) if frames else getattr(
+            coro, '__qualname__', type(coro).__name__
+        )
+        group = groups.get(name)
+        if group is None:
+            group = groups[name] = {
+                'coroutine': name,
+                'count': 0,
+                'waiting': Counter(),
+                # await chain of first task of group
+                'stack': [describe_frame(frame) for frame in frames],
+            }
+        group['count'] += 1
+        if frames:
+            group['waiting'][describe_frame(frames[-1])] += 1
+
+    ordered = sorted(
+        groups.values(), key=lambda group: group['count'], reverse=True
+    )
+    for group in ordered:
+        group['waiting'] = dict(group['waiting'].most_common())
+    return {
+        'total': sum(group['count'] for group in ordered),
+        'groups': ordered,
+    }
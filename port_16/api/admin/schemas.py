@@ -0,0 +1,18 @@
+from typing import Dict, List
+
+from pydantic import BaseModel
+
+
+class TaskGroupModel(BaseModel):
+    #: Coroutine of tasks, name with file and line of its definition.
+    coroutine: str
+    count: int
+    #: Number of tasks of group suspended at innermost awaited location.
+    waiting: Dict[str, int] = {}
+    #: Await chain of one task of group, from outermost coroutine.
+    stack: List[str] = []
+
+
+class TasksModel(BaseModel):
+    total: int
+    groups: List[TaskGroupModel]
@@ -1 +1,5 @@
-from .schemas import ChargingPointModel, HeartbeatModel, ChargingPointState
+from .schemas import (
+    ChargingPointModel, HeartbeatModel, ChargingPointState,
+    ChargingPointTemplateModel, BulkChargingPointsModel, BulkJobState,
+    BulkJobModel
+)
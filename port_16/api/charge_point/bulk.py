@@ -0,0 +1,315 @@
+import time
+import uuid
+import asyncio
+import logging
+from functools import partial
+from collections import OrderedDict
+from typing import List, Optional, Dict, Any
+
+import inject
+
+from port_16 import config
+from port_16.api.common import cp_db, start_cp, ChargePointService
+from port_16.api.common import StorageBatch
+from .schemas import ChargingPointModel, BulkJobState
+
+logger = logging.getLogger(__name__)
+
+#: Number of finished jobs kept for progress queries
+MAX_JOBS = 100
+_jobs: 'OrderedDict[str, BulkProvisioningJob]' = OrderedDict()
+
+
+class BulkProvisioningJob:
+    """
+    Creates charge points and connects them to central system. Entities are
+    stored in chunks, each chunk is written by single storage batch.
+    Connections are opened at connect_rate per second, with at most
+    max_concurrency connections being opened at once, opening pauses while
+    event loop is overloaded. In sharded mode
+    charge points owned by other shards are started by theirs workers.
+    """
+
+    def __init__(
+        self,
+        cp_models: List[ChargingPointModel],
+        connect: bool = True,
+        connect_rate: Optional[float] = None,
+        max_concurrency: Optional[int] = None
+    ):
+        #: :type: :class:`port_16.sharding.ShardRouter`
+        self.shard_router = inject.instance('shard_router')
+        #: :type: :class:`port_16.api.common.loop.LoopMonitor`
+        self.loop_monitor = inject.instance('loop_monitor')
+        self.job_id = uuid.uuid4().hex
+        if self.shard_router is not None:
+            # shard prefix routes progress requests to this worker
+            self.job_id = '{}-{}'.format(self.shard_router.slot, self.job_id)
+        self.cp_models = cp_models
+        self.connect = connect
+        self.connect_rate = connect_rate or config.BULK_CONNECT_RATE
+        self.max_concurrency = (
+            max_concurrency or config.BULK_CONNECT_CONCURRENCY
+        )
+        self.state = BulkJobState.PENDING
+        self.stored = 0
+        self.skipped = 0
+        self.connecting = 0
+        self.connected = 0
+        self.forwarded = 0
+        self.failed = 0
+        self.connect_time_total = 0.0
+        self.connect_time_max = 0.0
+        #: Seconds connecting waited for overloaded event loop
+        self.paused = 0.0
+        self.error = None
+        self._phases: Dict[str, List[float]] = {}
+        self._task = None
+        self._cp_tasks = set()
+        self._connect_tasks = set()
+
+    def start(self) -> 'BulkProvisioningJob':
+        """
+        Starts job in background and registers it for progress queries.
+
+        :return: Started job.
+        """
+        _jobs[self.job_id] = self
+        while len(_jobs) > MAX_JOBS:
+            _jobs.popitem(last=False)
+
+        self._task = asyncio.ensure_future(self.run())
+        return self
+
+    async def wait(self) -> None:
+        """
+        Waits until started job ends.
+        """
+        await asyncio.shield(self._task)
+
+    async def run(self) -> None:
+        logger.info(
+            'Bulk job {} started for {} charging points'.format(
+                self.job_id, len(self.cp_models)
+            )
+        )
+        try:
+            self.state = BulkJobState.STORING
+            self._start_phase('store')
+            cp_models = await self._store()
+            self._end_phase('store')
+
+            if self.connect:
+                self.state = BulkJobState.CONNECTING
+                self._start_phase('connect')
+                await self._connect_all(cp_models)
+                self._end_phase('connect')
+
+            self.state = BulkJobState.DONE
+        except Exception as e:
+            logger.exception('Bulk job {} failed'.format(self.job_id))
+            self.state = BulkJobState.FAILED
+            self.error = str(e)
+            return
+
+        logger.info(
+            'Bulk job {} done: {} stored, {} skipped, {} connected, '
+            '{} forwarded, {} failed'.format(
+                self.job_id, self.stored, self.skipped, self.connected,
+                self.forwarded, self.failed
+            )
+        )
+
+    async def _store(self) -> List[ChargingPointModel]:
+        """
+        Stores charge points which are not already created, one storage
+        batch per chunk. Charge points already found in storage, e.g. stored
+        before restart or by other worker, are not stored again, but they
+        are connected with stored data. Charge points connected by this
+        worker are skipped.
+
+        :return: Charge points which will be connected.
+        """
+        stored = []
+        chunk_size = config.STORAGE_BULK_CHUNK_SIZE
+        for index in range(0, len(self.cp_models), chunk_size):
+            chunk = self.cp_models[index:index + chunk_size]
+            # existence of whole chunk is checked within single round trip
+            existing = await ChargePointService(
+                chunk[0].identity
+            ).get_storage_entities([cp_model.identity for cp_model in chunk])
+            async with StorageBatch() as batch:
+                for cp_model in chunk:
+                    if cp_db.get_cp(cp_model.identity) is not None:
+                        self.skipped += 1
+                        continue
+
+                    data = existing.get(cp_model.identity)
+                    if data is not None:
+                        self.skipped += 1
+                        stored.append(ChargePointService.to_model(data))
+                        continue
+
+                    service = ChargePointService(cp_model.identity)
+                    await service.store_entity(cp_model, batch=batch)
+                    stored.append(cp_model)
+
+            self.stored += len(batch)
+
+        return stored
+
+    async def _connect_all(self, cp_models: List[ChargingPointModel]):
+        """
+        Opens connections of provided charge points at configured rate and
+        waits until every connection is opened or failed.
+        """
+        loop = asyncio.get_event_loop()
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        interval = 1 / self.connect_rate
+        next_time = loop.time()
+        for cp_model in cp_models:
+            await semaphore.acquire()
+            paused = await self.loop_monitor.wait_recovered()
+            if paused:
+                self.paused += paused
+                logger.info(
+                    'Bulk job {} paused for {:.2f} seconds by overloaded '
+                    'event loop'.format(self.job_id, paused)
+                )
+            delay = next_time - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            next_time = max(next_time + interval, loop.time())
+
+            self.connecting += 1
+            task = asyncio.ensure_future(self._connect(cp_model, semaphore))
+            self._connect_tasks.add(task)
+            task.add_done_callback(partial(self._connect_done, cp_model))
+
+        for _ in range(self.max_concurrency):
+            await semaphore.acquire()
+
+    async def _connect(
+        self, cp_model: ChargingPointModel, semaphore: asyncio.Semaphore
+    ) -> None:
+        if (
+            self.shard_router is not None and
+            not self.shard_router.owns(cp_model.identity)
+        ):
+            return await self._forward_start(cp_model, semaphore)
+
+        start = time.perf_counter()
+        connected = asyncio.get_event_loop().create_future()
+        task = asyncio.ensure_future(start_cp(cp_model, connected))
+        self._cp_tasks.add(task)
+        task.add_done_callback(self._cp_tasks.discard)
+        try:
+            await asyncio.wait(
+                [connected, task], return_when=asyncio.FIRST_COMPLETED
+            )
+            if connected.done():
+                connect_time = time.perf_counter() - start
+                self.connected += 1
+                self.connect_time_total += connect_time
+                self.connect_time_max = max(
+                    self.connect_time_max, connect_time
+                )
+            else:
+                connected.cancel()
+                self.failed += 1
+                logger.warning(
+                    'Bulk job {} could not connect CP {}: {}'.format(
+                        self.job_id, cp_model.identity,
+                        task.exception() if not task.cancelled() else
+                        'cancelled'
+                    )
+                )
+        finally:
+            self.connecting -= 1
+            semaphore.release()
+
+    def _connect_done(
+        self, cp_model: ChargingPointModel, task: asyncio.Task
+    ) -> None:
+        self._connect_tasks.discard(task)
+        if task.cancelled() or task.exception() is None:
+            return
+
+        self.failed += 1
+        logger.error('Bulk job {} could not start CP {}: {}'.format(
+            self.job_id, cp_model.identity, str(task.exception())
+        ))
+
+    async def _forward_start(
+        self, cp_model: ChargingPointModel, semaphore: asyncio.Semaphore
+    ) -> None:
+        """
+        Starts charge point owned by other shard using its worker.
+        """
+        slot = self.shard_router.owner(cp_model.identity)
+        try:
+            response = await self.shard_router.forward(
+                slot, 'POST',
+                '/charging-points/{}/start'.format(cp_model.identity)
+            )
+            if response.status < 400:
+                self.forwarded += 1
+            else:
+                self.failed += 1
+                logger.warning(
+                    'Bulk job {} could not start CP {} on shard {}: '
+                    '{}'.format(
+                        self.job_id, cp_model.identity, slot,
+                        response.body.decode(errors='replace')
+                    )
+                )
+        finally:
+            self.connecting -= 1
+            semaphore.release()
+
+    def _start_phase(self, name: str) -> None:
+        self._phases[name] = [time.perf_counter(), 0.0]
+
+    def _end_phase(self, name: str) -> None:
+        self._phases[name][1] = time.perf_counter()
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Returns job progress and duration of its phases. Duration of running
+        phase is time elapsed since it is started.
+
+        :return: Job progress data.
+        """
+        now = time.perf_counter()
+        return {
+            'job_id': self.job_id,
+            'state': self.state,
+            'total': len(self.cp_models),
+            'stored': self.stored,
+            'skipped': self.skipped,
+            'connecting': self.connecting,
+            'connected': self.connected,
+            'forwarded': self.forwarded,
+            'failed': self.failed,
+            'phases': {
+                name: (end or now) - start
+                for name, (start, end) in self._phases.items()
+            },
+            'connect_time_avg': (
+                self.connect_time_total / self.connected
+                if self.connected else 0.0
+            ),
+            'connect_time_max': self.connect_time_max,
+            'paused': self.paused,
+            'error': self.error,
+        }
+
+
+def get_job(job_id: str) -> Optional[BulkProvisioningJob]:
+    """
+    Returns bulk job with provided id or None.
+
+    :param job_id: Id of bulk job.
+    :return: Found job.
+    """
+    return _jobs.get(job_id)
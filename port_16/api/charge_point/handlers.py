@@ -2,15 +2,55 @@ from typing import Dict, Any
 
 from fastapi import APIRouter, BackgroundTasks
 
-from .schemas import ChargingPointModel
+from .schemas import (
+    ChargingPointModel, BulkChargingPointsModel, BulkJobModel
+)
 from .operations import (
     create_charging_point, get_charging_point, delete_charging_point,
-    start_charging_point
+    start_charging_point, create_charging_points_bulk, get_bulk_job
 )
 
 router = APIRouter()
 
 
+@router.post(
+    path='/bulk',
+    response_model=BulkJobModel,
+    status_code=202,
+    summary='Bulk charging points creation',
+    description=(
+        'Creates charging points from template and id pattern with range '
+        'and connects them with controlled rate'
+    ),
+    response_description='Started bulk job progress',
+)
+async def create_cp_bulk(
+    bulk_model: BulkChargingPointsModel
+) -> Dict[str, Any]:
+    """
+    Starts bulk creation of charging points and returns job progress.
+
+    :return: Bulk job progress.
+    """
+    return await create_charging_points_bulk(bulk_model)
+
+
+@router.get(
+    path='/bulk/{job_id}',
+    response_model=BulkJobModel,
+    summary='Bulk charging points creation progress',
+    description='Returns progress and phase timings of bulk job',
+    response_description='Bulk job progress',
+)
+async def get_cp_bulk(job_id: str) -> Dict[str, Any]:
+    """
+    Gets bulk job progress.
+
+    :return: Bulk job progress.
+    """
+    return await get_bulk_job(job_id)
+
+
 @router.get(
     path='/{cp_id}',
     response_model=ChargingPointModel,
@@ -1,10 +1,16 @@
 import logging
-from typing import Dict, Any
+from typing import Dict, Any, List
 
+import inject
 from fastapi import BackgroundTasks
+from fastapi.exceptions import HTTPException
 
-from port_16.api.charge_point.schemas import ChargingPointModel
+from port_16 import config
+from port_16.api.charge_point.schemas import (
+    ChargingPointModel, BulkChargingPointsModel
+)
 from port_16.api.common import cp_db, start_cp, ChargePointService
+from .bulk import BulkProvisioningJob, get_job
 
 logger = logging.getLogger(__name__)
 
@@ -40,8 +46,7 @@ async def get_charging_point(
     :return: ChargingPoint data.
     """
     cp = cp_db.validate_and_get(cp_id, command='Get charging point')
-    cp_model = await cp.cp_service.validate_get_entity()
-    return cp_model.dict()
+    return cp.state_machine.model.dict()
 
 
 async def delete_charging_point(
@@ -54,9 +59,19 @@ async def delete_charging_point(
     :return: ChargingPoint data.
     """
     cp = cp_db.validate_and_get(cp_id, command='Delete charging point')
-    cp_model = await cp.cp_service.validate_get_entity()
+    cp_model = cp.state_machine.model
     await cp.close_connection()
     cp_db.remove_cp(cp_id)
+    # not persisted state changes are discarded, entity is deleted
+    #: :type: :class:`port_16.api.common.state.StatePersister`
+    state_persister = inject.instance('state_persister')
+    await state_persister.unregister(cp_id)
+    #: :type: :class:`port_16.api.common.offline.OfflineQueueManager`
+    offline_queues = inject.instance('offline_queues')
+    await offline_queues.remove(cp_id)
+    #: :type: :class:`port_16.api.common.meter.MeterValuesEngine`
+    meter_engine = inject.instance('meter_engine')
+    meter_engine.discard(cp_id)
     await cp.cp_service.delete_storage_entity()
     return cp_model.dict()
 
@@ -78,3 +93,101 @@ async def start_charging_point(
     cp_model = await service.validate_get_entity()
     background_tasks.add_task(start_cp, cp_model)
     return cp_model.dict()
+
+
+def _bulk_identities(bulk_model: BulkChargingPointsModel) -> List[str]:
+    """
+    Returns identities of charge points created by bulk request, either
+    provided explicitly or formatted from id pattern and range. Duplicated
+    identities are removed.
+
+    :param bulk_model: Bulk creation request.
+    :return: Identities of created charge points.
+    """
+    if bulk_model.identities is not None:
+        identities = bulk_model.identities
+    else:
+        try:
+            identities = [
+                bulk_model.id_pattern.format(number)
+                for number in range(
+                    bulk_model.start, bulk_model.start + bulk_model.count
+                )
+            ]
+        except (IndexError, KeyError, ValueError) as e:
+            raise HTTPException(
+                status_code=400,
+                detail=f'Invalid id pattern {bulk_model.id_pattern}: {e}'
+            )
+
+    identities = list(dict.fromkeys(identities))
+    if not identities or len(identities) > config.BULK_MAX_COUNT:
+        raise HTTPException(
+            status_code=400,
+            detail=(
+                f'Number of charging points must be between 1 and '
+                f'{config.BULK_MAX_COUNT}'
+            )
+        )
+    if bulk_model.identities is None and len(identities) < bulk_model.count:
+        raise HTTPException(
+            status_code=400,
+            detail=(
+                f'Id pattern {bulk_model.id_pattern} does not create '
+                f'unique identities'
+            )
+        )
+
+    return identities
+
+
+async def create_charging_points_bulk(
+    bulk_model: BulkChargingPointsModel
+) -> Dict[str, Any]:
+    """
+    Starts bulk job which creates charging points from template and
+    identities made of id pattern and range (or explicitly provided) and
+    optionally connects them with controlled rate. Returns job progress
+    data.
+
+    :param bulk_model: Bulk creation request.
+    :return: Started bulk job data.
+    """
+    template = bulk_model.template.dict()
+    cp_models = [
+        ChargingPointModel(identity=identity, **template)
+        for identity in _bulk_identities(bulk_model)
+    ]
+    job = BulkProvisioningJob(
+        cp_models,
+        connect=bulk_model.connect,
+        connect_rate=bulk_model.connect_rate,
+        max_concurrency=bulk_model.max_concurrency
+    ).start()
+    logger.info(
+        'Bulk job {} created for {} charging points'.format(
+            job.job_id, len(cp_models)
+        )
+    )
+    return job.to_dict()
+
+
+async def get_bulk_job(job_id: str) -> Dict[str, Any]:
+    """
+    Returns progress of bulk job with provided id. If job is not found
+    proper exception will be raised.
+
+    :param job_id: Id of bulk job.
+    :return: Bulk job data.
+    """
+    job = get_job(job_id)
+    if job is None:
+        logger.warning('Bulk job not found with provided id: {}'.format(
+            job_id
+        ))
+        raise HTTPException(
+            status_code=404,
+            detail=f'Bulk job with id {job_id} not found in system'
+        )
+
+    return job.to_dict()
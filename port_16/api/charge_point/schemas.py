@@ -1,3 +1,5 @@
+from typing import Dict, List, Optional
+
 from pydantic import BaseModel
 from pydantic.main import Enum
 
@@ -35,3 +37,58 @@ class ChargingPointModel(BaseModel):
     @property
     def ws_uri(self) -> str:
         return f'{self.ws_host}/{self.ws_path}/{self.identity}'
+
+
+class ChargingPointTemplateModel(BaseModel):
+    protocol: str = 'ocpp1.6'
+    ws_host: str = WS_HOST
+    ws_path: str = WS_MAIN_PATH
+    heartbeat: HeartbeatModel = HeartbeatModel()
+    connector_number: int = 3
+
+
+class BulkChargingPointsModel(BaseModel):
+    template: ChargingPointTemplateModel = ChargingPointTemplateModel()
+    #: Pattern of created identities, formatted with numbers from range
+    #: start - start + count.
+    id_pattern: str = 'CP-{:06d}'
+    start: int = 1
+    count: int = 1
+    #: Explicit identities, used instead of id_pattern and range if provided.
+    identities: Optional[List[str]] = None
+    connect: bool = True
+    #: Connections opened per second, BULK_CONNECT_RATE if not provided.
+    connect_rate: Optional[float] = None
+    #: Max connections being opened at once, BULK_CONNECT_CONCURRENCY if not
+    #: provided.
+    max_concurrency: Optional[int] = None
+
+
+class BulkJobState(str, Enum):
+    PENDING = 'PENDING'
+    STORING = 'STORING'
+    CONNECTING = 'CONNECTING'
+    DONE = 'DONE'
+    FAILED = 'FAILED'
+
+
+class BulkJobModel(BaseModel):
+    job_id: str
+    state: BulkJobState
+    total: int
+    stored: int
+    #: Charge points not stored, because they are already stored or
+    #: connected. Stored ones which are not connected are connected.
+    skipped: int
+    connecting: int
+    connected: int
+    #: Charge points started by workers of other shards
+    forwarded: int = 0
+    failed: int
+    #: Duration of store and connect phases in seconds.
+    phases: Dict[str, float]
+    connect_time_avg: float
+    connect_time_max: float
+    #: Seconds connecting paused while event loop was overloaded.
+    paused: float = 0.0
+    error: Optional[str] = None
@@ -4,7 +4,7 @@ from typing import Dict, Any
 from fastapi import BackgroundTasks
 
 from port_16.api.charge_point import ChargingPointState
-from port_16.api.common import cp_db, heartbeat, ConnectorService
+from port_16.api.common import cp_db, heartbeat
 
 logger = logging.getLogger(__name__)
 
@@ -16,11 +16,11 @@ async def execute_boot_notification(cp_id: str) -> Dict[str, Any]:
     :param cp_id: Id of CP for which command will be executed.
     """
     cp = cp_db.validate_and_get(cp_id, command='Boot notification')
-    cp_model = await cp.cp_service.validate_get_entity()
-    cp_model = await cp.send_boot_notification(cp_model.heartbeat)
-    conn_service = ConnectorService(cp_id)
+    cp_model = await cp.send_boot_notification(
+        cp.state_machine.model.heartbeat
+    )
     if ChargingPointState(cp_model.state) == ChargingPointState.ACCEPTED:
-        connector_data = await conn_service.start_charging_point(
+        connector_data = cp.state_machine.init_connectors(
             cp_model.connector_number
         )
         for key, value in connector_data.items():
@@ -41,6 +41,5 @@ async def execute_heartbeat(
     :param background_tasks: FastAPI tool for starting background tasks.
     """
     cp = cp_db.validate_and_get(cp_id, command='Heartbeat')
-    cp_model = await cp.cp_service.validate_get_entity()
     background_tasks.add_task(heartbeat, cp)
-    return cp_model.dict()
+    return cp.state_machine.model.dict()
@@ -1,12 +1,11 @@
 import logging
 from typing import Dict, Any
 
-from ocpp.v16.enums import ChargePointStatus
+import inject
+from ocpp.v16.enums import Action, ChargePointStatus
 
 from port_16.api.commands.schemas import StartTransaction, StopTransaction
-from port_16.api.common import (
-    cp_db, ConnectorService, AuthTagService, TransactionService
-)
+from port_16.api.common import cp_db, AuthTagService, StorageBatch
 
 logger = logging.getLogger(__name__)
 
@@ -26,36 +25,95 @@ async def execute_start_transaction(
     cp = cp_db.validate_and_get(cp_id, command='Start transaction')
     # checks tag id in transaction request
     auth_tag_service = AuthTagService(transaction.id_tag)
-    await auth_tag_service.validate_tag_id(command='Start transaction')
-
-    # validate if connector is free for charging
-    conn_service = ConnectorService(cp_id)
-    await conn_service.validate_connector_used(transaction.connector_id)
-
-    # send start transaction command to server
-    transaction_response = await cp.send_start_transaction(transaction)
-
-    # update tag info storage with response
-    id_tag_info = await auth_tag_service.add_tag_info(
-        transaction_response.id_tag_info, command='Start transaction'
+    tag_info = await auth_tag_service.validate_tag_id(
+        command='Start transaction'
     )
 
+    # claims connector in charger state if it is free for charging, state
+    # changes are persisted in background. Charger state is owned by the
+    # only process the charger is connected to (its shard in sharded mode,
+    # where other workers forward commands), so claim is not raced by other
+    # processes
+    state_machine = cp.state_machine
+    state_machine.claim_connector(transaction.connector_id)
+    #: :type: :class:`port_16.api.common.offline.OfflineQueueManager`
+    offline_queues = inject.instance('offline_queues')
+    if offline_queues.should_queue(cp):
+        # offline charger starts charging with locally known tag, transaction
+        # gets provisional id which is replaced by id returned from central
+        # system when message is replayed
+        transaction_id = None
+        try:
+            transaction_id = await offline_queues.provisional_transaction_id(
+                cp
+            )
+            state_machine.start_transaction(
+                transaction_id, transaction.connector_id
+            )
+            await offline_queues.enqueue(cp_id, Action.StartTransaction, {
+                'connector_id': transaction.connector_id,
+                'id_tag': transaction.id_tag,
+                'meter_start': transaction.meter_start,
+                'timestamp': transaction.start_time,
+            }, transaction_id=transaction_id)
+        except Exception:
+            if state_machine.transactions.get(transaction_id) is not None:
+                state_machine.stop_transaction(transaction_id)
+            state_machine.release_connector(transaction.connector_id)
+            raise
+
+        await cp.send_connector_status(
+            transaction.connector_id, ChargePointStatus.charging
+        )
+        return {
+            'id_tag_info': tag_info,
+            'transaction_id': transaction_id,
+            'queued': True,
+        }
+
+    # storage writes of operation are collected in batch, nothing is
+    # written if start transaction fails
+    batch = StorageBatch()
+    try:
+        # send start transaction command to server
+        transaction_response = await cp.send_start_transaction(transaction)
+
+        # update tag info storage with response
+        id_tag_info = await auth_tag_service.add_tag_info(
+            transaction_response.id_tag_info, command='Start transaction',
+            batch=batch
+        )
+
+        # adds transaction/connector relation
+        transaction_id = transaction_response.transaction_id
+        state_machine.start_transaction(
+            transaction_id, transaction.connector_id
+        )
+        #: :type: :class:`port_16.api.common.meter.MeterValuesEngine`
+        meter_engine = inject.instance('meter_engine')
+        meter_engine.start_transaction(
+            cp_id, transaction.connector_id, transaction_id,
+            transaction.meter_start
+        )
+    except Exception:
+        # connector is given back if transaction is not started
+        state_machine.release_connector(transaction.connector_id)
+        raise
+
+    # tag info and charger state changes are written within single round trip
+    #: :type: :class:`port_16.api.common.state.StatePersister`
+    state_persister = inject.instance('state_persister')
+    await state_persister.commit(state_machine, batch)
+
     # sets new state for connector on charger
-    await conn_service.update_connector_status(transaction.connector_id)
     await cp.send_connector_status(
         transaction.connector_id, ChargePointStatus.charging
     )
 
-    # updates transaction/connector relation
-    trans_service = TransactionService(cp_id)
-    transaction_id = transaction_response.transaction_id
-    connector_id = transaction.connector_id
-    await trans_service.add_transaction(transaction_id, connector_id)
-
     logger.info('Started transaction {} within cp {} on connector: {}'.format(
         transaction_id, cp_id, transaction.connector_id
     ))
-    return {'id_tag_info': id_tag_info}
+    return {'id_tag_info': id_tag_info, 'transaction_id': transaction_id}
 
 
 async def execute_stop_transaction(
@@ -73,28 +131,77 @@ async def execute_stop_transaction(
     cp = cp_db.validate_and_get(cp_id, command='Stop transaction')
     # checks tag id in transaction request
     auth_tag_service = AuthTagService(transaction.id_tag)
-    await auth_tag_service.validate_tag_id(command='Stop transaction')
-
-    #  check if provided transaction exists in system
-    transaction_id = transaction.transaction_id
-    trans_service = TransactionService(cp_id)
-    await trans_service.validate_transaction_exists(transaction_id)
-
-    id_tag_info = await cp.send_stop_transaction(transaction)
+    tag_info = await auth_tag_service.validate_tag_id(
+        command='Stop transaction'
+    )
 
-    # update tag info storage with response
-    id_tag_info = await auth_tag_service.add_tag_info(
-        id_tag_info, command='Stop transaction'
+    # provisional id of transaction started offline is replaced by id
+    # returned from central system, if start is already replayed
+    #: :type: :class:`port_16.api.common.offline.OfflineQueueManager`
+    offline_queues = inject.instance('offline_queues')
+    transaction_id = offline_queues.resolve_transaction_id(
+        cp_id, transaction.transaction_id
     )
+    transaction = transaction.copy(update={'transaction_id': transaction_id})
 
-    # update connector and transaction/connector relation
-    conn_service = ConnectorService(cp_id)
-    connector_id = await trans_service.remove_transaction(transaction_id)
+    #  check if provided transaction exists in system
+    state_machine = cp.state_machine
+    state_machine.get_transaction_connector(transaction_id)
+
+    # meter reading and sampled data are simulated, unless provided
+    #: :type: :class:`port_16.api.common.meter.MeterValuesEngine`
+    meter_engine = inject.instance('meter_engine')
+    transaction_end = meter_engine.transaction_end(cp_id, transaction_id)
+    if transaction_end is not None:
+        meter_stop, transaction_data = transaction_end
+        update = {}
+        if 'meter_stop' not in transaction.__fields_set__:
+            update['meter_stop'] = meter_stop
+        if transaction.transaction_data is None:
+            update['transaction_data'] = transaction_data
+        transaction = transaction.copy(update=update)
+
+    queued = offline_queues.should_queue(cp)
+    batch = StorageBatch()
+    if queued:
+        await offline_queues.enqueue(cp_id, Action.StopTransaction, {
+            'transaction_id': transaction_id,
+            'meter_stop': transaction.meter_stop,
+            'timestamp': transaction.stop_time,
+            'id_tag': transaction.id_tag,
+            'reason': transaction.reason,
+            'transaction_data': transaction.transaction_data,
+        })
+        id_tag_info = tag_info
+    elif transaction_id < 0:
+        # start of transaction is dropped from full offline queue, central
+        # system does not know it, so it is stopped only locally
+        logger.warning(
+            'Transaction {} within cp {} is not known by central system, '
+            'stopped locally'.format(transaction_id, cp_id)
+        )
+        id_tag_info = tag_info
+    else:
+        id_tag_info = await cp.send_stop_transaction(transaction)
+
+        # update tag info storage with response
+        id_tag_info = await auth_tag_service.add_tag_info(
+            id_tag_info, command='Stop transaction', batch=batch
+        )
+
+    # update connector and transaction/connector relation, only if stopping
+    # is accepted
+    connector_id = state_machine.stop_transaction(transaction_id)
+    state_machine.release_connector(connector_id)
+    meter_engine.stop_transaction(cp_id, transaction_id)
+    offline_queues.forget_transaction_id(cp_id, transaction_id)
+
+    # tag info and charger state changes are written within single round trip
+    #: :type: :class:`port_16.api.common.state.StatePersister`
+    state_persister = inject.instance('state_persister')
+    await state_persister.commit(state_machine, batch)
 
     # sets new state for connector on charger
-    await conn_service.update_connector_status(
-        connector_id, ChargePointStatus.available
-    )
     await cp.send_connector_status(
         connector_id, ChargePointStatus.available
     )
@@ -102,4 +209,4 @@ async def execute_stop_transaction(
     logger.info('Stopped transaction {} within cp {} on connector: {}'.format(
         transaction_id, cp_id, connector_id
     ))
-    return {'id_tag_info': id_tag_info}
+    return {'id_tag_info': id_tag_info, 'queued': queued}
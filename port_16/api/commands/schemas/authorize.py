@@ -1,10 +1,15 @@
-from typing import Dict
+from typing import Dict, Optional
 
 from pydantic import BaseModel
 
 
 class AuthorizeResponse(BaseModel):
     id_tag_info: Dict
+    #: Command is queued because charging point is offline
+    queued: bool = False
+    #: Id of started transaction, negative provisional id for queued start
+    #: transaction, which could be used for stopping it
+    transaction_id: Optional[int] = None
 
 
 class AuthorizeRequest(BaseModel):
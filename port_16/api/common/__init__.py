@@ -1,4 +1,11 @@
 from .ocpp import ChargePoint, heartbeat, start_cp
 from .service import (
-    ChargePointService, ConnectorService, AuthTagService, TransactionService
+    ChargePointService, ConnectorService, AuthTagService, TransactionService,
+    StorageBatch
 )
+from .scheduler import HeartbeatScheduler
+from .state import ChargePointStateMachine, StatePersister
+from .reconnect import ReconnectSupervisor
+from .offline import OfflineQueueManager
+from .meter import MeterValuesEngine
+from .loop import LoopMonitor, LoadSheddingMiddleware
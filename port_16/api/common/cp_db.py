@@ -1,5 +1,5 @@
 import logging
-from typing import Any, Optional
+from typing import Any, List, Optional
 
 from fastapi.exceptions import HTTPException
 
@@ -18,6 +18,25 @@ def get_cp(cp_id: str):
     return _all_cps.get(cp_id)
 
 
+def count() -> int:
+    """
+    Returns number of Charging points stored in system.
+
+    :return: Number of stored ChargingPoints.
+    """
+    return len(_all_cps)
+
+
+def all_cps() -> List[Any]:
+    """
+    Returns all Charging points stored in system.
+
+    :return: List of stored ChargingPoints.
+    :rtype: list[port_16.api.common.ocpp.ChargePoint]
+    """
+    return list(_all_cps.values())
+
+
 def set_cp(cp: Any) -> Any:
     """
     Stores provided ChargingPoint in system.
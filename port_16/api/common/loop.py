@@ -0,0 +1,275 @@
+import sys
+import asyncio
+import logging
+import threading
+import traceback
+from array import array
+from time import monotonic
+from typing import Any, Dict, Optional
+
+import inject
+from fastapi import HTTPException, status
+
+from port_16 import config
+from port_16.errors import http_error_handler
+from port_16.metrics import Counter, Gauge, Histogram
+
+logger = logging.getLogger(__name__)
+
+#: Weight of new sample in smoothed lag
+SMOOTHING = 0.2
+#: Path prefixes of POST requests which add load, they are rejected while
+#: event loop is overloaded
+SHED_PATHS = ('/charging-points', '/commands', '/scenarios')
+
+LAG = Histogram(
+    'port16_loop_lag_seconds',
+    'Time event loop woke up lag sampling task later than scheduled'
+)
+SMOOTHED_LAG = Gauge(
+    'port16_loop_lag_smoothed_seconds',
+    'Exponentially smoothed event loop lag used for load shedding'
+)
+OVERLOADED = Gauge(
+    'port16_loop_overloaded',
+    'Is 1 while event loop is overloaded and load is shed'
+)
+SLOW_CALLBACKS = Counter(
+    'port16_loop_slow_callbacks_total',
+    'Number of times event loop was late by more than slow callback '
+    'duration'
+)
+SHED_REQUESTS = Counter(
+    'port16_shed_requests_total',
+    'Number of requests rejected while event loop was overloaded',
+    ('path',)
+)
+RAMP_PAUSE = Histogram(
+    'port16_ramp_pause_seconds',
+    'Time connection ramp-up waited for overloaded event loop to recover'
+)
+
+
+class LoopMonitor:
+    """
+    Measures event loop lag as delay of wake ups of task sleeping for
+    interval. Watchdog thread logs stack of event loop thread when wake up
+    is late by more than slow callback duration, so callbacks which block
+    the loop are found while they run. When smoothed lag rises above shed
+    threshold the loop is overloaded until it falls below recover threshold,
+    meanwhile requests adding load are rejected and connection ramp-up
+    waits.
+    """
+
+    def __init__(
+        self,
+        interval: Optional[float] = None,
+        window: Optional[int] = None,
+        slow_callback_duration: Optional[float] = None,
+        shed_threshold: Optional[float] = None,
+        recover_threshold: Optional[float] = None
+    ):
+        self.interval = (
+            config.LOOP_LAG_INTERVAL if interval is None else interval
+        )
+        self.window = window or config.LOOP_LAG_WINDOW
+        self.slow_callback_duration = (
+            config.LOOP_SLOW_CALLBACK_DURATION
+            if slow_callback_duration is None else slow_callback_duration
+        )
+        self.shed_threshold = (
+            config.LOOP_SHED_THRESHOLD
+            if shed_threshold is None else shed_threshold
+        )
+        self.recover_threshold = (
+            recover_threshold or config.LOOP_RECOVER_THRESHOLD or
+            self.shed_threshold / 2
+        )
+        #: Smoothed lag in seconds
+        self.lag = 0.0
+        self.samples = array('d', [0.0]) * self.window
+        self.sampled = 0
+        self.overloaded = False
+        self.shed = 0
+        self.slow_callbacks = 0
+        self.ramp_pauses = 0
+        #: Monotonic time at which sampling task is due, read by watchdog
+        self._due = monotonic()
+        self._loop_thread = None
+        self._recovered = None
+        self._stopped = None
+        self._task = None
+        SMOOTHED_LAG.set_function(lambda: self.lag)
+        OVERLOADED.set_function(lambda: float(self.overloaded))
+
+    def start(self) -> None:
+        if self._task is not None or self.interval <= 0:
+            return
+
+        self._loop_thread = threading.get_ident()
+        self._recovered = asyncio.Event()
+        self._recovered.set()
+        self._stopped = threading.Event()
+        self._due = monotonic() + self.interval
+        self._task = asyncio.ensure_future(self._run())
+        if self.slow_callback_duration > 0:
+            threading.Thread(
+                target=self._watch, name='loop-watchdog', daemon=True
+            ).start()
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+
+        self._stopped.set()
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        self._set_overloaded(False)
+
+    async def _run(self) -> None:
+        loop = asyncio.get_event_loop()
+        while True:
+            expected = loop.time() + self.interval
+            self._due = monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            self._observe(max(loop.time() - expected, 0.0))
+
+    def _observe(self, lag: float) -> None:
+        self.samples[self.sampled % self.window] = lag
+        self.sampled += 1
+        LAG.observe(lag)
+        self.lag += SMOOTHING * (lag - self.lag)
+        if self.shed_threshold <= 0:
+            return
+
+        if not self.overloaded and self.lag >= self.shed_threshold:
+            logger.warning(
+                'Event loop lag {:.3f} seconds is above {} seconds, '
+                'shedding load'.format(self.lag, self.shed_threshold)
+            )
+            self._set_overloaded(True)
+        elif self.overloaded and self.lag < self.recover_threshold:
+            logger.warning(
+                'Event loop lag {:.3f} seconds is below {} seconds, '
+                'load is not shed anymore'.format(
+                    self.lag, self.recover_threshold
+                )
+            )
+            self._set_overloaded(False)
+
+    def _set_overloaded(self, overloaded: bool) -> None:
+        self.overloaded = overloaded
+        if overloaded:
+            self._recovered.clear()
+        else:
+            self._recovered.set()
+
+    def _watch(self) -> None:
+        """
+        Runs in watchdog thread. Logs stack of event loop thread once per
+        late wake up of sampling task.
+        """
+        check_interval = max(self.slow_callback_duration / 2, 0.01)
+        reported = None
+        while not self._stopped.wait(check_interval):
+            due = self._due
+            late = monotonic() - due
+            if late < self.slow_callback_duration or due == reported:
+                continue
+
+            reported = due
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+
+            self.slow_callbacks += 1
+            SLOW_CALLBACKS.inc()
+            logger.warning(
+                'Event loop is {:.3f} seconds late, running:\n{}'.format(
+                    late, ''.join(traceback.format_stack(frame))
+                )
+            )
+
+    async def wait_recovered(self) -> float:
+        """
+        Waits until overloaded event loop recovers, returns immediately
+        when loop is not overloaded.
+
+        :return: Seconds waited.
+        """
+        if not self.overloaded:
+            return 0.0
+
+        start = monotonic()
+        await self._recovered.wait()
+        waited = monotonic() - start
+        self.ramp_pauses += 1
+        RAMP_PAUSE.observe(waited)
+        return waited
+
+    def percentile(self, percent: float) -> float:
+        count = min(self.sampled, self.window)
+        if not count:
+            return 0.0
+
+        ordered = sorted(self.samples[:count])
+        return ordered[min(count - 1, int(count * percent / 100))]
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns lag percentiles of last window samples and load shedding
+        counters.
+
+        :return: Dict with event loop statistics.
+        """
+        count = min(self.sampled, self.window)
+        return {
+            'enabled': self._task is not None,
+            'interval': self.interval,
+            'samples': count,
+            'lag': self.lag,
+            'lag_p50': self.percentile(50),
+            'lag_p90': self.percentile(90),
+            'lag_p99': self.percentile(99),
+            'lag_max': max(self.samples[:count], default=0.0),
+            'overloaded': self.overloaded,
+            'shed_threshold': self.shed_threshold,
+            'recover_threshold': self.recover_threshold,
+            'shed': self.shed,
+            'slow_callbacks': self.slow_callbacks,
+            'ramp_pauses': self.ramp_pauses,
+        }
+
+
+class LoadSheddingMiddleware:
+    """
+    ASGI middleware which rejects POST requests of charging points, commands
+    and scenarios with Service Unavailable while event loop is overloaded.
+    Status, metrics and progress requests are always passed to app.
+    """
+
+    def __init__(self, app: Any):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http' and scope['method'] == 'POST':
+            #: :type: :class:`port_16.api.common.loop.LoopMonitor`
+            loop_monitor = inject.instance('loop_monitor')
+            if loop_monitor is not None and loop_monitor.overloaded:
+                path = next((
+                    prefix for prefix in SHED_PATHS
+                    if scope['path'].startswith(prefix)
+                ), None)
+                if path is not None:
+                    loop_monitor.shed += 1
+                    SHED_REQUESTS.labels(path).inc()
+                    response = await http_error_handler(None, HTTPException(
+                        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                        detail='Event loop is overloaded, lag {:.3f} '
+                               'seconds'.format(loop_monitor.lag)
+                    ))
+                    response.headers['Retry-After'] = '1'
+                    return await response(scope, receive, send)
+
+        await self.app(scope, receive, send)
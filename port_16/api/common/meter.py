@@ -0,0 +1,441 @@
+import random
+import asyncio
+import logging
+from time import perf_counter
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+from fastapi.exceptions import HTTPException
+from ocpp.v16 import call
+from websockets.exceptions import WebSocketException
+
+from port_16 import config
+from port_16.metrics import Counter, Gauge, Histogram
+from . import cp_db
+
+logger = logging.getLogger(__name__)
+
+#: Supported measurands and theirs units
+MEASURANDS = {
+    'Energy.Active.Import.Register': 'Wh',
+    'Power.Active.Import': 'W',
+    'Current.Import': 'A',
+    'Voltage': 'V',
+    'SoC': 'Percent',
+}
+#: Phase voltage used for current readings of three phase charging
+VOLTAGE = 230.0
+#: State of charge above which charging power is reduced
+TAPER_SOC = 0.8
+
+ACTIVE = Gauge(
+    'port16_meter_active_transactions',
+    'Number of transactions metered by meter values engine'
+)
+TICK_DURATION = Histogram(
+    'port16_meter_tick_seconds',
+    'Duration of computing readings of all active transactions'
+)
+SENT = Counter(
+    'port16_meter_values_total',
+    'Number of MeterValues calls by result',
+    ('result',)
+)
+
+
+def parse_measurands(value: str) -> List[str]:
+    """
+    Parses comma separated list of measurands (CSL configuration value).
+
+    :param value: Comma separated measurands.
+    :return: List of measurands.
+    """
+    measurands = [item.strip() for item in value.split(',') if item.strip()]
+    unknown = [item for item in measurands if item not in MEASURANDS]
+    if unknown:
+        raise ValueError(
+            'Unsupported measurands {}, supported are {}'.format(
+                ', '.join(unknown), ', '.join(MEASURANDS)
+            )
+        )
+
+    return measurands
+
+
+class MeterValuesEngine:
+    """
+    Simulates meters of all active transactions. Readings are kept in
+    arrays with one slot per transaction and every tick computes energy,
+    power, current and state of charge of all transactions in single
+    vectorised step. Power is constant until state of charge reaches 80%
+    and then decreases linearly, like when charging a battery. Due readings
+    are sent as MeterValues every sample_interval seconds from transaction
+    start and, if clock aligned interval is set, at every clock aligned
+    interval boundary. Last sampled readings are returned as transaction
+    data of StopTransaction.
+    """
+
+    def __init__(
+        self,
+        sample_interval: Optional[int] = None,
+        sampled_data: Optional[str] = None,
+        aligned_interval: Optional[int] = None,
+        aligned_data: Optional[str] = None,
+        stop_txn_max_length: Optional[int] = None,
+        max_power: Optional[float] = None,
+        tick: Optional[float] = None,
+        capacity: int = 1024
+    ):
+        self.sample_interval = (
+            config.METER_VALUE_SAMPLE_INTERVAL if sample_interval is None
+            else sample_interval
+        )
+        self.sampled_data = parse_measurands(
+            sampled_data or config.METER_VALUES_SAMPLED_DATA
+        )
+        self.aligned_interval = (
+            config.CLOCK_ALIGNED_DATA_INTERVAL if aligned_interval is None
+            else aligned_interval
+        )
+        self.aligned_data = parse_measurands(
+            aligned_data or config.METER_VALUES_ALIGNED_DATA
+        )
+        self.stop_txn_max_length = (
+            stop_txn_max_length or config.STOP_TXN_SAMPLED_DATA_MAX_LENGTH
+        )
+        self.max_power = max_power or config.METER_MAX_POWER
+        self.tick = tick or config.METER_VALUES_TICK
+
+        self.energy = np.zeros(capacity)
+        self.power = np.zeros(capacity)
+        self.soc = np.zeros(capacity)
+        self.battery = np.ones(capacity)
+        self.power_limit = np.zeros(capacity)
+        self.next_sample = np.full(capacity, np.inf)
+        self.active = np.zeros(capacity, dtype=bool)
+        #: (cp_id, connector_id, transaction_id) of every used slot
+        self.owners: List[Optional[Tuple[str, int, int]]] = [None] * capacity
+        self.samples: List[Optional[Deque[Dict[str, Any]]]] = (
+            [None] * capacity
+        )
+        self._slots: Dict[Tuple[str, int], int] = {}
+        self._cp_slots: Dict[str, Set[int]] = {}
+        self._free = list(range(capacity - 1, -1, -1))
+        self._last_tick: Optional[float] = None
+        self._last_aligned: Optional[int] = None
+        self._task = None
+        self._calls = set()
+        ACTIVE.set_function(lambda: len(self._slots))
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def _grow(self) -> None:
+        size = len(self.active)
+        self.energy = np.concatenate([self.energy, np.zeros(size)])
+        self.power = np.concatenate([self.power, np.zeros(size)])
+        self.soc = np.concatenate([self.soc, np.zeros(size)])
+        self.battery = np.concatenate([self.battery, np.ones(size)])
+        self.power_limit = np.concatenate([self.power_limit, np.zeros(size)])
+        self.next_sample = np.concatenate(
+            [self.next_sample, np.full(size, np.inf)]
+        )
+        self.active = np.concatenate(
+            [self.active, np.zeros(size, dtype=bool)]
+        )
+        self.owners.extend([None] * size)
+        self.samples.extend([None] * size)
+        self._free.extend(range(2 * size - 1, size - 1, -1))
+
+    def start_transaction(
+        self,
+        cp_id: str,
+        connector_id: int,
+        transaction_id: int,
+        meter_start: int
+    ) -> None:
+        """
+        Starts metering of transaction. Battery size and initial state of
+        charge of every transaction are random.
+
+        :param cp_id: Id of charge point.
+        :param connector_id: Id of connector.
+        :param transaction_id: Id of transaction.
+        :param meter_start: Meter reading at transaction start in Wh.
+        """
+        if (cp_id, transaction_id) in self._slots:
+            return
+
+        if not self._free:
+            self._grow()
+
+        slot = self._free.pop()
+        self._slots[(cp_id, transaction_id)] = slot
+        self._cp_slots.setdefault(cp_id, set()).add(slot)
+        self.owners[slot] = (cp_id, connector_id, transaction_id)
+        self.samples[slot] = deque(maxlen=self.stop_txn_max_length)
+        self.energy[slot] = meter_start
+        self.power[slot] = 0.0
+        self.soc[slot] = random.uniform(0.1, 0.6)
+        self.battery[slot] = random.uniform(40000, 100000)
+        self.power_limit[slot] = self.max_power * random.uniform(0.9, 1.0)
+        self.next_sample[slot] = (
+            asyncio.get_event_loop().time() + self.sample_interval
+            if self.sample_interval > 0 else np.inf
+        )
+        self.active[slot] = True
+
+    def transaction_end(
+        self, cp_id: str, transaction_id: int
+    ) -> Optional[Tuple[int, List[Dict[str, Any]]]]:
+        """
+        Returns current meter reading of transaction and its sampled
+        transaction data, which ends with Transaction.End reading. None is
+        returned if transaction is not metered.
+
+        :param cp_id: Id of charge point.
+        :param transaction_id: Id of transaction.
+        :return: Meter stop in Wh and transaction data.
+        """
+        slot = self._slots.get((cp_id, transaction_id))
+        if slot is None:
+            return None
+
+        self._advance(asyncio.get_event_loop().time())
+        end_value, = self._meter_values(
+            np.array([slot]), self.sampled_data, 'Transaction.End', _now()
+        )
+        transaction_data = list(self.samples[slot]) + [end_value]
+        # oldest sample is dropped for end reading, so transaction data
+        # stays within StopTxnSampledDataMaxLength
+        excess = len(transaction_data) - self.stop_txn_max_length
+        if excess > 0:
+            del transaction_data[:excess]
+        return int(self.energy[slot]), transaction_data
+
+    def stop_transaction(self, cp_id: str, transaction_id: int) -> None:
+        """
+        Stops metering of transaction.
+
+        :param cp_id: Id of charge point.
+        :param transaction_id: Id of transaction.
+        """
+        slot = self._slots.get((cp_id, transaction_id))
+        if slot is not None:
+            self._release(slot)
+
+    def discard(self, cp_id: str) -> None:
+        """
+        Stops metering of all transactions of deleted charge point.
+
+        :param cp_id: Id of charge point.
+        """
+        for slot in list(self._cp_slots.get(cp_id, ())):
+            self._release(slot)
+
+    def _release(self, slot: int) -> None:
+        cp_id, _, transaction_id = self.owners[slot]
+        del self._slots[(cp_id, transaction_id)]
+        cp_slots = self._cp_slots[cp_id]
+        cp_slots.discard(slot)
+        if not cp_slots:
+            del self._cp_slots[cp_id]
+        self.owners[slot] = None
+        self.samples[slot] = None
+        self.active[slot] = False
+        self.next_sample[slot] = np.inf
+        self._free.append(slot)
+
+    def _advance(self, now: float) -> None:
+        """
+        Computes readings of all active transactions at provided time.
+        """
+        if self._last_tick is None or now <= self._last_tick:
+            self._last_tick = max(now, self._last_tick or now)
+            return
+
+        hours = (now - self._last_tick) / 3600
+        self._last_tick = now
+        active = self.active
+        # full power until taper, then linearly down to 5% at full battery
+        taper = np.clip((1.0 - self.soc) / (1.0 - TAPER_SOC), 0.05, 1.0)
+        self.power = np.where(
+            active & (self.soc < 1.0), self.power_limit * taper, 0.0
+        )
+        charged = self.power * hours
+        self.energy += charged
+        self.soc = np.minimum(1.0, self.soc + charged / self.battery)
+
+    def _readings(self, slots: np.ndarray, measurand: str) -> List[str]:
+        """
+        Returns formatted readings of measurand for provided slots.
+        """
+        if measurand == 'Energy.Active.Import.Register':
+            values, value_format = self.energy[slots], '%.1f'
+        elif measurand == 'Power.Active.Import':
+            values, value_format = self.power[slots], '%.1f'
+        elif measurand == 'Current.Import':
+            values, value_format = self.power[slots] / (3 * VOLTAGE), '%.2f'
+        elif measurand == 'Voltage':
+            values, value_format = np.full(len(slots), VOLTAGE), '%.1f'
+        else:
+            values, value_format = self.soc[slots] * 100, '%.1f'
+
+        return [value_format % value for value in values.tolist()]
+
+    def _meter_values(
+        self,
+        slots: np.ndarray,
+        measurands: List[str],
+        context: str,
+        timestamp: str
+    ) -> List[Dict[str, Any]]:
+        """
+        Returns MeterValue entries of provided slots. Readings of every
+        measurand are computed and formatted for all slots at once.
+        """
+        columns = [
+            (measurand, MEASURANDS[measurand],
+             self._readings(slots, measurand))
+            for measurand in measurands
+        ]
+        return [
+            {
+                'timestamp': timestamp,
+                'sampled_value': [
+                    {
+                        'value': values[index],
+                        'context': context,
+                        'measurand': measurand,
+                        'unit': unit,
+                    }
+                    for measurand, unit, values in columns
+                ],
+            }
+            for index in range(len(slots))
+        ]
+
+    def sample(self, now: float) -> List[Tuple[Tuple[str, int, int], Dict]]:
+        """
+        Advances all meters to provided time and returns MeterValue entries
+        of transactions which are due, periodic and clock aligned.
+
+        :param now: Event loop time.
+        :return: List of (owner, meter value) pairs.
+        """
+        self._advance(now)
+        due_values = []
+        timestamp = _now()
+
+        due = np.flatnonzero(self.active & (self.next_sample <= now))
+        if len(due):
+            self.next_sample[due] += self.sample_interval
+            # transactions which missed samples do not send them in burst
+            behind = due[self.next_sample[due] <= now]
+            self.next_sample[behind] = now + self.sample_interval
+            meter_values = self._meter_values(
+                due, self.sampled_data, 'Sample.Periodic', timestamp
+            )
+            for slot, meter_value in zip(due.tolist(), meter_values):
+                self.samples[slot].append(meter_value)
+                due_values.append((self.owners[slot], meter_value))
+
+        interval = self._aligned_index()
+        if interval is not None:
+            if self._last_aligned not in (None, interval):
+                aligned = np.flatnonzero(self.active)
+                meter_values = self._meter_values(
+                    aligned, self.aligned_data, 'Sample.Clock', timestamp
+                )
+                due_values.extend(
+                    (self.owners[slot], meter_value)
+                    for slot, meter_value in zip(
+                        aligned.tolist(), meter_values
+                    )
+                )
+            self._last_aligned = interval
+
+        return due_values
+
+    def _aligned_index(self) -> Optional[int]:
+        """
+        Returns number of current clock aligned interval, None if clock
+        aligned data are disabled.
+        """
+        if self.aligned_interval <= 0:
+            return None
+
+        wall = datetime.now(timezone.utc).timestamp()
+        return int(wall // self.aligned_interval)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self) -> None:
+        tasks = list(self._calls)
+        if self._task is not None:
+            tasks.append(self._task)
+            self._task = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _run(self) -> None:
+        loop = asyncio.get_event_loop()
+        while True:
+            await asyncio.sleep(self.tick)
+            if not self._slots:
+                self._last_tick = None
+                # boundaries passed without transactions are not sent when
+                # next transaction starts
+                self._last_aligned = self._aligned_index()
+                continue
+
+            start = perf_counter()
+            try:
+                due_values = self.sample(loop.time())
+            except Exception:
+                logger.exception('Meter values tick failed')
+                continue
+            TICK_DURATION.observe(perf_counter() - start)
+
+            for owner, meter_value in due_values:
+                self._dispatch(owner, meter_value)
+
+    def _dispatch(
+        self, owner: Tuple[str, int, int], meter_value: Dict[str, Any]
+    ) -> None:
+        cp_id, connector_id, transaction_id = owner
+        cp = cp_db.get_cp(cp_id)
+        if cp is None or not cp.online:
+            SENT.labels('offline').inc()
+            return
+
+        task = asyncio.ensure_future(self._send(cp, call.MeterValuesPayload(
+            connector_id=connector_id,
+            transaction_id=transaction_id,
+            meter_value=[meter_value],
+        )))
+        self._calls.add(task)
+        task.add_done_callback(self._calls.discard)
+
+    async def _send(self, cp: Any, payload: Any) -> None:
+        try:
+            await cp.call(payload)
+        except (
+            WebSocketException, asyncio.TimeoutError, HTTPException
+        ) as e:
+            SENT.labels('failed').inc()
+            logger.warning('MeterValues of CP {} failed: {}'.format(
+                cp.id, getattr(e, 'detail', None) or str(e)
+            ))
+            return
+
+        SENT.labels('sent').inc()
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
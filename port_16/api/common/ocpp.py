@@ -1,11 +1,14 @@
 import asyncio
 import logging
-from typing import Dict, Any
-from ssl import SSLContext, PROTOCOL_TLS, CERT_NONE
+from time import perf_counter
+from functools import partial
+from typing import Dict, Any, Optional
 
 import inject
 import websockets
+from fastapi.exceptions import HTTPException
 from ocpp.routing import on
+from ocpp.exceptions import OCPPError
 from ocpp.v16 import call, call_result
 from ocpp.v16 import ChargePoint as OcppCp
 from starlette.websockets import WebSocketDisconnect
@@ -15,9 +18,17 @@ from ocpp.v16.enums import (
     ChargePointStatus, ChargePointErrorCode, RegistrationStatus
 )
 
+from port_16 import config
 from port_16.api.common import cp_db
-from port_16.app_status import AppStatus
 from port_16.api.common.service import ChargePointService
+from port_16.api.common.state import ChargePointStateMachine
+from port_16.api.common.ocpp_metrics import (
+    CALL_QUEUE_DEPTH, ERROR_REJECTED, ERROR_TIMEOUT, ERROR_DISCONNECTED,
+    ERROR_CALL_ERROR, outbound_metrics, instrument_handler
+)
+from port_16.api.common.tls import (
+    ResumingSSLContext, get_ssl_context, record_handshake
+)
 from port_16.api.commands import StartTransaction, StopTransaction
 from port_16.api.charge_point import (
     ChargingPointModel, ChargingPointState, HeartbeatModel
@@ -35,9 +46,89 @@ class ChargePoint(OcppCp):
         self.cp_service = ChargePointService(self.id)
         self.ws_conn = self._connection
         self.status = ChargingPointState.IDLE
+        #: In memory state which is source of truth while CP is connected,
+        #: loaded when connection is opened.
+        self.state_machine: Optional[ChargePointStateMachine] = None
+        #: Number of calls which are sent or waiting to be sent
+        self.call_queue_depth = 0
+        self._outbound_lock = asyncio.Lock()
+
+    async def call(self, payload, suppress=True):
+        """
+        Sends OCPP call through outbound queue of charge point. OCPP 1.6
+        allows one outstanding call per connection, so calls are sent one by
+        one in order of arrival and call is rejected with Too Many Requests
+        when CALL_QUEUE_MAX_DEPTH calls are already queued. Time spent in
+        queue and response time of central system are recorded separately.
+
+        :param payload: Payload of OCPP call.
+        :param suppress: Return None instead of raising CallError.
+        :return: Payload of call result.
+        """
+        metrics = outbound_metrics(payload)
+        action = metrics.action
+        if self.call_queue_depth >= config.CALL_QUEUE_MAX_DEPTH:
+            metrics.rejected.inc()
+            metrics.errors[ERROR_REJECTED].inc()
+            logger.warning(
+                'Outbound queue of CP {} is full, {} rejected'.format(
+                    self.id, action
+                )
+            )
+            raise HTTPException(
+                status_code=429,
+                detail=(
+                    f'Outbound queue of Charging point with id {self.id} is '
+                    f'full, {action} rejected'
+                )
+            )
+
+        self.call_queue_depth += 1
+        CALL_QUEUE_DEPTH.inc()
+        queued_at = perf_counter()
+        try:
+            async with self._outbound_lock:
+                sent_at = perf_counter()
+                metrics.queue_wait.observe(sent_at - queued_at)
+                # only this call is in flight, so timeout could be changed
+                self._response_timeout = config.CALL_TIMEOUTS.get(
+                    action, config.CALL_TIMEOUT
+                )
+                try:
+                    response = await super(ChargePoint, self).call(
+                        payload, suppress
+                    )
+                except asyncio.TimeoutError:
+                    metrics.timed_out.inc()
+                    metrics.errors[ERROR_TIMEOUT].inc()
+                    raise
+                except WebSocketException:
+                    metrics.errors[ERROR_DISCONNECTED].inc()
+                    raise
+                except OCPPError:
+                    metrics.errors[ERROR_CALL_ERROR].inc()
+                    raise
+                finally:
+                    metrics.response_time.observe(perf_counter() - sent_at)
+
+                if response is None:
+                    # suppressed CallError of central system
+                    metrics.errors[ERROR_CALL_ERROR].inc()
+                return response
+        finally:
+            self.call_queue_depth -= 1
+            CALL_QUEUE_DEPTH.dec()
+            metrics.duration.observe(perf_counter() - queued_at)
+
+    @property
+    def online(self) -> bool:
+        return self._connection.open
 
     async def close_connection(self):
         self.status = ChargingPointState.CLOSED
+        #: :type: :class:`port_16.api.common.scheduler.HeartbeatScheduler`
+        scheduler = inject.instance('heartbeat_scheduler')
+        scheduler.unschedule(self.id)
         self.ws_conn.fail_connection()
 
     async def send_connector_status(
@@ -45,6 +136,16 @@ class ChargePoint(OcppCp):
         status: ChargePointStatus = ChargePointStatus.available,
         error_code: ChargePointErrorCode = ChargePointErrorCode.no_error
     ):
+        #: :type: :class:`port_16.api.common.offline.OfflineQueueManager`
+        offline_queues = inject.instance('offline_queues')
+        if offline_queues.should_queue(self):
+            await offline_queues.enqueue(self.id, Action.StatusNotification, {
+                'connector_id': connector_id,
+                'error_code': error_code,
+                'status': status,
+            })
+            return
+
         request = call.StatusNotificationPayload(
             connector_id=connector_id,
             error_code=error_code,
@@ -69,16 +170,16 @@ class ChargePoint(OcppCp):
         response = await self.call(request)
 
         if response.status == RegistrationStatus.accepted:
-            cp_model = await self.cp_service.update_entity(data={
-                'state': ChargingPointState.ACCEPTED.value
-            })
+            cp_model = self.state_machine.set_state(
+                ChargingPointState.ACCEPTED
+            )
             logger.info(
                 "CP {} connected to central system.".format(self.id)
             )
         else:
-            cp_model = await self.cp_service.update_entity(data={
-                'state': ChargingPointState.REJECTED.value
-            })
+            cp_model = self.state_machine.set_state(
+                ChargingPointState.REJECTED
+            )
             logger.info(
                 "CP {} rejected by central system.".format(self.id)
             )
@@ -128,9 +229,7 @@ class ChargePoint(OcppCp):
         await self.send_firmware_notification(FirmwareStatus.installed, -1)
 
         # Charging point available again
-        await self.cp_service.update_entity(data={
-            'state': ChargingPointState.ACCEPTED.value
-        })
+        self.state_machine.set_state(ChargingPointState.ACCEPTED)
         logger.info(
             'After firmware update, CP {} returned '
             'into ACCEPTED state'.format(self.id)
@@ -147,52 +246,40 @@ class ChargePoint(OcppCp):
         )
 
         # Charging point available again
-        await self.cp_service.update_entity(data={
-            'state': ChargingPointState.ACCEPTED.value
-        })
+        self.state_machine.set_state(ChargingPointState.ACCEPTED)
         logger.info(
             'After firmware update, CP {} returned '
             'into ACCEPTED state'.format(self.id)
         )
 
-    async def heartbeat(self) -> None:
-        while True:
-            if self.status == ChargingPointState.CLOSED:
-                logger.info(
-                    "Connection for charger with id: {} is closed, "
-                    "returning from heart-beating"
-                )
-                return
-            cp_model = await self.cp_service.validate_get_entity()
-            cp_state = ChargingPointState(cp_model.state)
-            if cp_state == ChargingPointState.ACCEPTED:
-                request = call.HeartbeatPayload()
-                #: :type: :class:`ocpp.v16.call_result.HeartbeatPayload`
-                response = await self.call(request)
-                logger.info(
-                    "Heartbeat for CP: {} done at {}".format(
-                        self.id, str(response.current_time)
-                    )
-                )
-            elif cp_state == ChargingPointState.UPDATE_FIRMWARE:
-                await self._simulate_update_firmware()
-            elif cp_state == ChargingPointState.GET_DIAGNOSTICS:
-                await self._simulate_upload_diagnostics()
-            else:
-                logger.info(
-                    "Charging point {} is in {} state, heartbeat wont be "
-                    "sent".format(self.id, cp_state)
-                )
+    async def send_heartbeat(self) -> None:
+        request = call.HeartbeatPayload()
+        #: :type: :class:`ocpp.v16.call_result.HeartbeatPayload`
+        response = await self.call(request)
+        logger.info(
+            "Heartbeat for CP: {} done at {}".format(
+                self.id, str(response.current_time)
+            )
+        )
 
-            await asyncio.sleep(cp_model.heartbeat.timeout)
-            #: :type: :class:`port_16.app_status.ApplicationStatusService`
-            status_service = inject.instance('status_service')
-            if status_service.get_status() == AppStatus.EXITING:
-                logger.info(
-                    'Application is in Shutting down state.. Exiting '
-                    'from heartbeat background process..'
-                )
-                return
+    async def heartbeat_tick(self, cp_state: ChargingPointState) -> None:
+        """
+        Does work of single heartbeat interval for provided charge point
+        state. Called by heartbeat scheduler.
+
+        :param cp_state: Current state of charge point.
+        """
+        if cp_state == ChargingPointState.ACCEPTED:
+            await self.send_heartbeat()
+        elif cp_state == ChargingPointState.UPDATE_FIRMWARE:
+            await self._simulate_update_firmware()
+        elif cp_state == ChargingPointState.GET_DIAGNOSTICS:
+            await self._simulate_upload_diagnostics()
+        else:
+            logger.info(
+                "Charging point {} is in {} state, heartbeat wont be "
+                "sent".format(self.id, cp_state)
+            )
 
     async def send_authorize(self, id_tag: str) -> Dict[str, Any]:
         request = call.AuthorizePayload(
@@ -223,31 +310,53 @@ class ChargePoint(OcppCp):
             timestamp=transaction.stop_time,
             id_tag=transaction.id_tag,
             reason=transaction.reason,
-            # add providing meter values
+            transaction_data=transaction.transaction_data,
         )
         #: :type: :class:`ocpp.v16.call_result.StopTransactionPayload`
         response = await self.call(request)
         return response.id_tag_info
 
     @on(Action.UpdateFirmware)
+    @instrument_handler(Action.UpdateFirmware)
     async def on_update_firmware(
         self, location: str, retrieve_date: str, **kwargs
     ) -> call_result.UpdateFirmwarePayload:
-        await self.cp_service.update_entity(data={
-            'state': ChargingPointState.UPDATE_FIRMWARE.value
-        })
+        # UpdateFirmware.conf has no status, so request which is not
+        # allowed in current state is confirmed without starting update
+        if not self.state_machine.can_set_state(
+            ChargingPointState.UPDATE_FIRMWARE
+        ):
+            logger.warning(
+                'UpdateFirmware ignored, CP {} is in {} state'.format(
+                    self.id, self.state_machine.state.value
+                )
+            )
+            return call_result.UpdateFirmwarePayload()
+
+        self.state_machine.set_state(ChargingPointState.UPDATE_FIRMWARE)
         logger.info(
             'Starting UpdateFirmware process for CP {}'.format(self.id)
         )
         return call_result.UpdateFirmwarePayload()
 
     @on(Action.GetDiagnostics)
+    @instrument_handler(Action.GetDiagnostics)
     async def on_get_diagnostics(
         self, location: str, **kwargs
     ) -> call_result.GetDiagnosticsPayload:
-        await self.cp_service.update_entity(data={
-            'state': ChargingPointState.GET_DIAGNOSTICS.value
-        })
+        # diagnostics which could not be uploaded in current state are
+        # rejected by omitting file name
+        if not self.state_machine.can_set_state(
+            ChargingPointState.GET_DIAGNOSTICS
+        ):
+            logger.warning(
+                'GetDiagnostics rejected, CP {} is in {} state'.format(
+                    self.id, self.state_machine.state.value
+                )
+            )
+            return call_result.GetDiagnosticsPayload()
+
+        self.state_machine.set_state(ChargingPointState.GET_DIAGNOSTICS)
         logger.info(
             'Starting GetDiagnostics process for CP {}'.format(self.id)
         )
@@ -258,36 +367,47 @@ class ChargePoint(OcppCp):
 
 async def heartbeat(cp: ChargePoint):
     logger.info(
-        "Starting {} CP heartbeat background task".format(
+        "Scheduling {} CP heartbeat".format(
             cp.id
         )
     )
-    await cp.heartbeat()
-
-
-async def start_cp(cp_model: ChargingPointModel):
-    if cp_model.ws_uri.startswith('wss'):
-        context = SSLContext(protocol=PROTOCOL_TLS)
-        context.check_hostname = False
-        context.verify_mode = CERT_NONE
-        ssl_arg = context
-        # ssl = SSLContext(
-        #     certfile='/Users/stefan/certs/benjo-energy/old/platform.pem',
-        #     keyfile='/Users/stefan/certs/benjo-energy/old/platform.key',
-        #     password=None
-        # )
-    else:
-        ssl_arg = None
+    #: :type: :class:`port_16.api.common.scheduler.HeartbeatScheduler`
+    scheduler = inject.instance('heartbeat_scheduler')
+    scheduler.schedule(cp.id, cp.state_machine.model.heartbeat.timeout)
+
+
+async def _run_cp(
+    cp_model: ChargingPointModel,
+    ssl_arg: Optional[ResumingSSLContext],
+    connected: Optional[asyncio.Future] = None
+) -> ChargePoint:
+    """
+    Opens charge point connection and handles its messages until connection
+    is closed.
+
+    :param cp_model: Charge point which will be connected.
+    :param ssl_arg: SSL context of secure connection.
+    :param connected: Future which is resolved when charge point connects.
+    :return: Charge point whose connection is closed.
+    """
     async with websockets.connect(
         uri=cp_model.ws_uri,
         subprotocols=[cp_model.protocol],
         ssl=ssl_arg
     ) as ws:
+        if ssl_arg is not None:
+            record_handshake(ssl_arg, ws.transport)
         cp = ChargePoint(id=cp_model.identity, connection=ws)
+        cp.state_machine = await ChargePointStateMachine.load(
+            cp.id, inject.instance('state_persister')
+        )
         logger.info(
             'Starting {} CP and background task'.format(cp.id)
         )
         cp_db.set_cp(cp)
+        inject.instance('offline_queues').replay(cp)
+        if connected is not None and not connected.done():
+            connected.set_result(cp)
         try:
             await cp.start()
         except (WebSocketDisconnect, WebSocketException) as e:
@@ -296,3 +416,76 @@ async def start_cp(cp_model: ChargingPointModel):
                     cp_model.identity, str(e)
                 )
             )
+        finally:
+            if ssl_arg is not None:
+                # TLS 1.3 session ticket is received after handshake
+                ssl_arg.save_session(ws.transport.get_extra_info('ssl_object'))
+
+    return cp
+
+
+async def start_cp(
+    cp_model: ChargingPointModel,
+    connected: Optional[asyncio.Future] = None
+):
+    """
+    Connects charge point to central system and handles its messages until
+    connection is closed. If connected future is provided, its result is set
+    to ChargePoint once websocket connection is opened. With
+    RECONNECT_ENABLED dropped connection is opened again by reconnect
+    supervisor, with restored heartbeats.
+
+    :param cp_model: Charge point which will be connected.
+    :param connected: Future which is resolved when charge point connects.
+    """
+    ssl_arg = get_ssl_context() if cp_model.ws_uri.startswith('wss') else None
+
+    cp = await _run_cp(cp_model, ssl_arg, connected)
+    if not config.RECONNECT_ENABLED:
+        return
+
+    #: :type: :class:`port_16.api.common.reconnect.ReconnectSupervisor`
+    supervisor = inject.instance('reconnect_supervisor')
+    #: :type: :class:`port_16.api.common.scheduler.HeartbeatScheduler`
+    scheduler = inject.instance('heartbeat_scheduler')
+    loop = asyncio.get_event_loop()
+    heartbeat_scheduled = cp.id in scheduler
+    while supervisor.should_reconnect(cp):
+        if cp_db.get_cp(cp.id) is not cp:
+            # charge point is deleted or started again
+            return
+
+        scheduler.unschedule(cp.id)
+        await supervisor.wait(cp.id)
+        reconnected = loop.create_future()
+        reconnected.add_done_callback(partial(
+            _on_reconnected, supervisor, scheduler, heartbeat_scheduled
+        ))
+        try:
+            cp = await _run_cp(cp_model, ssl_arg, reconnected)
+            heartbeat_scheduled = cp.id in scheduler
+        except (OSError, asyncio.TimeoutError, WebSocketException) as e:
+            supervisor.failed(cp.id, e)
+        finally:
+            reconnected.cancel()
+
+    if cp_db.get_cp(cp.id) is cp:
+        cp_db.remove_cp(cp.id)
+        # charge point is not connected again, its state is written and
+        # not kept in memory anymore
+        await inject.instance('state_persister').unregister(
+            cp.id, cp.state_machine, flush=True
+        )
+
+
+def _on_reconnected(
+    supervisor: Any, scheduler: Any, heartbeat_scheduled: bool,
+    reconnected: asyncio.Future
+) -> None:
+    if reconnected.cancelled():
+        return
+
+    cp = reconnected.result()
+    supervisor.connected(cp.id)
+    if heartbeat_scheduled:
+        scheduler.schedule(cp.id, cp.state_machine.model.heartbeat.timeout)
@@ -0,0 +1,173 @@
+import functools
+from time import perf_counter
+from typing import Any, Callable, Dict
+
+from ocpp.v16.enums import Action
+
+from port_16.metrics import REGISTRY, Counter, Gauge, Histogram
+from port_16.api.common import cp_db
+from port_16.api.charge_point import ChargingPointState
+
+#: Kinds of failed outbound calls
+ERROR_REJECTED = 'rejected'
+ERROR_TIMEOUT = 'timeout'
+ERROR_DISCONNECTED = 'disconnected'
+ERROR_CALL_ERROR = 'call_error'
+OUTBOUND_ERROR_KINDS = (
+    ERROR_REJECTED, ERROR_TIMEOUT, ERROR_DISCONNECTED, ERROR_CALL_ERROR
+)
+
+CALL_QUEUE_DEPTH = Gauge(
+    'port16_call_queue_depth',
+    'Number of OCPP calls of all charge points which are sent or waiting '
+    'to be sent'
+)
+CALL_QUEUE_WAIT = Histogram(
+    'port16_call_queue_wait_seconds',
+    'Time OCPP call waited in outbound queue of charge point',
+    ('action',)
+)
+CALL_RESPONSE_TIME = Histogram(
+    'port16_call_response_seconds',
+    'Time central system took to respond to OCPP call',
+    ('action',)
+)
+CALLS_REJECTED = Counter(
+    'port16_call_rejected_total',
+    'Number of OCPP calls rejected because outbound queue was full',
+    ('action',)
+)
+CALLS_TIMED_OUT = Counter(
+    'port16_call_timeouts_total',
+    'Number of OCPP calls without response in time',
+    ('action',)
+)
+OUTBOUND_TIME = Histogram(
+    'port16_ocpp_outbound_seconds',
+    'Duration of OCPP calls sent by charge points, including queue wait',
+    ('action',)
+)
+OUTBOUND_ERRORS = Counter(
+    'port16_ocpp_outbound_errors_total',
+    'Number of failed OCPP calls sent by charge points by error',
+    ('action', 'error')
+)
+INBOUND_TIME = Histogram(
+    'port16_ocpp_inbound_seconds',
+    'Duration of handlers of OCPP calls received from central system',
+    ('action',)
+)
+INBOUND_ERRORS = Counter(
+    'port16_ocpp_inbound_errors_total',
+    'Number of failed handlers of OCPP calls received from central system '
+    'by exception',
+    ('action', 'error')
+)
+CONNECTED = Gauge(
+    'port16_connected_chargers',
+    'Number of charge points with open connection'
+)
+CHARGERS = Gauge(
+    'port16_chargers',
+    'Number of started charge points by state',
+    ('state',)
+)
+ACTIVE_TRANSACTIONS = Gauge(
+    'port16_active_transactions',
+    'Number of active transactions of started charge points'
+)
+_state_gauges = {
+    state: CHARGERS.labels(state.value) for state in ChargingPointState
+}
+
+
+class ActionMetrics:
+    """
+    Metric children of outbound calls of one OCPP action. Children are
+    looked up once, so recording call does not allocate label tuples.
+    """
+    __slots__ = (
+        'action', 'duration', 'queue_wait', 'response_time', 'rejected',
+        'timed_out', 'errors'
+    )
+
+    def __init__(self, action: str):
+        self.action = action
+        self.duration = OUTBOUND_TIME.labels(action)
+        self.queue_wait = CALL_QUEUE_WAIT.labels(action)
+        self.response_time = CALL_RESPONSE_TIME.labels(action)
+        self.rejected = CALLS_REJECTED.labels(action)
+        self.timed_out = CALLS_TIMED_OUT.labels(action)
+        self.errors = {
+            error: OUTBOUND_ERRORS.labels(action, error)
+            for error in OUTBOUND_ERROR_KINDS
+        }
+
+
+_outbound: Dict[type, ActionMetrics] = {}
+
+
+def outbound_metrics(payload: Any) -> ActionMetrics:
+    """
+    Returns metrics of outbound calls of payload action, created on first
+    call of that action.
+
+    :param payload: Payload of OCPP call.
+    :return: Metrics of action.
+    """
+    metrics = _outbound.get(payload.__class__)
+    if metrics is None:
+        action = payload.__class__.__name__[:-len('Payload')]
+        metrics = _outbound[payload.__class__] = ActionMetrics(action)
+
+    return metrics
+
+
+def instrument_handler(action: Action) -> Callable:
+    """
+    Records duration and exceptions of handler of inbound OCPP call. Must
+    be placed below `on` decorator.
+
+    :param action: Action of handled call.
+    :return: Decorator.
+    """
+    duration = INBOUND_TIME.labels(action.value)
+
+    def decorator(handler: Callable) -> Callable:
+        @functools.wraps(handler)
+        async def wrapper(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return await handler(*args, **kwargs)
+            except Exception as e:
+                INBOUND_ERRORS.labels(action.value, type(e).__name__).inc()
+                raise
+            finally:
+                duration.observe(perf_counter() - start)
+
+        return wrapper
+
+    return decorator
+
+
+def collect_charger_metrics() -> None:
+    """
+    Counts connected charge points, charge points by state and active
+    transactions. Called once per metrics rendering, so charge point
+    changes are not tracked.
+    """
+    connected = 0
+    transactions = 0
+    counts = dict.fromkeys(ChargingPointState, 0)
+    for cp in cp_db.all_cps():
+        connected += cp.online
+        counts[cp.state_machine.state] += 1
+        transactions += len(cp.state_machine.transactions)
+
+    CONNECTED.set(connected)
+    ACTIVE_TRANSACTIONS.set(transactions)
+    for state, count in counts.items():
+        _state_gauges[state].set(count)
+
+
+REGISTRY.register_collector(collect_charger_metrics)
@@ -0,0 +1,579 @@
+import json
+import asyncio
+import logging
+from time import perf_counter
+from functools import partial
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+import inject
+from fastapi.exceptions import HTTPException
+from ocpp.v16 import call
+from ocpp.v16.enums import Action, ChargePointStatus
+from websockets.exceptions import WebSocketException
+
+from port_16 import config
+from port_16.metrics import Counter, Gauge, Histogram
+from port_16.api.common.service import AuthTagService
+
+logger = logging.getLogger(__name__)
+
+#: Overflow policies of full offline queue
+OVERFLOW_DROP_OLDEST = 'drop_oldest'
+OVERFLOW_DROP_NEWEST = 'drop_newest'
+OVERFLOW_REJECT = 'reject'
+OVERFLOW_POLICIES = (
+    OVERFLOW_DROP_OLDEST, OVERFLOW_DROP_NEWEST, OVERFLOW_REJECT
+)
+
+QUEUE_KEY = 'OFFLINE_QUEUE-{}'
+
+MESSAGES = Counter(
+    'port16_offline_messages_total',
+    'Number of offline queue messages by result',
+    ('result',)
+)
+QUEUED = Gauge(
+    'port16_offline_queue_messages',
+    'Number of messages waiting in offline queues of all charge points'
+)
+REPLAY_TIME = Histogram(
+    'port16_offline_replay_seconds',
+    'Time of replaying offline queue of one charge point'
+)
+
+
+class OfflineQueue:
+    """
+    Messages of one charge point which are created while its connection is
+    down, oldest first. Queue is kept in memory and, if durable, mirrored
+    in storage backend list, so it survives restart of application.
+    """
+
+    def __init__(
+        self,
+        cp_id: str,
+        max_length: int,
+        overflow: str,
+        backend: Any = None
+    ):
+        self.cp_id = cp_id
+        self.max_length = max_length
+        self.overflow = overflow
+        #: :type: :class:`port_16.api.common.service.backend.StorageBackend`
+        self.backend = backend
+        self.key = QUEUE_KEY.format(cp_id)
+        self.messages: Deque[Dict[str, Any]] = deque()
+        self.loaded = backend is None
+
+    def __len__(self) -> int:
+        return len(self.messages)
+
+    async def load(self) -> None:
+        """
+        Reads messages of durable queue stored before application restart.
+        """
+        if self.loaded:
+            return
+
+        stored = await self.backend.list_range(self.key)
+        self.loaded = True
+        self.messages.extendleft(
+            json.loads(message) for message in reversed(stored)
+        )
+
+    async def push(
+        self, action: Action, payload: Dict[str, Any],
+        transaction_id: Optional[int] = None
+    ) -> bool:
+        """
+        Appends message at the end of queue. If queue is full, message is
+        handled by overflow policy: oldest message is dropped, new message
+        is dropped or Service Unavailable exception is raised.
+
+        :param action: OCPP action of message.
+        :param payload: Payload of OCPP call.
+        :param transaction_id: Provisional id of transaction started by
+            queued start transaction.
+        :return: True if message is queued.
+        """
+        await self.load()
+        if len(self.messages) >= self.max_length:
+            if self.overflow == OVERFLOW_REJECT:
+                MESSAGES.labels('rejected').inc()
+                logger.warning(
+                    'Offline queue of CP {} is full, {} rejected'.format(
+                        self.cp_id, action.value
+                    )
+                )
+                raise HTTPException(
+                    status_code=503,
+                    detail=(
+                        f'Offline queue of Charging point with id '
+                        f'{self.cp_id} is full'
+                    )
+                )
+
+            MESSAGES.labels('dropped').inc()
+            if self.overflow == OVERFLOW_DROP_NEWEST:
+                logger.warning(
+                    'Offline queue of CP {} is full, {} dropped'.format(
+                        self.cp_id, action.value
+                    )
+                )
+                return False
+
+            dropped = self.messages.popleft()
+            logger.warning(
+                'Offline queue of CP {} is full, oldest {} dropped'.format(
+                    self.cp_id, dropped['action']
+                )
+            )
+
+        message = {'action': str(action.value), 'payload': payload}
+        if transaction_id is not None:
+            message['transaction_id'] = transaction_id
+        self.messages.append(message)
+        if self.backend is not None:
+            await self.backend.list_push(
+                self.key, [json.dumps(message)], self.max_length
+            )
+        MESSAGES.labels('queued').inc()
+        return True
+
+    async def pop(self) -> None:
+        """
+        Removes oldest message, after it is delivered.
+        """
+        self.messages.popleft()
+        if self.backend is not None:
+            await self.backend.list_pop(self.key, 1)
+
+    async def clear(self) -> None:
+        self.messages.clear()
+        if self.backend is not None:
+            await self.backend.list_pop(self.key, self.max_length)
+
+
+class OfflineQueueManager:
+    """
+    Keeps offline queues of charge points and replays them when charge
+    point reconnects. Messages of one charge point are sent in order, one
+    by one, and at most replay_concurrency charge points replay theirs
+    queues at once, so replay burst which central system receives after
+    outage stays bounded. While queue is not empty new messages are queued
+    too, so they are not sent before older ones.
+    """
+
+    def __init__(
+        self,
+        max_length: Optional[int] = None,
+        overflow: Optional[str] = None,
+        replay_concurrency: Optional[int] = None,
+        durable: Optional[bool] = None
+    ):
+        self.max_length = max_length or config.OFFLINE_QUEUE_MAX_LENGTH
+        self.overflow = overflow or config.OFFLINE_QUEUE_OVERFLOW
+        if self.overflow not in OVERFLOW_POLICIES:
+            raise ValueError(
+                'Unknown offline queue overflow policy {}, expected one '
+                'of {}'.format(self.overflow, ', '.join(OVERFLOW_POLICIES))
+            )
+        self.replay_concurrency = (
+            replay_concurrency or config.OFFLINE_REPLAY_CONCURRENCY
+        )
+        self.durable = (
+            config.OFFLINE_QUEUE_DURABLE if durable is None else durable
+        )
+        self.queues: Dict[str, OfflineQueue] = {}
+        self.replayed = 0
+        self.failed = 0
+        self._semaphore = asyncio.Semaphore(self.replay_concurrency)
+        #: Replaying charge points and theirs replay tasks
+        self._replaying: Dict[str, Tuple[Any, asyncio.Task]] = {}
+        #: Ids returned by central system for provisional ids of replayed
+        #: transactions, by charge point
+        self._transaction_ids: Dict[str, Dict[int, int]] = {}
+        QUEUED.set_function(
+            lambda: sum(len(queue) for queue in self.queues.values())
+        )
+
+    def get(self, cp_id: str) -> OfflineQueue:
+        """
+        Returns offline queue of charge point, creating it if needed.
+
+        :param cp_id: Id of charge point.
+        :return: Offline queue.
+        """
+        queue = self.queues.get(cp_id)
+        if queue is None:
+            backend = None
+            if self.durable:
+                backend = inject.instance('storage_backend')
+            queue = self.queues[cp_id] = OfflineQueue(
+                cp_id, self.max_length, self.overflow, backend
+            )
+
+        return queue
+
+    def should_queue(self, cp: Any) -> bool:
+        """
+        Checks if message of charge point must be queued, which is when its
+        connection is down or older messages are not delivered yet.
+
+        :param cp: Charge point which sends message.
+        :type cp: port_16.api.common.ocpp.ChargePoint
+        :return: True if message must be queued.
+        """
+        if not cp.online or cp.id in self._replaying:
+            return True
+
+        queue = self.queues.get(cp.id)
+        return queue is not None and (len(queue) > 0 or not queue.loaded)
+
+    async def enqueue(
+        self, cp_id: str, action: Action, payload: Dict[str, Any],
+        transaction_id: Optional[int] = None
+    ) -> bool:
+        """
+        Adds message at the end of charge point offline queue.
+
+        :param cp_id: Id of charge point.
+        :param action: OCPP action of message.
+        :param payload: Payload of OCPP call.
+        :param transaction_id: Provisional id of transaction started by
+            queued start transaction.
+        :return: True if message is queued.
+        """
+        queued = await self.get(cp_id).push(action, payload, transaction_id)
+        if queued:
+            logger.info('{} of CP {} queued while offline'.format(
+                action.value, cp_id
+            ))
+        return queued
+
+    async def provisional_transaction_id(self, cp: Any) -> int:
+        """
+        Returns id of transaction started offline, which is used until
+        central system returns its id on replay. Provisional ids are
+        negative, so they do not collide with ids from central system.
+
+        :param cp: Charge point which starts transaction.
+        :type cp: port_16.api.common.ocpp.ChargePoint
+        :return: Provisional transaction id.
+        """
+        queue = self.get(cp.id)
+        await queue.load()
+        used = [0]
+        used.extend(cp.state_machine.transactions)
+        used.extend(self._transaction_ids.get(cp.id, {}))
+        used.extend(
+            message.get('transaction_id', 0) for message in queue.messages
+        )
+        return min(used) - 1
+
+    def resolve_transaction_id(
+        self, cp_id: str, transaction_id: int
+    ) -> int:
+        """
+        Returns id of transaction returned by central system if provided id
+        is provisional id of replayed transaction, otherwise provided id.
+
+        :param cp_id: Id of charge point.
+        :param transaction_id: Transaction id.
+        :return: Transaction id.
+        """
+        return self._transaction_ids.get(cp_id, {}).get(
+            transaction_id, transaction_id
+        )
+
+    def forget_transaction_id(self, cp_id: str, transaction_id: int) -> None:
+        """
+        Drops provisional id of stopped transaction.
+
+        :param cp_id: Id of charge point.
+        :param transaction_id: Id of stopped transaction returned by
+            central system.
+        """
+        ids = self._transaction_ids.get(cp_id, {})
+        for provisional_id, replayed_id in list(ids.items()):
+            if replayed_id == transaction_id:
+                del ids[provisional_id]
+
+    def replay(self, cp: Any) -> None:
+        """
+        Starts replaying offline queue of connected charge point in
+        background. Durable queues are replayed even if nothing is queued
+        in memory, because they could be stored before restart.
+
+        :param cp: Connected charge point.
+        :type cp: port_16.api.common.ocpp.ChargePoint
+        """
+        replaying_cp, task = self._replaying.get(cp.id, (None, None))
+        if replaying_cp is cp:
+            return
+
+        if task is not None:
+            # replay over dropped connection, unconfirmed message is resent
+            task.cancel()
+
+        queue = self.queues.get(cp.id)
+        if not self.durable and (queue is None or not len(queue)):
+            return
+
+        task = asyncio.ensure_future(self._replay(cp))
+        self._replaying[cp.id] = (cp, task)
+        task.add_done_callback(partial(self._replay_done, cp))
+
+    def _replay_done(self, cp: Any, task: asyncio.Task) -> None:
+        if self._replaying.get(cp.id, (None, None))[1] is not task:
+            return
+
+        del self._replaying[cp.id]
+        queue = self.queues.get(cp.id)
+        if (
+            not task.cancelled() and cp.online and
+            queue is not None and len(queue)
+        ):
+            # message queued after replay loop finished
+            self.replay(cp)
+
+    async def _replay(self, cp: Any) -> None:
+        async with self._semaphore:
+            queue = self.get(cp.id)
+            await queue.load()
+            if not len(queue):
+                return
+
+            start = perf_counter()
+            total = len(queue)
+            logger.info('Replaying {} offline messages of CP {}'.format(
+                total, cp.id
+            ))
+            while len(queue) and cp.online:
+                message = queue.messages[0]
+                payload = self._replay_payload(cp, message)
+                if payload is None:
+                    await queue.pop()
+                    MESSAGES.labels('dropped').inc()
+                    continue
+
+                payload_cls = getattr(call, message['action'] + 'Payload')
+                try:
+                    response = await cp.call(payload_cls(**payload))
+                except (
+                    WebSocketException, asyncio.TimeoutError, HTTPException
+                ) as e:
+                    self.failed += 1
+                    MESSAGES.labels('failed').inc()
+                    logger.warning(
+                        'Replay of offline messages of CP {} stopped, {} '
+                        'messages left: {}'.format(cp.id, len(queue), str(e))
+                    )
+                    break
+
+                await queue.pop()
+                self.replayed += 1
+                MESSAGES.labels('replayed').inc()
+                try:
+                    await self._handle_response(cp, message, response)
+                except HTTPException as e:
+                    logger.warning(
+                        'Response of replayed {} of CP {} is not '
+                        'applied: {}'.format(
+                            message['action'], cp.id, e.detail
+                        )
+                    )
+                except Exception:
+                    # message is already sent, replay goes on with next one
+                    logger.exception(
+                        'Response of replayed {} of CP {} is not '
+                        'applied'.format(message['action'], cp.id)
+                    )
+
+            REPLAY_TIME.observe(perf_counter() - start)
+            logger.info(
+                'Replayed {} offline messages of CP {}, {} left'.format(
+                    total - len(queue), cp.id, len(queue)
+                )
+            )
+
+    def _replay_payload(
+        self, cp: Any, message: Dict[str, Any]
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Returns payload of replayed message. Stop of transaction started
+        offline gets transaction id returned by central system. If start of
+        transaction is not accepted, its stop is dropped and None is
+        returned.
+        """
+        payload = message['payload']
+        transaction_id = payload.get('transaction_id')
+        if (
+            message['action'] != Action.StopTransaction or
+            transaction_id is None or transaction_id >= 0
+        ):
+            return payload
+
+        cp_ids = self._transaction_ids.get(cp.id, {})
+        if transaction_id not in cp_ids:
+            logger.warning(
+                'Stop of transaction {} of CP {} dropped, its start is not '
+                'accepted by central system'.format(transaction_id, cp.id)
+            )
+            return None
+
+        return dict(payload, transaction_id=cp_ids.pop(transaction_id))
+
+    async def _handle_response(
+        self, cp: Any, message: Dict[str, Any], response: Any
+    ) -> None:
+        """
+        Applies response of replayed message: transaction started offline
+        gets its id and tag info returned by central system is stored. If
+        central system responds with CallError (None response), or started
+        transaction could not be applied, connector of transaction started
+        offline is released.
+        """
+        payload = message['payload']
+        provisional_id = message.get('transaction_id')
+        if response is None:
+            logger.warning(
+                'Replayed {} of CP {} is rejected by central system'.format(
+                    message['action'], cp.id
+                )
+            )
+            if message['action'] == Action.StartTransaction:
+                await self._discard_start(cp, payload, None, provisional_id)
+            return
+
+        if message['action'] == Action.StartTransaction:
+            transaction_id = None
+            try:
+                transaction_id = response.transaction_id
+                self._apply_start(
+                    cp, payload, transaction_id, provisional_id
+                )
+            except Exception:
+                await self._discard_start(
+                    cp, payload, transaction_id, provisional_id
+                )
+                raise
+        if message['action'] in (
+            Action.StartTransaction, Action.StopTransaction
+        ) and payload.get('id_tag') and response.id_tag_info:
+            await AuthTagService(payload['id_tag']).add_tag_info(
+                response.id_tag_info,
+                command='Replay of {}'.format(message['action'])
+            )
+
+    def _apply_start(
+        self, cp: Any, payload: Dict[str, Any], transaction_id: int,
+        provisional_id: Optional[int] = None
+    ) -> None:
+        """
+        Replaces provisional id of transaction started offline with id
+        returned by central system and starts its metering. Transaction
+        which is already stopped offline only gets id for its queued stop.
+
+        :param cp: Connected charge point.
+        :param payload: Payload of replayed start transaction.
+        :param transaction_id: Id of transaction returned by central system.
+        :param provisional_id: Provisional id of transaction, not known for
+            messages queued by previous versions.
+        """
+        state_machine = cp.state_machine
+        if provisional_id is None:
+            state_machine.start_transaction(
+                transaction_id, payload['connector_id']
+            )
+        else:
+            self._transaction_ids.setdefault(
+                cp.id, {}
+            )[provisional_id] = transaction_id
+            if provisional_id not in state_machine.transactions:
+                # transaction is already stopped offline
+                return
+
+            state_machine.replace_transaction(provisional_id, transaction_id)
+
+        #: :type: :class:`port_16.api.common.meter.MeterValuesEngine`
+        meter_engine = inject.instance('meter_engine')
+        meter_engine.start_transaction(
+            cp.id, payload['connector_id'], transaction_id,
+            payload['meter_start']
+        )
+
+    async def _discard_start(
+        self, cp: Any, payload: Dict[str, Any],
+        transaction_id: Optional[int] = None,
+        provisional_id: Optional[int] = None
+    ) -> None:
+        """
+        Stops metering of transaction started offline which is not started
+        by replay and releases its connector. Transaction which is already
+        stopped offline keeps its connector status.
+
+        :param cp: Connected charge point.
+        :param payload: Payload of replayed start transaction.
+        :param transaction_id: Id of transaction if central system returned
+            it.
+        :param provisional_id: Provisional id of transaction.
+        """
+        connector_id = payload['connector_id']
+        state_machine = cp.state_machine
+        if provisional_id is not None:
+            self._transaction_ids.get(cp.id, {}).pop(provisional_id, None)
+        if transaction_id is not None:
+            #: :type: :class:`port_16.api.common.meter.MeterValuesEngine`
+            meter_engine = inject.instance('meter_engine')
+            meter_engine.stop_transaction(cp.id, transaction_id)
+        active = False
+        for active_id in (transaction_id, provisional_id):
+            if (
+                active_id is not None and
+                state_machine.transactions.get(active_id) == connector_id
+            ):
+                state_machine.stop_transaction(active_id)
+                active = True
+        if provisional_id is not None and not active:
+            return
+
+        if state_machine.release_connector(connector_id):
+            await cp.send_connector_status(
+                connector_id, ChargePointStatus.available
+            )
+
+    async def remove(self, cp_id: str) -> None:
+        """
+        Drops offline queue of deleted charge point.
+
+        :param cp_id: Id of charge point.
+        """
+        _, task = self._replaying.pop(cp_id, (None, None))
+        if task is not None:
+            task.cancel()
+
+        self._transaction_ids.pop(cp_id, None)
+
+        queue = self.queues.pop(cp_id, None)
+        if queue is not None:
+            await queue.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns offline queue counters and lengths of non empty queues.
+
+        :return: Dict with offline queue statistics.
+        """
+        lengths = {
+            cp_id: len(queue) for cp_id, queue in self.queues.items()
+            if len(queue)
+        }
+        return {
+            'queued': sum(lengths.values()),
+            'replaying': len(self._replaying),
+            'replayed': self.replayed,
+            'failed': self.failed,
+            'queues': lengths,
+        }
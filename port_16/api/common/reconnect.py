@@ -0,0 +1,195 @@
+import time
+import random
+import asyncio
+import logging
+from typing import Dict, Optional
+
+import inject
+
+from port_16 import config
+from port_16.app_status import AppStatus
+from port_16.metrics import Counter, Gauge, Histogram
+from port_16.api.charge_point import ChargingPointState
+
+logger = logging.getLogger(__name__)
+
+RECONNECTS = Counter(
+    'port16_reconnect_attempts_total',
+    'Number of charge point reconnect attempts by result',
+    ('result',)
+)
+RECONNECTING = Gauge(
+    'port16_reconnecting_chargers',
+    'Number of charge points which are reconnecting'
+)
+LIMITER_WAIT = Histogram(
+    'port16_reconnect_limiter_wait_seconds',
+    'Time reconnect attempts waited for global reconnect rate limiter'
+)
+
+
+class TokenBucket:
+    """
+    Rate limiter which allows rate acquisitions per second with bursts of
+    at most burst acquisitions. Waiting acquisitions reserve theirs tokens,
+    so they are released in order of arrival.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated_at = time.monotonic()
+
+    def reserve(self) -> float:
+        """
+        Takes one token and returns number of seconds caller must wait
+        before token is available.
+
+        :return: Seconds to wait.
+        """
+        now = time.monotonic()
+        self.tokens = min(
+            self.burst, self.tokens + (now - self.updated_at) * self.rate
+        )
+        self.updated_at = now
+        self.tokens -= 1
+        return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+    async def acquire(self) -> float:
+        """
+        Waits until token is available.
+
+        :return: Seconds waited.
+        """
+        delay = self.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        return delay
+
+
+class ReconnectSupervisor:
+    """
+    Decides when dropped charge point connections are opened again.
+    Attempts of every charge point are delayed with capped exponential
+    backoff with full jitter, and attempts of all charge points are limited
+    by global token bucket, so reconnect storm after central system restart
+    stays bounded. Attempts also wait while event loop is overloaded.
+    """
+
+    def __init__(
+        self,
+        backoff_base: Optional[float] = None,
+        backoff_cap: Optional[float] = None,
+        max_attempts: Optional[int] = None,
+        rate: Optional[float] = None,
+        burst: Optional[int] = None
+    ):
+        self.backoff_base = backoff_base or config.RECONNECT_BACKOFF_BASE
+        self.backoff_cap = backoff_cap or config.RECONNECT_BACKOFF_CAP
+        self.max_attempts = (
+            config.RECONNECT_MAX_ATTEMPTS if max_attempts is None
+            else max_attempts
+        )
+        self.limiter = TokenBucket(
+            rate or config.RECONNECT_RATE, burst or config.RECONNECT_BURST
+        )
+        #: Number of consecutive failed attempts of reconnecting chargers
+        self.attempts: Dict[str, int] = {}
+        self.reconnects = 0
+        self.failures = 0
+        self.gave_up = 0
+        RECONNECTING.set_function(lambda: len(self.attempts))
+
+    def backoff(self, attempt: int) -> float:
+        """
+        Returns random delay of provided attempt, between 0 and capped
+        exponential backoff.
+
+        :param attempt: Number of failed attempts.
+        :return: Delay in seconds.
+        """
+        return random.uniform(
+            0, min(self.backoff_cap, self.backoff_base * 2 ** attempt)
+        )
+
+    def should_reconnect(self, cp) -> bool:
+        """
+        Checks if dropped connection of charge point will be opened again.
+        Connections closed on purpose, connections of stopping application
+        and connections which failed max_attempts times are not reopened.
+
+        :param cp: Charge point whose connection is dropped.
+        :type cp: port_16.api.common.ocpp.ChargePoint
+        :return: True if charge point will be reconnected.
+        """
+        if cp.status == ChargingPointState.CLOSED:
+            return False
+
+        #: :type: :class:`port_16.app_status.ApplicationStatusService`
+        status_service = inject.instance('status_service')
+        if status_service.get_status() == AppStatus.EXITING:
+            return False
+
+        attempt = self.attempts.get(cp.id, 0)
+        if self.max_attempts and attempt >= self.max_attempts:
+            self.attempts.pop(cp.id, None)
+            self.gave_up += 1
+            logger.error(
+                'Charger {} is not reconnected after {} attempts'.format(
+                    cp.id, attempt
+                )
+            )
+            return False
+
+        return True
+
+    async def wait(self, cp_id: str) -> None:
+        """
+        Waits before next reconnect attempt of charge point.
+
+        :param cp_id: Id of charge point.
+        """
+        attempt = self.attempts.setdefault(cp_id, 0)
+        delay = self.backoff(attempt)
+        logger.info(
+            'Reconnecting charger {} in {:.2f} seconds (attempt {})'.format(
+                cp_id, delay, attempt + 1
+            )
+        )
+        await asyncio.sleep(delay)
+        LIMITER_WAIT.observe(await self.limiter.acquire())
+        #: :type: :class:`port_16.api.common.loop.LoopMonitor`
+        loop_monitor = inject.instance('loop_monitor')
+        await loop_monitor.wait_recovered()
+
+    def connected(self, cp_id: str) -> None:
+        attempt = self.attempts.pop(cp_id, 0)
+        self.reconnects += 1
+        RECONNECTS.labels('success').inc()
+        logger.info('Charger {} reconnected after {} failed attempts'.format(
+            cp_id, attempt
+        ))
+
+    def failed(self, cp_id: str, error: Exception) -> None:
+        self.attempts[cp_id] = self.attempts.get(cp_id, 0) + 1
+        self.failures += 1
+        RECONNECTS.labels('failure').inc()
+        logger.warning('Reconnect of charger {} failed: {}'.format(
+            cp_id, str(error)
+        ))
+
+    def stats(self) -> dict:
+        """
+        Returns reconnect counters and attempts of reconnecting chargers.
+
+        :return: Dict with reconnect statistics.
+        """
+        return {
+            'reconnecting': len(self.attempts),
+            'reconnects': self.reconnects,
+            'failures': self.failures,
+            'gave_up': self.gave_up,
+            'attempts': dict(self.attempts),
+        }
@@ -0,0 +1,207 @@
+import heapq
+import random
+import asyncio
+import logging
+import itertools
+from time import perf_counter
+from typing import Dict, List, Tuple, Optional
+
+from port_16 import config
+from port_16.metrics import Counter, Gauge, Histogram
+from port_16.api.charge_point import ChargingPointState
+from . import cp_db
+
+logger = logging.getLogger(__name__)
+
+QUEUE_DEPTH = Gauge(
+    'port16_heartbeat_queue_depth',
+    'Number of charge points scheduled by heartbeat scheduler'
+)
+IN_FLIGHT = Gauge(
+    'port16_heartbeat_in_flight',
+    'Number of running heartbeat scheduler tasks'
+)
+LATENESS = Histogram(
+    'port16_heartbeat_lateness_seconds',
+    'Time between heartbeat due time and its processing'
+)
+TICK_DURATION = Histogram(
+    'port16_heartbeat_tick_seconds',
+    'Duration of processing heartbeats due within single tick'
+)
+RUNS = Counter(
+    'port16_heartbeat_runs_total',
+    'Number of heartbeat scheduler runs by charge point state',
+    ('state',)
+)
+
+
+class HeartbeatScheduler:
+    """
+    Drives heartbeats of all connected charge points using single task and
+    heap of due times. Charge points due within a tick are processed
+    together, using theirs in memory state, so no storage reads are done.
+    Heartbeat intervals are jittered, so heartbeats of charge points started
+    at same time spread over time. Firmware update and diagnostics upload
+    simulations run as separate tasks, so they do not block the scheduler.
+    """
+
+    def __init__(
+        self,
+        tick: Optional[float] = None,
+        jitter: Optional[float] = None,
+        batch_size: Optional[int] = None
+    ):
+        self.tick = tick or config.HEARTBEAT_TICK
+        self.jitter = config.HEARTBEAT_JITTER if jitter is None else jitter
+        self.batch_size = batch_size or config.HEARTBEAT_BATCH_SIZE
+        self._heap: List[Tuple[float, int, str]] = []
+        #: Sequence number of valid heap entry of every scheduled charge
+        #: point, entries with other sequence numbers are skipped.
+        self._scheduled: Dict[str, int] = {}
+        self._counter = itertools.count()
+        self._in_flight: Dict[str, asyncio.Task] = {}
+        self._task = None
+        QUEUE_DEPTH.set_function(lambda: len(self._scheduled))
+        IN_FLIGHT.set_function(lambda: len(self._in_flight))
+
+    def __len__(self):
+        return len(self._scheduled)
+
+    def _push(self, cp_id: str, due: float) -> None:
+        seq = next(self._counter)
+        self._scheduled[cp_id] = seq
+        heapq.heappush(self._heap, (due, seq, cp_id))
+
+    def _interval(self, timeout: float) -> float:
+        return timeout * (1 + random.uniform(-self.jitter, self.jitter))
+
+    def schedule(self, cp_id: str, timeout: float) -> None:
+        """
+        Schedules heartbeats of charge point with provided id. First
+        heartbeat is due at random time within first interval. Already
+        scheduled charge point is not rescheduled.
+
+        :param cp_id: Id of charge point.
+        :param timeout: Heartbeat interval in seconds.
+        """
+        if cp_id in self._scheduled:
+            return
+
+        loop = asyncio.get_event_loop()
+        self._push(cp_id, loop.time() + random.uniform(0, timeout))
+        logger.info('Heartbeats of CP {} scheduled'.format(cp_id))
+
+    def __contains__(self, cp_id: str) -> bool:
+        return cp_id in self._scheduled
+
+    def unschedule(self, cp_id: str) -> None:
+        """
+        Stops heartbeats of charge point with provided id.
+
+        :param cp_id: Id of charge point.
+        """
+        if self._scheduled.pop(cp_id, None) is not None:
+            logger.info('Heartbeats of CP {} unscheduled'.format(cp_id))
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self) -> None:
+        tasks = list(self._in_flight.values())
+        if self._task is not None:
+            tasks.append(self._task)
+            self._task = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _pop_due(self, now: float) -> List[Tuple[str, float]]:
+        due_entries = []
+        while (
+            self._heap and self._heap[0][0] <= now and
+            len(due_entries) < self.batch_size
+        ):
+            due, seq, cp_id = heapq.heappop(self._heap)
+            if self._scheduled.get(cp_id) != seq:
+                continue
+
+            LATENESS.observe(now - due)
+            due_entries.append((cp_id, due))
+
+        return due_entries
+
+    async def _run(self) -> None:
+        loop = asyncio.get_event_loop()
+        while True:
+            now = loop.time()
+            due_entries = self._pop_due(now)
+            if due_entries:
+                start = perf_counter()
+                try:
+                    self._process(due_entries, now)
+                except Exception:
+                    logger.exception('Heartbeat scheduler tick failed')
+                    for cp_id, due in due_entries:
+                        if cp_id in self._scheduled:
+                            self._push(cp_id, now + self.tick)
+                TICK_DURATION.observe(perf_counter() - start)
+
+            if len(due_entries) >= self.batch_size:
+                # more heartbeats are due, continue after other tasks run
+                await asyncio.sleep(0)
+            else:
+                await asyncio.sleep(self.tick)
+
+    def _process(
+        self, due_entries: List[Tuple[str, float]], now: float
+    ) -> None:
+        for cp_id, due in due_entries:
+            if cp_id not in self._scheduled:
+                continue
+
+            cp = cp_db.get_cp(cp_id)
+            if (
+                cp is None or cp.state_machine is None or
+                cp.status == ChargingPointState.CLOSED
+            ):
+                self.unschedule(cp_id)
+                continue
+
+            state_machine = cp.state_machine
+            self._run_tick(cp, state_machine.state)
+            self._push(cp_id, max(
+                due + self._interval(state_machine.model.heartbeat.timeout),
+                now
+            ))
+
+    def _run_tick(self, cp, cp_state: ChargingPointState) -> None:
+        """
+        Starts heartbeat tick of charge point in separate task, unless its
+        previous tick (e.g. firmware update simulation) is still running.
+
+        :param cp: Charge point.
+        :type cp: port_16.api.common.ocpp.ChargePoint
+        :param cp_state: Current state of charge point.
+        """
+        if cp.id in self._in_flight:
+            RUNS.labels('BUSY').inc()
+            return
+
+        RUNS.labels(cp_state.value).inc()
+        self._in_flight[cp.id] = asyncio.ensure_future(
+            self._guarded_tick(cp, cp_state)
+        )
+
+    async def _guarded_tick(self, cp, cp_state: ChargingPointState) -> None:
+        try:
+            await cp.heartbeat_tick(cp_state)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(
+                'Heartbeat of CP {} failed: {}'.format(cp.id, str(e))
+            )
+        finally:
+            self._in_flight.pop(cp.id, None)
@@ -1,3 +1,4 @@
+from .batch import StorageBatch
 from .auth_tag import AuthTagService
 from .connector import ConnectorService
 from .transaction import TransactionService
@@ -18,24 +18,27 @@ class AuthTagService(StorageService):
 
     async def add_tag_info(
         self, tag_info: Dict, key: Optional[str] = None,
-        command: Optional[str] = None
+        command: Optional[str] = None, batch=None
     ) -> Dict:
         """
         Sets tag_info using provided key. If key is not provided, will be
         created from storage_path and identity. Before setting checks if
         status of tag info is Accepted, if it is not raise an exception.
         Provided command will be used for better logging of warning error.
+        If batch is provided, tag info is stored when batch is committed.
 
         :param tag_info: Tag info returned from server side.
         :param command: Command str which will be used for better
             logging of error.
         :param key: Key which will be used for getting/storing tag info data.
+        :param batch: Storage batch in which storing will be queued.
+        :type batch: port_16.api.common.service.batch.StorageBatch
         :return: Dict with tag info data
         """
         auth_status = tag_info['status']
 
         if auth_status == AuthorizationStatus.accepted:
-            await self.store_storage_entity(tag_info, key)
+            await self.store_storage_entity(tag_info, key, batch)
             return tag_info
         else:
             log_msg = (
@@ -0,0 +1,4 @@
+from .base import StorageBackend, BatchOperation
+from .codecs import get_codec, CodecRegistry
+from .redis_backend import RedisBackend
+from .memory_backend import MemoryBackend
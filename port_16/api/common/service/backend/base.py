@@ -0,0 +1,183 @@
+from typing import Optional, List, Tuple, AsyncIterator, NamedTuple, Any
+
+
+class BatchOperation(NamedTuple):
+    """
+    Storage operation queued in batch. Name is name of backend method which
+    will be executed with key, args and hash_entity flag.
+    """
+    name: str
+    key: str
+    args: Tuple[Any, ...]
+    hash_entity: bool = False
+
+
+class StorageBackend:
+    """
+    Interface of storage engine used by StorageService. Every entity is a
+    dict stored using its key. Identities of stored entities are kept in
+    index set, which is maintained when entities are created and deleted.
+    If hash_entity is set, backend could store entity field by field, so
+    partial updates do not rewrite whole entity.
+    """
+    name = 'base'
+
+    async def get(
+        self, key: str, hash_entity: bool = False
+    ) -> Optional[dict]:
+        """
+        Returns entity stored using key or None.
+        """
+        raise NotImplementedError()
+
+    async def get_many(
+        self, keys: List[str], hash_entity: bool = False
+    ) -> List[Optional[dict]]:
+        """
+        Returns entities stored using provided keys within single round
+        trip. Not found entities are returned as None.
+        """
+        raise NotImplementedError()
+
+    async def store(
+        self, key: str, data: dict, index_key: str, member: str,
+        hash_entity: bool = False
+    ) -> None:
+        """
+        Replaces entity stored using key and adds member in index.
+        """
+        raise NotImplementedError()
+
+    async def update(
+        self, key: str, data: dict, index_key: str, member: str,
+        hash_entity: bool = False
+    ) -> dict:
+        """
+        Merges data into entity stored using key, creating it if it does
+        not exist, and returns merged entity.
+        """
+        raise NotImplementedError()
+
+    async def update_existing(
+        self, key: str, data: dict, hash_entity: bool = False
+    ) -> Optional[dict]:
+        """
+        Merges data into existing entity and returns merged entity. If
+        entity does not exist nothing is written and None is returned.
+        """
+        raise NotImplementedError()
+
+    async def pop_fields(
+        self, key: str, fields: List[str], hash_entity: bool = False
+    ) -> dict:
+        """
+        Removes fields from entity and returns theirs values.
+        """
+        raise NotImplementedError()
+
+    async def delete(
+        self, key: str, index_key: str, member: str,
+        hash_entity: bool = False
+    ) -> None:
+        """
+        Deletes entity stored using key and removes member from index.
+        """
+        raise NotImplementedError()
+
+    async def index_add(self, index_key: str, member: str) -> bool:
+        """
+        Adds member in index. Returns True if it was not already there.
+        """
+        raise NotImplementedError()
+
+    async def index_remove(self, index_key: str, member: str) -> bool:
+        """
+        Removes member from index. Returns True if it was there.
+        """
+        raise NotImplementedError()
+
+    def iter_index(
+        self, index_key: str, count: Optional[int] = None
+    ) -> AsyncIterator[str]:
+        """
+        Iterates over index members, fetching about count members within
+        one round trip.
+        """
+        raise NotImplementedError()
+
+    async def list_push(
+        self, key: str, values: List[str], max_length: int = 0
+    ) -> int:
+        """
+        Appends values to list stored using key. If max_length is provided,
+        oldest values above it are removed. Returns list length before
+        oldest values are removed.
+        """
+        raise NotImplementedError()
+
+    async def list_range(self, key: str) -> List[str]:
+        """
+        Returns all values of list stored using key, oldest first.
+        """
+        raise NotImplementedError()
+
+    async def list_pop(self, key: str, count: int) -> None:
+        """
+        Removes count oldest values of list stored using key.
+        """
+        raise NotImplementedError()
+
+    async def execute_batch(
+        self, operations: List[BatchOperation]
+    ) -> List[Any]:
+        """
+        Executes provided operations and returns theirs results. Backends
+        which support transactions execute all operations atomically,
+        within single round trip.
+        """
+        return [
+            await getattr(self, operation.name)(
+                operation.key, *operation.args,
+                hash_entity=operation.hash_entity
+            )
+            for operation in operations
+        ]
+
+    async def migrate_index(self, index_key: str) -> int:
+        """
+        Converts index stored in previous format. Returns number of
+        migrated members or -1 if nothing is migrated.
+        """
+        return -1
+
+    async def migrate_entities(
+        self, keys: List[str], hash_entity: bool = False
+    ) -> int:
+        """
+        Converts entities stored using keys in other format than hash_entity
+        flag requires, e.g. after hash storage mode is switched. Returns
+        number of converted entities.
+        """
+        return 0
+
+    async def close(self) -> None:
+        """
+        Releases resources used by backend.
+        """
+
+
+def clone(value):
+    """
+    Returns copy of JSON compatible value (dicts, lists and scalars), which
+    is considerably faster than copy.deepcopy.
+
+    :param value: Value which will be copied.
+    :return: Copied value.
+    """
+    if isinstance(value, dict):
+        return {key: clone(item) for key, item in value.items()}
+
+    if isinstance(value, (list, tuple)):
+        return [clone(item) for item in value]
+
+    return value
@@ -0,0 +1,145 @@
+import json
+from typing import Any, Dict
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+#: Values encoded with non default codecs are prefixed with header made of
+#: this byte, codec id and codec version. Valid JSON document could not
+#: start with NUL byte, so values without header are plain JSON documents.
+HEADER_MARKER = b'\x00'
+HEADER_SIZE = 3
+
+
+class Codec:
+    """
+    Serialization format of stored values. Codec with empty codec_id writes
+    plain JSON documents without header, which is format used by all
+    previous versions.
+    """
+    name = 'base'
+    codec_id = b''
+    version = b''
+
+    @property
+    def header(self) -> bytes:
+        if not self.codec_id:
+            return b''
+
+        return HEADER_MARKER + self.codec_id + self.version
+
+    def dumps(self, value: Any) -> bytes:
+        raise NotImplementedError()
+
+    def loads(self, data: bytes) -> Any:
+        raise NotImplementedError()
+
+    def encode(self, value: Any) -> bytes:
+        """
+        Serializes value and prefixes it with codec header.
+
+        :param value: JSON compatible value.
+        :return: Encoded value.
+        """
+        return self.header + self.dumps(value)
+
+
+class JsonCodec(Codec):
+    name = 'json'
+
+    def dumps(self, value: Any) -> bytes:
+        return json.dumps(value).encode()
+
+    def loads(self, data: bytes) -> Any:
+        return json.loads(data)
+
+
+class OrjsonCodec(Codec):
+    name = 'orjson'
+    codec_id = b'o'
+    version = b'1'
+
+    def __init__(self):
+        if orjson is None:
+            raise RuntimeError('orjson codec requires orjson package')
+
+    def dumps(self, value: Any) -> bytes:
+        return orjson.dumps(value)
+
+    def loads(self, data: bytes) -> Any:
+        return orjson.loads(data)
+
+
+class MsgpackCodec(Codec):
+    name = 'msgpack'
+    codec_id = b'm'
+    version = b'1'
+
+    def __init__(self):
+        if msgpack is None:
+            raise RuntimeError('msgpack codec requires msgpack package')
+
+    def dumps(self, value: Any) -> bytes:
+        return msgpack.packb(value, use_bin_type=True)
+
+    def loads(self, data: bytes) -> Any:
+        return msgpack.unpackb(data, raw=False)
+
+
+CODECS = {
+    codec_cls.name: codec_cls
+    for codec_cls in (JsonCodec, OrjsonCodec, MsgpackCodec)
+}
+
+
+class CodecRegistry:
+    """
+    Encodes values with configured codec and decodes values written with
+    any known codec, including plain JSON values without header, so stored
+    data is migrated lazily, when it is written again.
+    """
+
+    def __init__(self, codec: Codec):
+        self.codec = codec
+        self._readers: Dict[bytes, Codec] = {}
+
+    def encode(self, value: Any) -> bytes:
+        return self.codec.encode(value)
+
+    def decode(self, data: Any) -> Any:
+        if isinstance(data, str):
+            data = data.encode()
+
+        if data[:1] != HEADER_MARKER:
+            return json.loads(data)
+
+        codec_id = data[1:2]
+        reader = self._readers.get(codec_id)
+        if reader is None:
+            reader = self._readers[codec_id] = next(
+                codec_cls() for codec_cls in CODECS.values()
+                if codec_cls.codec_id == codec_id
+            )
+
+        return reader.loads(data[HEADER_SIZE:])
+
+
+def get_codec(name: str) -> CodecRegistry:
+    """
+    Creates codec registry which writes values using codec with provided
+    name.
+
+    :param name: Name of codec: json, orjson or msgpack.
+    :return: Codec registry.
+    """
+    if name not in CODECS:
+        raise ValueError('Unknown storage codec: {}'.format(name))
+
+    return CodecRegistry(CODECS[name]())
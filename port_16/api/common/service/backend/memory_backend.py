@@ -0,0 +1,112 @@
+from typing import Optional, List, AsyncIterator
+
+from .base import StorageBackend, clone
+
+
+class MemoryBackend(StorageBackend):
+    """
+    Storage backend which keeps entities in process memory, without any
+    network round trip. Entities are copied on every read and write, so
+    callers could not change stored data by accident, same as with redis.
+    Every operation is executed without awaiting, so it is atomic within
+    event loop.
+    """
+    name = 'memory'
+
+    def __init__(self):
+        self._entities = {}
+        self._indexes = {}
+        self._lists = {}
+
+    async def get(
+        self, key: str, hash_entity: bool = False
+    ) -> Optional[dict]:
+        data = self._entities.get(key)
+        return clone(data) if data is not None else None
+
+    async def get_many(
+        self, keys: List[str], hash_entity: bool = False
+    ) -> List[Optional[dict]]:
+        return [await self.get(key) for key in keys]
+
+    async def store(
+        self, key: str, data: dict, index_key: str, member: str,
+        hash_entity: bool = False
+    ) -> None:
+        self._entities[key] = clone(data)
+        self._indexes.setdefault(index_key, set()).add(member)
+
+    async def update(
+        self, key: str, data: dict, index_key: str, member: str,
+        hash_entity: bool = False
+    ) -> dict:
+        stored = self._entities.setdefault(key, {})
+        stored.update(clone(data))
+        self._indexes.setdefault(index_key, set()).add(member)
+        return clone(stored)
+
+    async def update_existing(
+        self, key: str, data: dict, hash_entity: bool = False
+    ) -> Optional[dict]:
+        stored = self._entities.get(key)
+        if stored is None:
+            return None
+
+        stored.update(clone(data))
+        return clone(stored)
+
+    async def pop_fields(
+        self, key: str, fields: List[str], hash_entity: bool = False
+    ) -> dict:
+        stored = self._entities.get(key) or {}
+        return {
+            field: stored.pop(field) for field in fields if field in stored
+        }
+
+    async def delete(
+        self, key: str, index_key: str, member: str,
+        hash_entity: bool = False
+    ) -> None:
+        self._entities.pop(key, None)
+        self._indexes.get(index_key, set()).discard(member)
+
+    async def index_add(self, index_key: str, member: str) -> bool:
+        index = self._indexes.setdefault(index_key, set())
+        added = member not in index
+        index.add(member)
+        return added
+
+    async def index_remove(self, index_key: str, member: str) -> bool:
+        index = self._indexes.get(index_key, set())
+        removed = member in index
+        index.discard(member)
+        return removed
+
+    async def iter_index(
+        self, index_key: str, count: Optional[int] = None
+    ) -> AsyncIterator[str]:
+        for member in list(self._indexes.get(index_key, ())):
+            yield member
+
+    async def list_push(
+        self, key: str, values: List[str], max_length: int = 0
+    ) -> int:
+        stored = self._lists.setdefault(key, [])
+        stored.extend(values)
+        length = len(stored)
+        if max_length and length > max_length:
+            del stored[:length - max_length]
+
+        return length
+
+    async def list_range(self, key: str) -> List[str]:
+        return list(self._lists.get(key, ()))
+
+    async def list_pop(self, key: str, count: int) -> None:
+        stored = self._lists.get(key)
+        if stored is None:
+            return
+
+        del stored[:count]
+        if not stored:
+            del self._lists[key]
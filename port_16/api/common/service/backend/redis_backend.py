@@ -0,0 +1,495 @@
+import json
+import asyncio
+import inspect
+import logging
+from typing import Optional, List, AsyncIterator, Any, Dict
+
+from aioredis import MultiExecError, WatchVariableError
+
+from .base import StorageBackend, BatchOperation, clone
+from .codecs import CodecRegistry, get_codec
+
+logger = logging.getLogger(__name__)
+
+#: Operations which read string entity before it is written again, theirs
+#: keys are watched, so concurrent writes are not lost
+READ_WRITE_OPERATIONS = ('update', 'update_existing', 'pop_fields')
+#: Max attempts of batch whose watched keys are changed by other client.
+#: Every failed attempt means other client has written, so attempts run out
+#: only with more concurrent writers of same keys.
+WATCH_ATTEMPTS = 50
+
+# Merges provided fields into existing hash and returns all hash fields. If
+# hash does not exist nothing is written and nil is returned.
+UPDATE_EXISTING_HASH_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return nil
+end
+for i = 1, #ARGV, 2 do
+    redis.call('HSET', KEYS[1], ARGV[i], ARGV[i + 1])
+end
+return redis.call('HGETALL', KEYS[1])
+"""
+
+
+class RedisBackend(StorageBackend):
+    """
+    Storage backend which keeps entities in redis, using aioredis client.
+    Entities are stored as encoded strings or, for hash entities, as redis
+    hashes with encoded field values. Values are encoded with provided codec
+    (JSON by default) and values written by any other codec are accepted
+    on read. Index is stored as redis set.
+    """
+    name = 'redis'
+
+    def __init__(
+        self, redis_client: Any, codec: Optional[CodecRegistry] = None
+    ):
+        self.redis_client = redis_client
+        self.codec = codec or get_codec('json')
+
+    def _encode_hash(self, data: dict) -> dict:
+        """
+        Encodes every value of provided dict so it could be stored as
+        redis hash field.
+
+        :param data: Dict which will be encoded.
+        :return: Dict with encoded values.
+        :rtype: dict
+        """
+        return {
+            str(field): self.codec.encode(value)
+            for field, value in data.items()
+        }
+
+    def _decode_hash(self, data: dict) -> Optional[dict]:
+        """
+        Decodes hash fields returned from redis. Empty hash is treated as
+        not existing entity.
+
+        :param data: Hash fields returned from redis.
+        :return: Decoded dict or None.
+        :rtype: dict | None
+        """
+        if not data:
+            return None
+
+        return {
+            (field.decode() if isinstance(field, bytes) else field):
+                self.codec.decode(value)
+            for field, value in data.items()
+        }
+
+    async def get(
+        self, key: str, hash_entity: bool = False
+    ) -> Optional[dict]:
+        if hash_entity:
+            return self._decode_hash(
+                await self.redis_client.hgetall(key)
+            )
+
+        data = await self.redis_client.get(key)
+        return self.codec.decode(data) if data is not None else None
+
+    async def get_many(
+        self, keys: List[str], hash_entity: bool = False
+    ) -> List[Optional[dict]]:
+        if hash_entity:
+            pipeline = self.redis_client.pipeline()
+            replies = [
+                pipeline.hgetall(key) for key in keys
+            ]
+            await pipeline.execute()
+            return [self._decode_hash(await reply) for reply in replies]
+
+        return [
+            self.codec.decode(value) if value is not None else None
+            for value in await self.redis_client.mget(*keys)
+        ]
+
+    def _queue_store(
+        self, transaction: Any, key: str, data: dict, index_key: str,
+        member: str, hash_entity: bool = False
+    ) -> None:
+        if hash_entity:
+            transaction.delete(key)
+            if data:
+                transaction.hmset_dict(key, self._encode_hash(data))
+        else:
+            content = (
+                self.codec.encode(data) if isinstance(data, dict) else data
+            )
+            transaction.set(key, content)
+
+        transaction.sadd(index_key, member)
+
+    def _queue_update(
+        self, transaction: Any, key: str, data: dict, index_key: str,
+        member: str, hash_entity: bool = False,
+        current: Optional[dict] = None
+    ) -> Any:
+        if hash_entity:
+            # fields are written and merged hash is read within same
+            # round trip, without get-merge-set cycle
+            if data:
+                transaction.hmset_dict(key, self._encode_hash(data))
+            merged = transaction.hgetall(key)
+            transaction.sadd(index_key, member)
+            return merged
+
+        merged = current if current is not None else {}
+        merged.update(data)
+        transaction.set(key, self.codec.encode(merged))
+        if current is None:
+            # entity is created, so it is added in index as well
+            transaction.sadd(index_key, member)
+        return clone(merged)
+
+    def _queue_update_existing(
+        self, transaction: Any, key: str, data: dict,
+        hash_entity: bool = False, current: Optional[dict] = None
+    ) -> Any:
+        if hash_entity:
+            args = []
+            for field, value in self._encode_hash(data).items():
+                args.extend([field, value])
+            if not args:
+                return transaction.hgetall(key)
+            return transaction.eval(
+                UPDATE_EXISTING_HASH_SCRIPT, keys=[key], args=args
+            )
+
+        if current is None:
+            return None
+
+        current.update(data)
+        transaction.set(key, self.codec.encode(current))
+        return clone(current)
+
+    def _queue_pop_fields(
+        self, transaction: Any, key: str, fields: List[str],
+        hash_entity: bool = False, current: Optional[dict] = None
+    ) -> Any:
+        if hash_entity:
+            values = transaction.hmget(key, *fields)
+            transaction.hdel(key, *fields)
+            return values
+
+        current = current or {}
+        removed = {
+            field: current.pop(field) for field in fields if field in current
+        }
+        if removed:
+            transaction.set(key, self.codec.encode(current))
+        return removed
+
+    def _queue_delete(
+        self, transaction: Any, key: str, index_key: str, member: str,
+        hash_entity: bool = False
+    ) -> None:
+        transaction.srem(index_key, member)
+        transaction.delete(key)
+
+    @staticmethod
+    def _is_watched(operation: BatchOperation) -> bool:
+        return (
+            not operation.hash_entity and
+            operation.name in READ_WRITE_OPERATIONS
+        )
+
+    async def execute_batch(
+        self, operations: List[BatchOperation]
+    ) -> List[Any]:
+        # string entities which are read and written again are read first,
+        # all of them within single round trip, and watched until
+        # transaction is executed
+        read_keys = list(dict.fromkeys(
+            operation.key for operation in operations
+            if self._is_watched(operation)
+        ))
+        if not read_keys:
+            return await self._execute(self.redis_client, operations, {})
+
+        for attempt in range(1, WATCH_ATTEMPTS + 1):
+            with await self.redis_client as connection:
+                try:
+                    current = await self._watch_read(connection, read_keys)
+                    return await self._execute(
+                        connection, operations, current
+                    )
+                except MultiExecError as error:
+                    if not self._is_watch_error(error):
+                        raise
+                    if attempt == WATCH_ATTEMPTS:
+                        raise
+                    logger.info(
+                        'Keys {} changed while batch was prepared, '
+                        'retrying (attempt {})'.format(read_keys, attempt)
+                    )
+                except Exception:
+                    # connection is returned to pool without watched keys
+                    await connection.unwatch()
+                    raise
+
+    @staticmethod
+    def _is_watch_error(error: MultiExecError) -> bool:
+        if isinstance(error, WatchVariableError):
+            return True
+
+        # some servers reply with error per queued command
+        errors = error.args[1] if len(error.args) > 1 else ()
+        return any(isinstance(item, WatchVariableError) for item in errors)
+
+    async def _watch_read(
+        self, connection: Any, keys: List[str]
+    ) -> Dict[str, Optional[dict]]:
+        """
+        Watches provided string entities and reads them. WATCH and MGET are
+        sent together, so read-modify-write batch needs two round trips,
+        same as plain GET and SET.
+
+        :param connection: Connection on which keys are watched.
+        :param keys: Keys of read entities.
+        :return: Decoded entities by key.
+        """
+        _, values = await asyncio.gather(
+            connection.watch(*keys), connection.mget(*keys)
+        )
+        return {
+            key: self.codec.decode(value) if value is not None else None
+            for key, value in zip(keys, values)
+        }
+
+    async def _execute(
+        self, client: Any, operations: List[BatchOperation],
+        current: Dict[str, Optional[dict]]
+    ) -> List[Any]:
+        """
+        Executes operations within single transaction of provided client.
+
+        :param client: Redis client or connection with watched keys.
+        :param operations: Executed operations.
+        :param current: Read entities by key, changed as operations are
+            queued.
+        :return: Results of operations.
+        """
+        transaction = client.multi_exec()
+        replies = []
+        for operation in operations:
+            queue = getattr(self, '_queue_{}'.format(operation.name))
+            kwargs = {'hash_entity': operation.hash_entity}
+            if self._is_watched(operation):
+                # entity changed by previous operation on same key is
+                # passed to next one
+                kwargs['current'] = current.get(operation.key)
+            reply = queue(
+                transaction, operation.key, *operation.args, **kwargs
+            )
+            replies.append(reply)
+            if operation.hash_entity:
+                continue
+            if operation.name == 'store':
+                current[operation.key] = clone(operation.args[0])
+            elif operation.name in (
+                'update', 'update_existing'
+            ) and reply is not None:
+                current[operation.key] = clone(reply)
+            elif operation.name == 'delete':
+                current[operation.key] = None
+
+        try:
+            await transaction.execute()
+        except Exception:
+            # replies of discarded transaction fail with same error, they
+            # are retrieved so the error is not logged again
+            await asyncio.gather(*(
+                reply for reply in replies if inspect.isawaitable(reply)
+            ), return_exceptions=True)
+            raise
+
+        results = []
+        for operation, reply in zip(operations, replies):
+            if inspect.isawaitable(reply):
+                reply = await reply
+            if operation.hash_entity and operation.name == 'update':
+                reply = self._decode_hash(reply)
+            elif (
+                operation.hash_entity and
+                operation.name == 'update_existing'
+            ):
+                if isinstance(reply, list):
+                    reply = dict(zip(reply[::2], reply[1::2]))
+                reply = self._decode_hash(reply)
+            elif operation.name == 'pop_fields' and operation.hash_entity:
+                reply = {
+                    field: self.codec.decode(value)
+                    for field, value in zip(operation.args[0], reply)
+                    if value is not None
+                }
+            results.append(reply)
+
+        return results
+
+    async def store(
+        self, key: str, data: dict, index_key: str, member: str,
+        hash_entity: bool = False
+    ) -> None:
+        await self.execute_batch([BatchOperation(
+            'store', key, (data, index_key, member), hash_entity
+        )])
+
+    async def update(
+        self, key: str, data: dict, index_key: str, member: str,
+        hash_entity: bool = False
+    ) -> dict:
+        merged, = await self.execute_batch([BatchOperation(
+            'update', key, (data, index_key, member), hash_entity
+        )])
+        return merged
+
+    async def update_existing(
+        self, key: str, data: dict, hash_entity: bool = False
+    ) -> Optional[dict]:
+        merged, = await self.execute_batch([BatchOperation(
+            'update_existing', key, (data,), hash_entity
+        )])
+        return merged
+
+    async def pop_fields(
+        self, key: str, fields: List[str], hash_entity: bool = False
+    ) -> dict:
+        removed, = await self.execute_batch([BatchOperation(
+            'pop_fields', key, (fields,), hash_entity
+        )])
+        return removed
+
+    async def delete(
+        self, key: str, index_key: str, member: str,
+        hash_entity: bool = False
+    ) -> None:
+        await self.execute_batch([BatchOperation(
+            'delete', key, (index_key, member), hash_entity
+        )])
+
+    async def index_add(self, index_key: str, member: str) -> bool:
+        return bool(await self.redis_client.sadd(index_key, member))
+
+    async def index_remove(self, index_key: str, member: str) -> bool:
+        return bool(await self.redis_client.srem(index_key, member))
+
+    async def iter_index(
+        self, index_key: str, count: Optional[int] = None
+    ) -> AsyncIterator[str]:
+        async for member in self.redis_client.isscan(index_key, count=count):
+            yield member.decode() if isinstance(member, bytes) else member
+
+    async def list_push(
+        self, key: str, values: List[str], max_length: int = 0
+    ) -> int:
+        transaction = self.redis_client.multi_exec()
+        length = transaction.rpush(key, *values)
+        if max_length:
+            transaction.ltrim(key, -max_length, -1)
+        await transaction.execute()
+        return await length
+
+    async def list_range(self, key: str) -> List[str]:
+        return await self.redis_client.lrange(key, 0, -1, encoding='utf-8')
+
+    async def list_pop(self, key: str, count: int) -> None:
+        await self.redis_client.ltrim(key, count, -1)
+
+    async def migrate_index(self, index_key: str) -> int:
+        key_type = await self.redis_client.type(index_key)
+        if key_type not in ('string', b'string'):
+            return -1
+
+        all_keys = json.loads(await self.redis_client.get(index_key))
+        transaction = self.redis_client.multi_exec()
+        transaction.delete(index_key)
+        if all_keys:
+            transaction.sadd(index_key, *all_keys)
+        await transaction.execute()
+        return len(all_keys)
+
+    async def migrate_entities(
+        self, keys: List[str], hash_entity: bool = False
+    ) -> int:
+        stale = list(
+            await self._read_stale(self.redis_client, keys, hash_entity)
+        )
+        if not stale:
+            return 0
+
+        for attempt in range(1, WATCH_ATTEMPTS + 1):
+            with await self.redis_client as connection:
+                try:
+                    # entities could be written by other worker meanwhile,
+                    # so they are read again and rewritten while watched
+                    await connection.watch(*stale)
+                    entities = await self._read_stale(
+                        connection, stale, hash_entity
+                    )
+                    transaction = connection.multi_exec()
+                    for key, data in entities.items():
+                        transaction.delete(key)
+                        if data and hash_entity:
+                            transaction.hmset_dict(
+                                key, self._encode_hash(data)
+                            )
+                        elif data:
+                            transaction.set(key, self.codec.encode(data))
+                    await transaction.execute()
+                    return len(entities)
+                except MultiExecError as error:
+                    if not self._is_watch_error(error):
+                        raise
+                    if attempt == WATCH_ATTEMPTS:
+                        raise
+                except Exception:
+                    await connection.unwatch()
+                    raise
+
+    async def _read_stale(
+        self, client: Any, keys: List[str], hash_entity: bool
+    ) -> Dict[str, Optional[dict]]:
+        """
+        Reads entities which are stored in other format than hash_entity
+        flag requires, within single round trip.
+
+        :param client: Redis client or connection with watched keys.
+        :param keys: Keys of checked entities.
+        :param hash_entity: Required format of entities.
+        :return: Decoded entities stored in other format by key.
+        """
+        if not keys:
+            return {}
+
+        pipeline = client.pipeline()
+        for key in keys:
+            pipeline.type(key)
+            if hash_entity:
+                pipeline.get(key)
+            else:
+                pipeline.hgetall(key)
+        # reads of entities already stored in required format fail with
+        # WRONGTYPE error, theirs values are not needed
+        replies = await pipeline.execute(return_exceptions=True)
+        stale_type = 'string' if hash_entity else 'hash'
+        entities = {}
+        for key, key_type, value in zip(keys, replies[::2], replies[1::2]):
+            if isinstance(key_type, bytes):
+                key_type = key_type.decode()
+            if key_type != stale_type:
+                continue
+            if hash_entity:
+                entities[key] = self.codec.decode(value)
+            else:
+                entities[key] = self._decode_hash(value)
+
+        return entities
+
+    async def close(self) -> None:
+        self.redis_client.close()
+        await self.redis_client.wait_closed()
+        logger.info('Redis Connection closed...')
@@ -0,0 +1,140 @@
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Optional, Any
+
+import aioredis
+from aioredis import ConnectionsPool
+
+logger = logging.getLogger(__name__)
+
+
+class PoolStats:
+    """
+    Connection pool wait statistics. Wait times of last samples_size
+    acquisitions are kept for calculating percentiles.
+    """
+
+    def __init__(self, samples_size: int = 1024):
+        self.acquisitions = 0
+        self.waiting = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.samples = deque(maxlen=samples_size)
+
+    def observe(self, wait_time: float) -> None:
+        self.acquisitions += 1
+        self.total_wait += wait_time
+        self.max_wait = max(self.max_wait, wait_time)
+        self.samples.append(wait_time)
+
+    def percentile(self, percent: float) -> float:
+        if not self.samples:
+            return 0.0
+
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(len(ordered) * percent / 100))
+        return ordered[index]
+
+
+class InstrumentedConnectionsPool(ConnectionsPool):
+    """
+    Connections pool which measures how long commands wait for free
+    connection and optionally limits that time with acquire_timeout.
+    """
+    acquire_timeout: Optional[float] = None
+
+    def __init__(self, *args, **kwargs):
+        super(InstrumentedConnectionsPool, self).__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    async def acquire(self, command=None, args=()):
+        start = time.perf_counter()
+        self.stats.waiting += 1
+        try:
+            coro = super(InstrumentedConnectionsPool, self).acquire(
+                command, args
+            )
+            if self.acquire_timeout:
+                return await asyncio.wait_for(coro, self.acquire_timeout)
+            return await coro
+        except asyncio.TimeoutError:
+            self.stats.timeouts += 1
+            logger.warning(
+                'Redis connection not acquired within {} seconds'.format(
+                    self.acquire_timeout
+                )
+            )
+            raise
+        finally:
+            self.stats.waiting -= 1
+            self.stats.observe(time.perf_counter() - start)
+
+    def get_stats(self) -> dict:
+        """
+        Returns pool utilisation and wait time statistics.
+
+        :return: Dict with pool statistics.
+        """
+        in_use = self.size - self.freesize
+        stats = self.stats
+        return {
+            'minsize': self.minsize,
+            'maxsize': self.maxsize,
+            'size': self.size,
+            'freesize': self.freesize,
+            'in_use': in_use,
+            'utilisation': in_use / self.maxsize if self.maxsize else 0.0,
+            'waiting': stats.waiting,
+            'acquisitions': stats.acquisitions,
+            'timeouts': stats.timeouts,
+            'wait_avg': (
+                stats.total_wait / stats.acquisitions
+                if stats.acquisitions else 0.0
+            ),
+            'wait_max': stats.max_wait,
+            'wait_p50': stats.percentile(50),
+            'wait_p95': stats.percentile(95),
+            'wait_p99': stats.percentile(99),
+        }
+
+
+async def create_redis_pool(
+    address: str,
+    db: int,
+    minsize: int = 1,
+    maxsize: int = 10,
+    connect_timeout: Optional[float] = None,
+    acquire_timeout: Optional[float] = None
+) -> Any:
+    """
+    Creates redis client which uses instrumented connections pool. Address
+    could be redis URL (redis://host:port), unix socket URL
+    (unix:///path/to/redis.sock) or unix socket path.
+
+    :param address: Redis address.
+    :param db: Redis database number.
+    :param minsize: Minimal number of pool connections.
+    :param maxsize: Maximal number of pool connections.
+    :param connect_timeout: Timeout of connection creation in seconds.
+    :param acquire_timeout: Max number of seconds command could wait for
+        free pool connection.
+    :return: Redis client.
+    :rtype: aioredis.Redis
+    """
+    if address.startswith('unix://'):
+        address = address[len('unix://'):]
+
+    redis = await aioredis.create_redis_pool(
+        address, db=db, minsize=minsize, maxsize=maxsize,
+        timeout=connect_timeout, pool_cls=InstrumentedConnectionsPool
+    )
+    redis.connection.acquire_timeout = acquire_timeout
+    logger.info(
+        'Redis pool created for {} db {} (minsize: {}, maxsize: {})'.format(
+            address, db, minsize, maxsize
+        )
+    )
+    return redis
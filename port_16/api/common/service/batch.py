@@ -0,0 +1,102 @@
+import logging
+from time import perf_counter
+from typing import Any, List
+
+from .cache import MISSING
+from .backend import BatchOperation
+from .storage import STORAGE_LATENCY
+
+logger = logging.getLogger(__name__)
+
+
+class StorageBatch:
+    """
+    Unit of work which collects storage mutations made by storage services
+    and writes all of them using single backend batch (single MULTI/EXEC
+    round trip with redis backend) when committed. If batch is rolled back,
+    collected mutations are discarded and nothing is written.
+
+    Could be used as async context manager, which commits batch if block
+    finishes without exception and rolls it back otherwise.
+    """
+
+    def __init__(self):
+        self._operations = []
+        self._services = []
+        self.results = None
+
+    def __len__(self):
+        return len(self._operations)
+
+    def add(self, service: Any, operation: BatchOperation) -> None:
+        """
+        Queues operation made by provided storage service.
+
+        :param service: Storage service which queues operation.
+        :type service: port_16.api.common.service.storage.StorageService
+        :param operation: Queued backend operation.
+        """
+        if self.results is not None:
+            raise RuntimeError('Storage batch is already committed')
+
+        self._operations.append(operation)
+        self._services.append(service)
+
+    async def commit(self) -> List[Any]:
+        """
+        Writes all queued operations and updates storage cache with theirs
+        results.
+
+        :return: List of results of queued operations.
+        """
+        if not self._operations:
+            self.results = []
+            return self.results
+
+        backend = self._services[0].backend
+        logger.info(
+            'Committing storage batch with {} operations'.format(
+                len(self._operations)
+            )
+        )
+        start = perf_counter()
+        try:
+            self.results = await backend.execute_batch(self._operations)
+        finally:
+            STORAGE_LATENCY.labels('BATCH', 'commit').observe(
+                perf_counter() - start
+            )
+        for service, operation, result in zip(
+            self._services, self._operations, self.results
+        ):
+            if operation.name == 'store':
+                data = operation.args[0]
+            elif operation.name in ('update', 'update_existing'):
+                data = result
+            else:
+                data = MISSING
+            await service._write_cache(operation.key, data)
+
+        return self.results
+
+    def rollback(self) -> None:
+        """
+        Discards all queued operations.
+        """
+        if self._operations:
+            logger.info(
+                'Rolling back storage batch with {} operations'.format(
+                    len(self._operations)
+                )
+            )
+        self._operations = []
+        self._services = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            await self.commit()
+        else:
+            self.rollback()
@@ -0,0 +1,157 @@
+import time
+import uuid
+import copy
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Optional
+
+logger = logging.getLogger(__name__)
+
+INVALIDATION_CHANNEL = 'PORT-16-CACHE-INVALIDATION'
+MISSING = object()
+
+
+class StorageCache:
+    """
+    In-process LRU cache for stored entities. Entities are stored using their
+    redis key and are evicted when cache size reaches max_size or when
+    entity is older than ttl seconds. If redis client is provided, every
+    invalidation is published to other workers and invalidations from other
+    workers are received using redis pub/sub.
+    """
+
+    def __init__(
+        self,
+        max_size: int,
+        ttl: Optional[float] = None,
+        redis_client: Any = None,
+        channel: str = INVALIDATION_CHANNEL
+    ):
+        self.max_size = max_size
+        self.ttl = ttl or None
+        self.redis_client = redis_client
+        self.channel = channel
+        self.instance_id = uuid.uuid4().hex
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()
+        self._listener = None
+
+    def get(self, key: str) -> Any:
+        """
+        Returns copy of cached entity with provided key or MISSING if entity
+        is not cached or is expired.
+
+        :param key: Redis key of entity.
+        :return: Cached entity or MISSING.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return MISSING
+
+        expires_at, value = entry
+        if expires_at is not None and expires_at < time.monotonic():
+            del self._entries[key]
+            self.evictions += 1
+            self.misses += 1
+            return MISSING
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return copy.deepcopy(value)
+
+    def set(self, key: str, value: Any) -> None:
+        """
+        Stores copy of provided entity using key. Least recently used entity
+        is evicted if cache is full.
+
+        :param key: Redis key of entity.
+        :param value: Entity which will be cached.
+        """
+        expires_at = (
+            time.monotonic() + self.ttl if self.ttl is not None else None
+        )
+        self._entries[key] = (expires_at, copy.deepcopy(value))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def discard(self, key: str) -> None:
+        """
+        Removes entity with provided key from local cache only.
+
+        :param key: Redis key of entity.
+        """
+        if self._entries.pop(key, None) is not None:
+            self.invalidations += 1
+
+    async def write(self, key: str, value: Any = MISSING) -> None:
+        """
+        Updates local cache after entity with provided key is written in
+        redis and notifies other workers. If value is not provided entity is
+        removed from local cache.
+
+        :param key: Redis key of entity.
+        :param value: Written entity.
+        """
+        if value is MISSING or value is None:
+            self.discard(key)
+        else:
+            self.set(key, value)
+
+        if self.redis_client is not None:
+            await self.redis_client.publish(
+                self.channel, '{}:{}'.format(self.instance_id, key)
+            )
+
+    def stats(self) -> dict:
+        """
+        Returns cache counters.
+
+        :return: Dict with cache size and hit/miss/eviction counters.
+        """
+        return {
+            'size': len(self._entries),
+            'max_size': self.max_size,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+        }
+
+    async def start_listener(self) -> None:
+        """
+        Subscribes to invalidation channel and starts background task which
+        removes entities invalidated by other workers.
+        """
+        if self.redis_client is None or self._listener is not None:
+            return
+
+        channel, = await self.redis_client.subscribe(self.channel)
+        self._listener = asyncio.ensure_future(self._listen(channel))
+        logger.info(
+            'Listening cache invalidations on channel {}'.format(self.channel)
+        )
+
+    async def stop_listener(self) -> None:
+        """
+        Stops invalidation background task and unsubscribes from channel.
+        """
+        if self._listener is None:
+            return
+
+        self._listener.cancel()
+        self._listener = None
+        await self.redis_client.unsubscribe(self.channel)
+
+    async def _listen(self, channel: Any) -> None:
+        async for message in channel.iter(encoding='utf-8'):
+            instance_id, _, key = message.partition(':')
+            if instance_id != self.instance_id:
+                self.discard(key)
@@ -15,23 +15,40 @@ class ChargePointService(StorageService):
     in/from redis storage.
     """
     MAIN_PATH = 'CHARGE_POINT'
+    HASH_ENTITY = True
 
     async def store_entity(
-        self, data: ChargingPointModel, key: Optional[str] = None
+        self, data: ChargingPointModel, key: Optional[str] = None,
+        batch=None
     ):
         """
         Sets ChargingPointModel in redis using key. If key is not provided,
-        will be created from storage_path and identity.
+        will be created from storage_path and identity. If batch is
+        provided, model is stored when batch is committed.
 
         :param data: ChargingPointModel model which will be stored in redis.
         :type data: ChargingPointModel
         :param key: Key which will be used for storing value.
+        :param batch: Storage batch in which operation will be queued.
+        :type batch: port_16.api.common.service.batch.StorageBatch
         :return: Sets and returns data in redis.
         :rtype: ChargingPointModel
         """
-        await self.store_storage_entity(data.dict(), key)
+        await self.store_storage_entity(data.dict(), key, batch)
         return data
 
+    @staticmethod
+    def to_model(data: dict) -> ChargingPointModel:
+        """
+        Creates ChargingPointModel from stored data. Stored data is
+        validated, because it could be written by older versions or changed
+        outside of application.
+
+        :param data: Stored charging point data.
+        :return: ChargingPointModel instance.
+        """
+        return ChargingPointModel.parse_obj(data)
+
     async def get_entity(self, key: Optional[str] = None):
         """
         Gets ChargingPointModel from redis using key. If key is not provided,
@@ -43,7 +60,7 @@ class ChargePointService(StorageService):
         """
         cp_data = await self.get_storage_entity(key)
         if cp_data is not None:
-            return ChargingPointModel(**cp_data)
+            return self.to_model(cp_data)
 
         return None
 
@@ -62,13 +79,11 @@ class ChargePointService(StorageService):
         :return: Sets and returns data from redis as model instance .
         :rtype: ChargingPointModel
         """
-        await self.validate_get_entity(key)
-        merged_data = (
-            await super(ChargePointService, self).update_storage_entity(
-                data, key
-            )
-        )
-        return ChargingPointModel(**merged_data)
+        merged_data = await self.update_existing_storage_entity(data, key)
+        if merged_data is None:
+            self._raise_not_found(key)
+
+        return self.to_model(merged_data)
 
     async def validate_get_entity(self, key: Optional[str] = None):
         """
@@ -82,16 +97,25 @@ class ChargePointService(StorageService):
         """
         model = await self.get_entity(key)
         if model is None:
-            the_key = key or self.entity_key
-            logger.warning(
-                'Charging point not found in redis db '
-                'with provided key: {}'.format(the_key)
-            )
-            raise HTTPException(
-                status_code=404,
-                detail=(
-                    f'Charging point with id {the_key} not found in system'
-                )
-            )
+            self._raise_not_found(key)
 
         return model
+
+    def _raise_not_found(self, key: Optional[str] = None):
+        """
+        Logs and raises NotFound exception for charge point stored using
+        provided key.
+
+        :param key: Key which was used for getting value.
+        """
+        the_key = key or self.entity_key
+        logger.warning(
+            'Charging point not found in redis db '
+            'with provided key: {}'.format(the_key)
+        )
+        raise HTTPException(
+            status_code=404,
+            detail=(
+                f'Charging point with id {the_key} not found in system'
+            )
+        )
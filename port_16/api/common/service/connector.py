@@ -15,6 +15,7 @@ class ConnectorService(StorageService):
     in/from redis storage.
     """
     MAIN_PATH = 'CONNECTOR'
+    HASH_ENTITY = True
 
     async def start_charging_point(
         self, connector_number: int, key: Optional[str] = None
@@ -1,18 +1,53 @@
 import inject
 
-import json
 import logging
-from typing import Optional
+import functools
+from time import perf_counter
+from typing import Optional, Iterable, List, AsyncIterator, Tuple
+
+from port_16 import config
+from port_16.metrics import Histogram
+from .cache import MISSING
+from .backend import BatchOperation
 
 logger = logging.getLogger(__name__)
 
+STORAGE_LATENCY = Histogram(
+    'port16_storage_operation_seconds',
+    'Latency of storage service operations',
+    ('main_path', 'operation')
+)
+
+
+def instrumented(method):
+    """
+    Decorator which records latency and number of calls of storage service
+    method into STORAGE_LATENCY histogram, labelled by storage path and
+    method name.
+    """
+    operation = method.__name__
+
+    @functools.wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        start = perf_counter()
+        try:
+            return await method(self, *args, **kwargs)
+        finally:
+            STORAGE_LATENCY.labels(self.MAIN_PATH, operation).observe(
+                perf_counter() - start
+            )
+
+    return wrapper
+
 
 class StorageService:
     """
     This class will be used for storing and retrieving data in/from redis
-    storage.
+    storage. Storage engine is provided by configured storage backend.
     """
     MAIN_PATH = 'STORAGE'
+    #: Entities of this storage path could be stored as redis hashes
+    HASH_ENTITY = False
 
     def __init__(
         self,
@@ -21,7 +56,11 @@ class StorageService:
     ):
         self.identity = identity
         self.storage_path = storage_path or self.MAIN_PATH
-        self.redis_client = inject.instance('redis')
+        #: :type: :class:`port_16.api.common.service.backend.StorageBackend`
+        self.backend = inject.instance('storage_backend')
+        #: :type: :class:`port_16.api.common.service.cache.StorageCache`
+        self.cache = inject.instance('storage_cache')
+        self.hash_storage = self.HASH_ENTITY and config.STORAGE_HASH_MODE
 
     @property
     def entity_key(self):
@@ -36,14 +75,28 @@ class StorageService:
     @property
     def all_keys_key(self):
         """
-        Creates all_keys key which will be used for getting/storing all
-        entity keys list.
+        Creates all_keys key which will be used for getting/storing set of
+        all entity keys.
 
         :return: All keys key.
         :rtype: str
         """
         return '{}-KEYS'.format(self.storage_path)
 
+    async def _write_cache(self, the_key: str, data=MISSING):
+        """
+        Updates cache after entity with provided key is written. If data is
+        not provided, entity is invalidated in cache.
+
+        :param the_key: Key of written entity.
+        :param data: Written entity data.
+        """
+        if self.cache is not None:
+            await self.cache.write(
+                the_key, data if isinstance(data, dict) else MISSING
+            )
+
+    @instrumented
     async def get_all_keys(self):
         """
         Returns all keys stored within storage_path.
@@ -51,52 +104,104 @@ class StorageService:
         :return: Returns all keys stored within storage_path.
         :rtype: list of str
         """
-        data = await self.redis_client.get(self.all_keys_key)
-        if data is not None:
-            data = json.loads(data)
-        else:
-            data = []
-
-        return data
+        return [
+            key async for key in self.backend.iter_index(
+                self.all_keys_key, count=1000
+            )
+        ]
 
+    @instrumented
     async def add_new_key(self, key: Optional[str] = None):
         """
-        Adds and stores provided key in all_keys list. If key is not provided,
-        identity value will be used.
+        Adds provided key in all_keys set. If key is not provided, identity
+        value will be used.
 
         :param key: Key which will be used for storing. If is not provided,
             identity value will be used.
-        :return: List of updated list.
-        :rtype: list of str
+        :return: True if key is added, False if it was already stored.
+        :rtype: bool
         """
         new_key = key or self.identity
-        all_keys = await self.get_all_keys()
-        if new_key not in all_keys:
-            all_keys.append(new_key)
-            content = json.dumps(all_keys)
-            await self.redis_client.set(self.all_keys_key, content)
-
-        return all_keys
+        return await self.backend.index_add(self.all_keys_key, new_key)
 
+    @instrumented
     async def remove_key(self, key: Optional[str] = None):
         """
-        Removes provided key in all_keys list and stores it in storage. If
-        key is not provided, identity value will be used.
+        Removes provided key from all_keys set. If key is not provided,
+        identity value will be used.
 
-        :param key: Key which will be used for updating list. If is
-            not provided, identity value will be used.
-        :return: List of updated list.
-        :rtype: list of str
+        :param key: Key which will be removed. If is not provided, identity
+            value will be used.
+        :return: True if key is removed, False if it was not stored.
+        :rtype: bool
         """
         removing_key = key or self.identity
-        all_keys = await self.get_all_keys()
-        if removing_key in all_keys:
-            all_keys.remove(removing_key)
-            content = json.dumps(all_keys)
-            await self.redis_client.set(self.all_keys_key, content)
+        return await self.backend.index_remove(
+            self.all_keys_key, removing_key
+        )
+
+    @instrumented
+    async def migrate_keys_index(self):
+        """
+        Converts all_keys index stored as JSON list (previous storage format)
+        into redis set. Index which is already a set is left untouched.
+
+        :return: True if index is migrated.
+        :rtype: bool
+        """
+        migrated = await self.backend.migrate_index(self.all_keys_key)
+        if migrated < 0:
+            return False
+
+        logger.info(
+            'Keys index {} migrated to redis set with {} keys'.format(
+                self.all_keys_key, migrated
+            )
+        )
+        return True
+
+    @instrumented
+    async def migrate_entities_format(self, chunk_size: Optional[int] = None):
+        """
+        Converts entities within storage path which are stored in other
+        format than STORAGE_HASH_MODE requires (redis strings or hashes),
+        so switching the mode does not make stored entities unreadable.
+        Entities are checked in chunks, one round trip per chunk.
+
+        :param chunk_size: Number of entities checked within one round trip.
+            If not provided, STORAGE_BULK_CHUNK_SIZE config value is used.
+        :return: Number of converted entities.
+        :rtype: int
+        """
+        if not self.HASH_ENTITY:
+            return 0
+
+        chunk_size = chunk_size or config.STORAGE_BULK_CHUNK_SIZE
+        migrated = 0
+        chunk = []
+        async for identity in self.backend.iter_index(
+            self.all_keys_key, count=chunk_size
+        ):
+            chunk.append('{}-{}'.format(self.storage_path, identity))
+            if len(chunk) >= chunk_size:
+                migrated += await self.backend.migrate_entities(
+                    chunk, self.hash_storage
+                )
+                chunk = []
+        migrated += await self.backend.migrate_entities(
+            chunk, self.hash_storage
+        )
 
-        return all_keys
+        if migrated:
+            logger.info(
+                '{} entities of {} converted to {} format'.format(
+                    migrated, self.storage_path,
+                    'hash' if self.hash_storage else 'string'
+                )
+            )
+        return migrated
 
+    @instrumented
     async def get_all_storage_entities(self):
         """
         Gets all stored entities within storage path.
@@ -105,15 +210,81 @@ class StorageService:
         :rtype: dict
         """
         result = {}
-        for key in await self.get_all_keys():
-            result.update({
-                key: json.loads(await self.redis_client.get(
-                    '{}-{}'.format(self.storage_path, key)
-                ))
-            })
+        async for key, data in self.iter_storage_entities():
+            result.update({key: data})
+
+        return result
+
+    async def iter_storage_entities(
+        self, chunk_size: Optional[int] = None
+    ) -> AsyncIterator[Tuple[str, dict]]:
+        """
+        Iterates over all stored entities within storage path. Keys are
+        scanned and entities are fetched in chunks, one round trip per
+        chunk, so memory usage does not depend on number of entities.
+
+        :param chunk_size: Number of entities fetched within one round trip.
+            If not provided, STORAGE_BULK_CHUNK_SIZE config value is used.
+        :return: Async iterator of identity and entity data pairs.
+        """
+        chunk_size = chunk_size or config.STORAGE_BULK_CHUNK_SIZE
+        chunk = []
+        async for key in self.backend.iter_index(
+            self.all_keys_key, count=chunk_size
+        ):
+            chunk.append(key)
+            if len(chunk) >= chunk_size:
+                for item in (await self.get_storage_entities(chunk)).items():
+                    yield item
+                chunk = []
+
+        if chunk:
+            for item in (await self.get_storage_entities(chunk)).items():
+                yield item
+
+    @instrumented
+    async def get_storage_entities(self, identities: List[str]):
+        """
+        Gets entities with provided identities within storage path using
+        single round trip. Entities which are not found are omitted.
+
+        :param identities: Identities of entities which will be returned.
+        :return: Dict with identities and found entities.
+        :rtype: dict
+        """
+        if not identities:
+            return {}
+
+        result = {}
+        if self.cache is not None:
+            for identity in identities:
+                data = self.cache.get(
+                    '{}-{}'.format(self.storage_path, identity)
+                )
+                if data is not MISSING:
+                    result[identity] = data
+
+            identities = [
+                identity for identity in identities if identity not in result
+            ]
+            if not identities:
+                return result
+
+        keys = [
+            '{}-{}'.format(self.storage_path, identity)
+            for identity in identities
+        ]
+        values = await self.backend.get_many(keys, self.hash_storage)
+
+        for identity, key, value in zip(identities, keys, values):
+            if value is not None:
+                result[identity] = value
+                if self.cache is not None:
+                    self.cache.set(key, value)
 
         return result
 
+    @instrumented
     async def get_storage_entity(self, key: Optional[str] = None):
         """
         Gets dict from redis using key. If key is not provided, will be
@@ -127,22 +298,34 @@ class StorageService:
         logger.info(
             'Getting value from redis using key: {}'.format(the_key)
         )
-        data = await self.redis_client.get(the_key)
+        if self.cache is not None:
+            data = self.cache.get(the_key)
+            if data is not MISSING:
+                logger.info('... and value is found in cache...')
+                return data
+
+        data = await self.backend.get(the_key, self.hash_storage)
         if data is not None:
-            await self.add_new_key()
-            data = json.loads(data)
             logger.info('... and value is found...')
+            if self.cache is not None:
+                self.cache.set(the_key, data)
 
         return data
 
-    async def store_storage_entity(self, data, key: Optional[str] = None):
+    @instrumented
+    async def store_storage_entity(
+        self, data, key: Optional[str] = None, batch=None
+    ):
         """
         Sets dict in redis using key. If key is not provided, will be
-        created from storage_path and identity.
+        created from storage_path and identity. If batch is provided, value
+        is stored when batch is committed.
 
         :param data: Dict or str which will be stored in redis.
         :type data: dict | str
         :param key: Key which will be used for storing value.
+        :param batch: Storage batch in which operation will be queued.
+        :type batch: port_16.api.common.service.batch.StorageBatch
         :return: Sets and returns data in redis.
         :rtype: dict
         """
@@ -150,10 +333,20 @@ class StorageService:
         logger.info(
             'Storing value in redis using key: {}'.format(the_key)
         )
-        content = json.dumps(data) if isinstance(data, dict) else data
-        await self.redis_client.set(the_key, content)
+        if batch is not None:
+            batch.add(self, BatchOperation(
+                'store', the_key, (data, self.all_keys_key, self.identity),
+                self.hash_storage
+            ))
+            return data
+
+        await self.backend.store(
+            the_key, data, self.all_keys_key, self.identity, self.hash_storage
+        )
+        await self._write_cache(the_key, data)
         return data
 
+    @instrumented
     async def delete_storage_entity(self, key: Optional[str] = None):
         """
         Removes dict from redis using key. If key is not provided, will be
@@ -167,36 +360,123 @@ class StorageService:
         logger.info(
             'Deleting value in redis using key: {}'.format(the_key)
         )
-        data = await self.get_storage_entity()
+        data = await self.get_storage_entity(key)
         if data is not None:
-            await self.remove_key()
-            await self.redis_client.delete(the_key)
+            await self.backend.delete(
+                the_key, self.all_keys_key, self.identity, self.hash_storage
+            )
+            await self._write_cache(the_key)
             logger.info('... it is deleted.')
 
         return data
 
-    async def update_storage_entity(self, data, key: Optional[str] = None):
+    @instrumented
+    async def update_storage_entity(
+        self, data, key: Optional[str] = None, batch=None
+    ):
         """
         Merge dict found in redis using key with provided data. If key is
-        not provided, will be created from storage_path and identity.
+        not provided, will be created from storage_path and identity. If
+        batch is provided, value is merged when batch is committed and None
+        is returned.
 
         :param data: Dict which will be merged and stored in redis.
         :type data: dict
         :param key: Key which will be used for storing value.
+        :param batch: Storage batch in which operation will be queued.
+        :type batch: port_16.api.common.service.batch.StorageBatch
         :return: Sets and returns data in redis.
-        :rtype: dict
+        :rtype: dict | None
         """
         the_key = key or self.entity_key
         logger.info(
             'Merging value in redis using key: {}'.format(the_key)
         )
-        redis_data = await self.get_storage_entity()
-        if redis_data is not None:
-            redis_data.update(data)
-        else:
-            redis_data = data
-
-        await self.redis_client.set(
-            the_key, json.dumps(redis_data)
+        if batch is not None:
+            batch.add(self, BatchOperation(
+                'update', the_key, (data, self.all_keys_key, self.identity),
+                self.hash_storage
+            ))
+            return None
+
+        merged = await self.backend.update(
+            the_key, data, self.all_keys_key, self.identity, self.hash_storage
+        )
+        await self._write_cache(the_key, merged)
+        return merged
+
+    @instrumented
+    async def update_existing_storage_entity(
+        self, data: dict, key: Optional[str] = None, batch=None
+    ):
+        """
+        Merge dict found in redis using key with provided data only if
+        entity already exists. If key is not provided, will be created from
+        storage_path and identity. In hash storage mode check and update are
+        done within single round trip. If batch is provided, value is merged
+        when batch is committed and None is returned.
+
+        :param data: Dict which will be merged and stored in redis.
+        :type data: dict
+        :param key: Key which will be used for storing value.
+        :param batch: Storage batch in which operation will be queued.
+        :type batch: port_16.api.common.service.batch.StorageBatch
+        :return: Merged data or None if entity does not exist.
+        :rtype: dict | None
+        """
+        the_key = key or self.entity_key
+        logger.info(
+            'Merging existing value in redis using key: {}'.format(the_key)
+        )
+        if batch is not None:
+            batch.add(self, BatchOperation(
+                'update_existing', the_key, (data,), self.hash_storage
+            ))
+            return None
+
+        merged = await self.backend.update_existing(
+            the_key, data, self.hash_storage
+        )
+        if merged is not None:
+            await self._write_cache(the_key, merged)
+
+        return merged
+
+    @instrumented
+    async def pop_storage_fields(
+        self, fields: Iterable[str], key: Optional[str] = None, batch=None
+    ):
+        """
+        Removes provided fields from entity found using key and returns
+        their values. If key is not provided, will be created from
+        storage_path and identity. In hash storage mode values are read and
+        removed within single round trip. If batch is provided, fields are
+        removed when batch is committed and None is returned.
+
+        :param fields: Fields which will be removed.
+        :param key: Key which will be used for updating value.
+        :param batch: Storage batch in which operation will be queued.
+        :type batch: port_16.api.common.service.batch.StorageBatch
+        :return: Dict with removed fields and theirs values.
+        :rtype: dict | None
+        """
+        the_key = key or self.entity_key
+        fields = [str(field) for field in fields]
+        logger.info(
+            'Removing fields {} in redis using key: {}'.format(
+                fields, the_key
+            )
         )
-        return redis_data
+        if batch is not None:
+            batch.add(self, BatchOperation(
+                'pop_fields', the_key, (fields,), self.hash_storage
+            ))
+            return None
+
+        removed = await self.backend.pop_fields(
+            the_key, fields, self.hash_storage
+        )
+        if removed:
+            await self._write_cache(the_key)
+
+        return removed
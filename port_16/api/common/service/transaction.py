@@ -14,6 +14,7 @@ class TransactionService(StorageService):
     in/from redis storage.
     """
     MAIN_PATH = 'TRANSACTION'
+    HASH_ENTITY = True
 
     async def add_transaction(
         self,
@@ -98,8 +99,5 @@ class TransactionService(StorageService):
         :param key: Key which will be used for getting transaction data.
         :return: Id of connector.
         """
-        redis_data = await self.get_storage_entity(key)
-        connector_id = redis_data.get(str(transaction_id))
-        del redis_data[str(transaction_id)]
-        await self.store_storage_entity(redis_data, key)
-        return connector_id
+        removed = await self.pop_storage_fields([transaction_id], key)
+        return removed.get(str(transaction_id))
@@ -0,0 +1,621 @@
+import asyncio
+import logging
+from time import perf_counter
+from typing import Dict, Optional, Set, Any, List
+
+from fastapi.exceptions import HTTPException
+from ocpp.v16.enums import ChargePointStatus
+
+from port_16 import config
+from port_16.metrics import Gauge, Histogram
+from port_16.api.charge_point import ChargingPointModel, ChargingPointState
+from .service import (
+    ChargePointService, ConnectorService, TransactionService, StorageBatch
+)
+
+logger = logging.getLogger(__name__)
+
+DIRTY = Gauge(
+    'port16_state_dirty',
+    'Number of charge point states with changes not yet persisted'
+)
+FLUSH_DURATION = Histogram(
+    'port16_state_flush_seconds',
+    'Duration of persisting changed charge point states'
+)
+
+#: Allowed charge point state transitions. Boot notification could be
+#: accepted or rejected in any state.
+CP_TRANSITIONS: Dict[ChargingPointState, Set[ChargingPointState]] = {
+    ChargingPointState.IDLE: {
+        ChargingPointState.ACCEPTED, ChargingPointState.REJECTED,
+    },
+    ChargingPointState.ACCEPTED: {
+        ChargingPointState.ACCEPTED, ChargingPointState.REJECTED,
+        ChargingPointState.UPDATE_FIRMWARE,
+        ChargingPointState.GET_DIAGNOSTICS,
+    },
+    ChargingPointState.REJECTED: {
+        ChargingPointState.ACCEPTED, ChargingPointState.REJECTED,
+    },
+    ChargingPointState.UPDATE_FIRMWARE: {
+        ChargingPointState.ACCEPTED, ChargingPointState.REJECTED,
+        ChargingPointState.UPDATE_FIRMWARE,
+    },
+    ChargingPointState.GET_DIAGNOSTICS: {
+        ChargingPointState.ACCEPTED, ChargingPointState.REJECTED,
+        ChargingPointState.GET_DIAGNOSTICS,
+    },
+    ChargingPointState.CLOSED: {
+        ChargingPointState.IDLE, ChargingPointState.ACCEPTED,
+        ChargingPointState.REJECTED,
+    },
+}
+
+_S = ChargePointStatus
+#: Allowed connector status transitions, as defined by OCPP 1.6
+#: StatusNotification transitions table.
+CONNECTOR_TRANSITIONS: Dict[ChargePointStatus, Set[ChargePointStatus]] = {
+    _S.available: {
+        _S.preparing, _S.charging, _S.suspended_ev, _S.suspended_evse,
+        _S.reserved, _S.unavailable, _S.faulted,
+    },
+    _S.preparing: {
+        _S.available, _S.charging, _S.suspended_ev, _S.suspended_evse,
+        _S.finishing, _S.faulted,
+    },
+    _S.charging: {
+        _S.available, _S.suspended_ev, _S.suspended_evse, _S.finishing,
+        _S.unavailable, _S.faulted,
+    },
+    _S.suspended_ev: {
+        _S.available, _S.charging, _S.suspended_evse, _S.finishing,
+        _S.unavailable, _S.faulted,
+    },
+    _S.suspended_evse: {
+        _S.available, _S.charging, _S.suspended_ev, _S.finishing,
+        _S.unavailable, _S.faulted,
+    },
+    _S.finishing: {
+        _S.available, _S.preparing, _S.unavailable, _S.faulted,
+    },
+    _S.reserved: {
+        _S.available, _S.preparing, _S.unavailable, _S.faulted,
+    },
+    _S.unavailable: {
+        _S.available, _S.preparing, _S.charging, _S.suspended_ev,
+        _S.suspended_evse, _S.faulted,
+    },
+    _S.faulted: {
+        _S.available, _S.preparing, _S.charging, _S.suspended_ev,
+        _S.suspended_evse, _S.finishing, _S.reserved, _S.unavailable,
+    },
+}
+
+
+class PendingChanges:
+    """
+    Changes of charge point state which are not persisted yet. Repeated
+    changes of same field are coalesced, so only last value is written.
+    """
+
+    def __init__(self):
+        self.cp_fields: Dict[str, Any] = {}
+        self.connectors: Dict[str, str] = {}
+        self.added_transactions: Dict[str, int] = {}
+        self.removed_transactions: Set[str] = set()
+
+    def __bool__(self):
+        return bool(
+            self.cp_fields or self.connectors or
+            self.added_transactions or self.removed_transactions
+        )
+
+    def add_transaction(self, transaction_id: str, connector_id: int):
+        self.removed_transactions.discard(transaction_id)
+        self.added_transactions[transaction_id] = connector_id
+
+    def remove_transaction(self, transaction_id: str):
+        if self.added_transactions.pop(transaction_id, None) is None:
+            self.removed_transactions.add(transaction_id)
+
+    def merge_older(self, older: 'PendingChanges') -> None:
+        """
+        Merges older changes (e.g. changes which are not persisted because
+        of an error) under these changes.
+
+        :param older: Changes made before these changes.
+        """
+        self.cp_fields = dict(older.cp_fields, **self.cp_fields)
+        self.connectors = dict(older.connectors, **self.connectors)
+        for transaction_id, connector_id in (
+            older.added_transactions.items()
+        ):
+            if (
+                transaction_id not in self.removed_transactions and
+                transaction_id not in self.added_transactions
+            ):
+                self.added_transactions[transaction_id] = connector_id
+        for transaction_id in older.removed_transactions:
+            if transaction_id not in self.added_transactions:
+                self.removed_transactions.add(transaction_id)
+
+
+class ChargePointStateMachine:
+    """
+    In memory state of connected charge point: charge point state,
+    connector statuses and active transactions. While charge point is
+    connected this state is source of truth, every change is validated
+    against allowed transitions and persisted later by state persister.
+    """
+
+    def __init__(
+        self,
+        model: ChargingPointModel,
+        connectors: Optional[Dict[int, ChargePointStatus]] = None,
+        transactions: Optional[Dict[int, int]] = None,
+        persister: Optional['StatePersister'] = None
+    ):
+        self.model = model
+        self.connectors = connectors or {}
+        self.transactions = transactions or {}
+        self.persister = persister
+        self.pending = PendingChanges()
+
+    @property
+    def cp_id(self) -> str:
+        return self.model.identity
+
+    @property
+    def state(self) -> ChargingPointState:
+        return ChargingPointState(self.model.state)
+
+    @classmethod
+    async def load(
+        cls, cp_id: str, persister: Optional['StatePersister'] = None
+    ) -> 'ChargePointStateMachine':
+        """
+        Creates state of charge point with provided id from stored charge
+        point, connectors and transactions data. Not yet persisted changes
+        of previous state of same charge point are written first.
+
+        :param cp_id: Id of charge point.
+        :param persister: State persister which will write changes.
+        :return: Loaded charge point state.
+        """
+        if persister is not None:
+            await persister.flush(cp_id)
+
+        model = await ChargePointService(cp_id).validate_get_entity()
+        connectors = await ConnectorService(cp_id).get_storage_entity()
+        transactions = await TransactionService(cp_id).get_storage_entity()
+        machine = cls(
+            model,
+            connectors={
+                int(key): ChargePointStatus(value)
+                for key, value in (connectors or {}).items()
+            },
+            transactions={
+                int(key): int(value)
+                for key, value in (transactions or {}).items()
+            },
+            persister=persister
+        )
+        if persister is not None:
+            persister.register(machine)
+
+        return machine
+
+    def _changed(self) -> None:
+        if self.persister is not None:
+            self.persister.mark_dirty(self)
+
+    def _conflict(self, detail: str):
+        logger.warning(detail)
+        raise HTTPException(status_code=409, detail=detail)
+
+    def can_set_state(self, state: ChargingPointState) -> bool:
+        """
+        Checks if charge point could change its current state to provided
+        one.
+
+        :param state: New charge point state.
+        :return: True if transition is allowed.
+        """
+        return state in CP_TRANSITIONS.get(self.state, ())
+
+    def set_state(self, state: ChargingPointState) -> ChargingPointModel:
+        """
+        Changes charge point state. If transition from current state is not
+        allowed, Conflict exception will be raised.
+
+        :param state: New charge point state.
+        :return: Charge point model.
+        """
+        if not self.can_set_state(state):
+            self._conflict(
+                f'Charging point {self.cp_id} could not change state '
+                f'from {self.state.value} to {state.value}'
+            )
+
+        self.model.state = state.value
+        self.pending.cp_fields['state'] = state.value
+        self._changed()
+        return self.model
+
+    def init_connectors(
+        self, connector_number: int
+    ) -> Dict[int, ChargePointStatus]:
+        """
+        Sets statuses of charge point connectors, connectors without known
+        status become available.
+
+        :param connector_number: Number of connectors within charge point.
+        :return: Dict with connector ids and theirs status.
+        """
+        for connector_id in range(1, connector_number + 1):
+            status = self.connectors.setdefault(
+                connector_id, ChargePointStatus.available
+            )
+            self.pending.connectors[str(connector_id)] = status.value
+
+        self._changed()
+        return {
+            connector_id: self.connectors[connector_id]
+            for connector_id in range(1, connector_number + 1)
+        }
+
+    def set_connector_status(
+        self,
+        connector_id: int,
+        status: ChargePointStatus,
+        expected: Optional[ChargePointStatus] = None
+    ) -> ChargePointStatus:
+        """
+        Changes status of connector with provided id. If connector is not
+        found NotFound exception will be raised. If connector is not in
+        expected status or transition is not allowed, Conflict exception
+        will be raised.
+
+        :param connector_id: Id of connector.
+        :param status: New connector status.
+        :param expected: Status connector must have before change.
+        :return: New connector status.
+        """
+        current = self.connectors.get(connector_id)
+        if current is None:
+            logger.warning(
+                'Connector id: {} not found within '
+                'Charging point: {}'.format(connector_id, self.cp_id)
+            )
+            raise HTTPException(
+                status_code=404,
+                detail=(
+                    f'Connector id {connector_id} not found within Charging '
+                    f'point with id {self.cp_id}'
+                )
+            )
+
+        if expected is not None and current != expected:
+            self._conflict(
+                f'Connector id {connector_id} is not {expected.value} '
+                f'within Charging point with id {self.cp_id}'
+            )
+        if status != current and status not in CONNECTOR_TRANSITIONS[current]:
+            self._conflict(
+                f'Connector id {connector_id} within Charging point with '
+                f'id {self.cp_id} could not change status from '
+                f'{current.value} to {status.value}'
+            )
+
+        self.connectors[connector_id] = status
+        self.pending.connectors[str(connector_id)] = status.value
+        self._changed()
+        return status
+
+    def claim_connector(
+        self,
+        connector_id: int,
+        status: ChargePointStatus = ChargePointStatus.charging
+    ) -> ChargePointStatus:
+        """
+        Sets provided status for connector which must be available.
+
+        :param connector_id: Id of connector.
+        :param status: Status of claimed connector.
+        :return: Set connector status.
+        """
+        return self.set_connector_status(
+            connector_id, status, expected=ChargePointStatus.available
+        )
+
+    def release_connector(
+        self,
+        connector_id: int,
+        status: ChargePointStatus = ChargePointStatus.charging
+    ) -> bool:
+        """
+        Sets available status for connector if it is in provided status.
+
+        :param connector_id: Id of connector.
+        :param status: Status in which connector must be to be released.
+        :return: True if connector is released.
+        """
+        if self.connectors.get(connector_id) != status:
+            logger.warning(
+                'Connector id: {} within Charging point: {} is not '
+                'released, its status is {}'.format(
+                    connector_id, self.cp_id,
+                    self.connectors.get(connector_id)
+                )
+            )
+            return False
+
+        self.set_connector_status(connector_id, ChargePointStatus.available)
+        return True
+
+    def start_transaction(self, transaction_id: int, connector_id: int):
+        """
+        Adds active transaction on provided connector.
+
+        :param transaction_id: Id of transaction.
+        :param connector_id: Id of connector.
+        """
+        if transaction_id in self.transactions:
+            self._conflict(
+                f'Transaction id {transaction_id} already exists within '
+                f'Charging point with id {self.cp_id}'
+            )
+
+        self.transactions[transaction_id] = connector_id
+        self.pending.add_transaction(str(transaction_id), connector_id)
+        self._changed()
+
+    def replace_transaction(
+        self, transaction_id: int, new_transaction_id: int
+    ) -> int:
+        """
+        Changes id of active transaction, e.g. provisional id of transaction
+        started offline to id returned by central system.
+
+        :param transaction_id: Current id of transaction.
+        :param new_transaction_id: New id of transaction.
+        :return: Id of connector.
+        """
+        connector_id = self.get_transaction_connector(transaction_id)
+        self.start_transaction(new_transaction_id, connector_id)
+        self.stop_transaction(transaction_id)
+        return connector_id
+
+    def get_transaction_connector(self, transaction_id: int) -> int:
+        """
+        Returns connector id of active transaction. If transaction is not
+        found NotFound exception will be raised.
+
+        :param transaction_id: Id of transaction.
+        :return: Id of connector.
+        """
+        connector_id = self.transactions.get(transaction_id)
+        if connector_id is None:
+            logger.warning(
+                'Transaction id: {} not found within '
+                'Charging point: {}'.format(transaction_id, self.cp_id)
+            )
+            raise HTTPException(
+                status_code=404,
+                detail=(
+                    f'Transaction id {transaction_id} not found '
+                    f'within Charging point with id {self.cp_id}'
+                )
+            )
+
+        return connector_id
+
+    def stop_transaction(self, transaction_id: int) -> int:
+        """
+        Removes active transaction and returns its connector id.
+
+        :param transaction_id: Id of transaction.
+        :return: Id of connector.
+        """
+        connector_id = self.get_transaction_connector(transaction_id)
+        del self.transactions[transaction_id]
+        self.pending.remove_transaction(str(transaction_id))
+        self._changed()
+        return connector_id
+
+    def take_pending(self) -> PendingChanges:
+        """
+        Returns not persisted changes and starts collecting new ones.
+
+        :return: Not persisted changes.
+        """
+        pending, self.pending = self.pending, PendingChanges()
+        return pending
+
+    async def queue_pending(
+        self, pending: PendingChanges, batch: StorageBatch
+    ) -> None:
+        """
+        Queues writes of provided changes into storage batch. Charge point
+        fields are written only if charge point is still stored, so deleted
+        charge point is not created again.
+
+        :param pending: Changes which will be written.
+        :param batch: Storage batch in which writes will be queued.
+        """
+        if pending.cp_fields:
+            await ChargePointService(
+                self.cp_id
+            ).update_existing_storage_entity(pending.cp_fields, batch=batch)
+        if pending.connectors:
+            await ConnectorService(self.cp_id).update_storage_entity(
+                pending.connectors, batch=batch
+            )
+        trans_service = TransactionService(self.cp_id)
+        if pending.removed_transactions:
+            await trans_service.pop_storage_fields(
+                pending.removed_transactions, batch=batch
+            )
+        if pending.added_transactions:
+            await trans_service.update_storage_entity(
+                pending.added_transactions, batch=batch
+            )
+
+
+class StatePersister:
+    """
+    Write-behind persistence of charge point states. Changed states are
+    written every flush_interval seconds, changes of all states are written
+    using storage batches, so repeated changes of same field are written
+    once and many charge points are persisted within single round trip.
+    """
+
+    def __init__(self, flush_interval: Optional[float] = None):
+        self.flush_interval = flush_interval or config.STATE_FLUSH_INTERVAL
+        self._machines: Dict[str, ChargePointStateMachine] = {}
+        self._dirty: Dict[str, ChargePointStateMachine] = {}
+        self._lock = asyncio.Lock()
+        self._task = None
+        DIRTY.set_function(lambda: len(self._dirty))
+
+    def register(self, machine: ChargePointStateMachine) -> None:
+        self._machines[machine.cp_id] = machine
+
+    async def unregister(
+        self,
+        cp_id: str,
+        machine: Optional[ChargePointStateMachine] = None,
+        flush: bool = False
+    ) -> None:
+        """
+        Stops persisting state of charge point with provided id, e.g. when
+        charge point is deleted or its connection is not opened again. Not
+        persisted changes are written if flush is set, otherwise they are
+        discarded. Flush in progress is awaited first, so its writes are
+        not made after state is unregistered.
+
+        :param cp_id: Id of charge point.
+        :param machine: State which is unregistered only if it is still
+            registered, not replaced by state of new connection.
+        :param flush: Whether not persisted changes are written.
+        """
+        async with self._lock:
+            if (
+                machine is not None and
+                self._machines.get(cp_id) is not machine
+            ):
+                return
+
+            if flush and cp_id in self._dirty:
+                await self._flush([cp_id])
+            self._machines.pop(cp_id, None)
+            self._dirty.pop(cp_id, None)
+
+    def mark_dirty(self, machine: ChargePointStateMachine) -> None:
+        if self._machines.get(machine.cp_id) is machine:
+            self._dirty[machine.cp_id] = machine
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self) -> None:
+        """
+        Stops periodic flushing and writes all not persisted changes.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+        await self.flush()
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception('Persisting charge point states failed')
+
+    async def flush(self, cp_id: Optional[str] = None) -> int:
+        """
+        Writes not persisted changes of all charge points or only of charge
+        point with provided id. If writing fails, changes are kept and
+        written by next flush.
+
+        :param cp_id: Id of charge point which changes will be written.
+        :return: Number of persisted charge point states.
+        """
+        async with self._lock:
+            if cp_id is not None:
+                cp_ids = [cp_id] if cp_id in self._dirty else []
+            else:
+                cp_ids = list(self._dirty)
+
+            if not cp_ids:
+                return 0
+
+            return await self._flush(cp_ids)
+
+    async def _flush(self, cp_ids: List[str]) -> int:
+        start = perf_counter()
+        chunk_size = config.STORAGE_BULK_CHUNK_SIZE
+        written = 0
+        try:
+            for index in range(0, len(cp_ids), chunk_size):
+                # states are taken from dirty ones chunk by chunk, so chunks
+                # after failed one stay dirty
+                machines = [
+                    machine for machine in (
+                        self._dirty.pop(dirty_id, None)
+                        for dirty_id in cp_ids[index:index + chunk_size]
+                    ) if machine is not None
+                ]
+                await self._write(machines)
+                written += len(machines)
+        finally:
+            FLUSH_DURATION.observe(perf_counter() - start)
+
+        return written
+
+    async def commit(
+        self, machine: ChargePointStateMachine, batch: StorageBatch
+    ) -> None:
+        """
+        Writes not persisted changes of provided state together with writes
+        queued in provided batch, within single round trip. If writing
+        fails, batch is rolled back and state changes are kept and written
+        by next flush.
+
+        :param machine: Charge point state which changes will be written.
+        :param batch: Storage batch with other writes of same operation.
+        """
+        async with self._lock:
+            if self._dirty.get(machine.cp_id) is machine:
+                del self._dirty[machine.cp_id]
+                machines = [machine]
+            else:
+                machines = []
+
+            await self._write(machines, batch)
+
+    async def _write(
+        self,
+        machines: List[ChargePointStateMachine],
+        batch: Optional[StorageBatch] = None
+    ) -> None:
+        changes = [(machine, machine.take_pending()) for machine in machines]
+        if batch is None:
+            batch = StorageBatch()
+        try:
+            for machine, pending in changes:
+                await machine.queue_pending(pending, batch)
+            await batch.commit()
+        except Exception:
+            batch.rollback()
+            for machine, pending in changes:
+                machine.pending.merge_older(pending)
+                self.mark_dirty(machine)
+            raise
@@ -0,0 +1,148 @@
+import ssl
+import logging
+from typing import Any, Dict, Optional, Tuple
+
+from port_16 import config
+from port_16.metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+HANDSHAKES = Counter(
+    'port16_tls_handshakes_total',
+    'Number of TLS handshakes of charge point connections by resumption',
+    ('resumed',)
+)
+
+_contexts: Dict[Tuple, 'ResumingSSLContext'] = {}
+
+
+class ResumingSSLContext(ssl.SSLContext):
+    """
+    Client SSL context which remembers last TLS session of every host and
+    offers it when new connection to that host is opened, so reconnecting
+    charge points do abbreviated handshake instead of full one. Asyncio
+    transports do not accept session argument, so session is offered by
+    context itself.
+    """
+
+    def __new__(cls, protocol: int, resumption: bool = True):
+        return super().__new__(cls, protocol)
+
+    def __init__(self, protocol: int, resumption: bool = True):
+        super().__init__()
+        self.resumption = resumption
+        self.sessions: Dict[str, ssl.SSLSession] = {}
+
+    def wrap_bio(
+        self, incoming, outgoing, server_side=False,
+        server_hostname=None, session=None
+    ):
+        if (
+            self.resumption and session is None and not server_side and
+            server_hostname is not None
+        ):
+            session = self.sessions.get(server_hostname)
+
+        return super().wrap_bio(
+            incoming, outgoing, server_side=server_side,
+            server_hostname=server_hostname, session=session
+        )
+
+    def save_session(self, ssl_object: Optional[ssl.SSLObject]) -> None:
+        """
+        Remembers session of provided connection for next connections to
+        same host. TLS 1.3 session tickets are received after handshake,
+        so session is saved again when connection is closed.
+
+        :param ssl_object: SSL object of opened connection.
+        """
+        if not self.resumption or ssl_object is None:
+            return
+
+        session = ssl_object.session
+        if session is not None and (
+            session.has_ticket or ssl_object.version() != 'TLSv1.3'
+        ):
+            self.sessions[ssl_object.server_hostname] = session
+
+
+def create_ssl_context(
+    verify: bool,
+    ca_file: Optional[str] = None,
+    cert_file: Optional[str] = None,
+    key_file: Optional[str] = None,
+    key_password: Optional[str] = None,
+    resumption: bool = True
+) -> ResumingSSLContext:
+    """
+    Creates client SSL context for charge point connections.
+
+    :param verify: Verify certificate and hostname of central system.
+    :param ca_file: CA bundle used to verify central system.
+    :param cert_file: Client certificate.
+    :param key_file: Private key of client certificate.
+    :param key_password: Password of private key.
+    :param resumption: Resume sessions of previous connections.
+    :return: SSL context.
+    """
+    context = ResumingSSLContext(
+        ssl.PROTOCOL_TLS_CLIENT, resumption=resumption
+    )
+    if verify:
+        if ca_file:
+            context.load_verify_locations(cafile=ca_file)
+        else:
+            context.load_default_certs()
+    else:
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+
+    if cert_file:
+        context.load_cert_chain(
+            certfile=cert_file, keyfile=key_file, password=key_password
+        )
+
+    return context
+
+
+def get_ssl_context() -> ResumingSSLContext:
+    """
+    Returns SSL context of configured TLS settings. Context is created once
+    and shared by all charge points, so its sessions are resumed across
+    chargers and reconnects.
+
+    :return: Shared SSL context.
+    """
+    key = (
+        config.TLS_VERIFY, config.TLS_CA_FILE, config.TLS_CERT_FILE,
+        config.TLS_KEY_FILE, config.TLS_KEY_PASSWORD,
+        config.TLS_SESSION_RESUMPTION
+    )
+    context = _contexts.get(key)
+    if context is None:
+        context = _contexts[key] = create_ssl_context(*key)
+        logger.info(
+            'Created TLS context (verify: {}, client certificate: {}, '
+            'session resumption: {})'.format(
+                config.TLS_VERIFY, config.TLS_CERT_FILE,
+                config.TLS_SESSION_RESUMPTION
+            )
+        )
+
+    return context
+
+
+def record_handshake(context: ResumingSSLContext, transport: Any) -> None:
+    """
+    Records if handshake of opened connection was resumed and saves its
+    session.
+
+    :param context: SSL context of connection.
+    :param transport: Transport of opened connection.
+    """
+    ssl_object = transport.get_extra_info('ssl_object')
+    if ssl_object is None:
+        return
+
+    HANDSHAKES.labels(str(ssl_object.session_reused).lower()).inc()
+    context.save_session(ssl_object)
@@ -0,0 +1,25 @@
+from fastapi import APIRouter
+from starlette.responses import PlainTextResponse
+
+from port_16.metrics import REGISTRY
+
+
+router = APIRouter()
+
+
+@router.get(
+    path='',
+    response_class=PlainTextResponse,
+    summary='Metrics',
+    description='Returns metrics in Prometheus text exposition format',
+    response_description='Metrics',
+)
+async def metrics() -> PlainTextResponse:
+    """Returns all collected metrics, e.g. latency of storage operations
+    labelled by storage path and operation.
+    :return: Metrics in Prometheus text format
+    """
+    return PlainTextResponse(
+        REGISTRY.render(),
+        media_type='text/plain; version=0.0.4; charset=utf-8'
+    )
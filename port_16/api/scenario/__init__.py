@@ -0,0 +1,5 @@
+from .schemas import (
+    ScenarioModel, ScenarioFileModel, ScenarioRunState, ScenarioRunModel,
+    ArrivalPhaseModel, DurationModel, Distribution, TagPoolModel
+)
+from .engine import ScenarioRun, load_scenario, get_run
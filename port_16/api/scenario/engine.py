@@ -0,0 +1,520 @@
+import json
+import time
+import uuid
+import random
+import asyncio
+import logging
+from array import array
+from pathlib import Path
+from datetime import datetime, timezone
+from collections import OrderedDict, defaultdict
+from typing import Any, Awaitable, Dict, List, Optional, Tuple
+
+import yaml
+import numpy
+import inject
+from fastapi.exceptions import HTTPException
+from ocpp.v16.enums import ChargePointStatus
+
+from port_16 import config
+from port_16.api.charge_point import ChargingPointState
+from port_16.api.charge_point.bulk import get_job
+from port_16.api.charge_point.operations import create_charging_points_bulk
+from port_16.api.commands.operations import (
+    execute_authorize, execute_boot_notification, execute_start_transaction,
+    execute_stop_transaction
+)
+from port_16.api.commands.schemas import StartTransaction, StopTransaction
+from port_16.api.common import cp_db
+from .schemas import (
+    ScenarioModel, ScenarioRunState, Distribution, DurationModel
+)
+
+logger = logging.getLogger(__name__)
+
+#: Number of finished runs kept for progress queries
+MAX_RUNS = 20
+PERCENTILES = (50, 90, 95, 99)
+OPERATIONS = (
+    'boot_notification', 'authorize', 'start_transaction',
+    'stop_transaction'
+)
+_runs: 'OrderedDict[str, ScenarioRun]' = OrderedDict()
+
+
+def resolve_path(directory: str, name: str) -> Path:
+    """
+    Resolves path of file within provided directory. Absolute paths and
+    paths leading out of directory are rejected.
+
+    :param directory: Directory of file.
+    :param name: Path of file relative to directory.
+    :return: Resolved path.
+    """
+    path = Path(name)
+    base = Path(directory).resolve()
+    resolved = (base / path).resolve()
+    if (
+        not name or path.is_absolute() or '..' in path.parts or
+        base not in resolved.parents
+    ):
+        raise ValueError('{} is not path within {}'.format(name, directory))
+
+    return resolved
+
+
+def load_scenario(path: str) -> ScenarioModel:
+    """
+    Reads scenario from YAML (.yaml, .yml) or JSON file.
+
+    :param path: Path of scenario file.
+    :return: Parsed scenario.
+    """
+    path = Path(path)
+    content = path.read_text()
+    if path.suffix.lower() in ('.yaml', '.yml'):
+        data = yaml.safe_load(content)
+    else:
+        data = json.loads(content)
+
+    return ScenarioModel.parse_obj(data)
+
+
+def _summary(values: array) -> Dict[str, float]:
+    if not len(values):
+        return {}
+
+    data = numpy.frombuffer(values, dtype=numpy.float64)
+    summary = {'min': float(data.min()), 'mean': float(data.mean())}
+    for percentile, value in zip(
+        PERCENTILES, numpy.percentile(data, PERCENTILES)
+    ):
+        summary['p{}'.format(percentile)] = float(value)
+    summary['max'] = float(data.max())
+    return summary
+
+
+def _timestamp() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class ScenarioRun:
+    """
+    Runs charging sessions of scenario on connected charge points by calling
+    command operations directly, without REST API. Sessions arrive as
+    Poisson process with rate of current phase and are scheduled open loop:
+    arrival times do not depend on how fast previous sessions are handled,
+    so slow responses show up as latency instead of lower load. Every
+    session takes available connector and free tag of pool, authorizes tag,
+    starts transaction, charges for sampled duration and stops transaction.
+    Arrivals without free connector or tag, or over max_sessions, are
+    dropped.
+    """
+
+    def __init__(self, scenario: ScenarioModel):
+        #: :type: :class:`port_16.sharding.ShardRouter`
+        shard_router = inject.instance('shard_router')
+        self.run_id = uuid.uuid4().hex
+        if shard_router is not None:
+            # shard prefix routes progress requests to this worker
+            self.run_id = '{}-{}'.format(shard_router.slot, self.run_id)
+        self.scenario = scenario
+        self.state = ScenarioRunState.PENDING
+        self.random = random.Random(scenario.seed)
+        self.arrivals = 0
+        self.started = 0
+        self.completed = 0
+        self.failed = 0
+        self.queued = 0
+        self.dropped: Dict[str, int] = defaultdict(int)
+        self.latencies: Dict[str, array] = {
+            operation: array('d') for operation in OPERATIONS
+        }
+        self.errors: Dict[str, Dict[str, int]] = {
+            operation: defaultdict(int) for operation in OPERATIONS
+        }
+        self.schedule_lag = array('d')
+        self.error = None
+        self._connectors: List[Tuple[str, int]] = []
+        self._tags: List[str] = []
+        self._sessions = set()
+        self._ended = asyncio.Event()
+        self._start_time: Optional[float] = None
+        self._end_time: Optional[float] = None
+        self._task = None
+
+    def start(self) -> 'ScenarioRun':
+        """
+        Starts run in background and registers it for progress queries.
+
+        :return: Started run.
+        """
+        _runs[self.run_id] = self
+        while len(_runs) > MAX_RUNS:
+            _runs.popitem(last=False)
+
+        self._task = asyncio.ensure_future(self.run())
+        return self
+
+    async def wait(self) -> Dict[str, Any]:
+        """
+        Waits until started run ends.
+
+        :return: Run report.
+        """
+        await asyncio.shield(self._task)
+        return self.to_dict()
+
+    async def run(self) -> None:
+        logger.info('Scenario {} run {} started'.format(
+            self.scenario.name, self.run_id
+        ))
+        try:
+            self.state = ScenarioRunState.PREPARING
+            await self._prepare()
+
+            self.state = ScenarioRunState.RUNNING
+            await self._arrive_all()
+
+            self.state = ScenarioRunState.DRAINING
+            if not self.scenario.drain:
+                self._ended.set()
+            while self._sessions:
+                await asyncio.wait(set(self._sessions))
+            self.state = ScenarioRunState.DONE
+        except Exception as e:
+            logger.exception('Scenario run {} failed'.format(self.run_id))
+            self.state = ScenarioRunState.FAILED
+            self.error = str(e)
+            self._ended.set()
+        finally:
+            self._end_time = self._end_time or time.perf_counter()
+            self._write_report()
+
+        logger.info(
+            'Scenario run {} done: {} arrivals, {} sessions completed, '
+            '{} failed, {} dropped'.format(
+                self.run_id, self.arrivals, self.completed, self.failed,
+                sum(self.dropped.values())
+            )
+        )
+
+    async def _prepare(self) -> None:
+        """
+        Provisions charge points, sends theirs boot notifications and
+        collects available connectors and tag pool.
+        """
+        identities = self.scenario.charging_points
+        if self.scenario.provision is not None:
+            job = get_job(
+                (await create_charging_points_bulk(
+                    self.scenario.provision
+                ))['job_id']
+            )
+            await job.wait()
+            if job.error is not None:
+                raise RuntimeError(
+                    'Provisioning failed: {}'.format(job.error)
+                )
+            if identities is None:
+                identities = [cp_model.identity for cp_model in job.cp_models]
+
+        if identities is None:
+            cps = cp_db.all_cps()
+        else:
+            # charge points of other shards are not connected here
+            cps = [
+                cp for cp in map(cp_db.get_cp, identities) if cp is not None
+            ]
+
+        if self.scenario.boot_notification:
+            semaphore = asyncio.Semaphore(self.scenario.boot_concurrency)
+
+            async def boot(cp_id: str):
+                async with semaphore:
+                    try:
+                        await self._timed(
+                            'boot_notification',
+                            execute_boot_notification(cp_id)
+                        )
+                    except Exception:
+                        # failed boot is counted in operation errors
+                        pass
+
+            await asyncio.gather(*(boot(cp.id) for cp in cps))
+
+        self._connectors = [
+            (cp.id, connector_id)
+            for cp in cps
+            if cp.state_machine.state == ChargingPointState.ACCEPTED
+            for connector_id, status in cp.state_machine.connectors.items()
+            if status == ChargePointStatus.available
+        ]
+        if not self._connectors:
+            raise RuntimeError(
+                'No available connectors of accepted charging points'
+            )
+
+        tags = self.scenario.tags
+        self._tags = list(tags.identities or (
+            tags.id_pattern.format(number)
+            for number in range(tags.start, tags.start + tags.count)
+        ))
+        logger.info(
+            'Scenario run {} prepared: {} charging points, {} connectors, '
+            '{} tags'.format(
+                self.run_id, len(cps), len(self._connectors),
+                len(self._tags)
+            )
+        )
+
+    async def _arrive_all(self) -> None:
+        """
+        Dispatches session arrivals of all phases at theirs scheduled times.
+        """
+        loop = asyncio.get_event_loop()
+        self._start_time = time.perf_counter()
+        scheduled = loop.time()
+        for phase in self.scenario.phases:
+            phase_end = scheduled + phase.duration
+            while phase.arrival_rate > 0:
+                scheduled += self.random.expovariate(phase.arrival_rate)
+                if scheduled >= phase_end:
+                    break
+
+                delay = scheduled - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                self.schedule_lag.append(max(loop.time() - scheduled, 0.0))
+                self._arrive()
+
+            scheduled = phase_end
+            delay = phase_end - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+        self._end_time = time.perf_counter()
+
+    def _arrive(self) -> None:
+        self.arrivals += 1
+        max_sessions = self.scenario.max_sessions
+        if max_sessions is not None and len(self._sessions) >= max_sessions:
+            self.dropped['max_sessions'] += 1
+            return
+        if not self._connectors:
+            self.dropped['no_connector'] += 1
+            return
+        if not self._tags:
+            self.dropped['no_tag'] += 1
+            return
+
+        connector = self._take(self._connectors)
+        tag = self._take(self._tags)
+        task = asyncio.ensure_future(
+            self._session(connector, tag, self._session_duration())
+        )
+        self._sessions.add(task)
+        task.add_done_callback(self._sessions.discard)
+
+    def _take(self, pool: List[Any]) -> Any:
+        # random item is swapped with last one, so removing it is O(1)
+        index = self.random.randrange(len(pool))
+        pool[index], pool[-1] = pool[-1], pool[index]
+        return pool.pop()
+
+    def _session_duration(self) -> float:
+        model: DurationModel = self.scenario.session_duration
+        if model.distribution == Distribution.UNIFORM:
+            high = model.max
+            if high is None:
+                high = 2 * model.mean - model.min
+            duration = self.random.uniform(model.min, high)
+        elif model.distribution == Distribution.EXPONENTIAL:
+            duration = self.random.expovariate(1 / model.mean)
+        elif model.distribution == Distribution.NORMAL:
+            duration = self.random.gauss(model.mean, model.stddev)
+        else:
+            duration = model.mean
+
+        duration = max(duration, model.min)
+        if model.max is not None:
+            duration = min(duration, model.max)
+        return duration
+
+    async def _session(
+        self, connector: Tuple[str, int], tag: str, duration: float
+    ) -> None:
+        cp_id, connector_id = connector
+        try:
+            if self.scenario.authorize:
+                await self._timed('authorize', execute_authorize(cp_id, tag))
+            response = await self._timed(
+                'start_transaction',
+                execute_start_transaction(cp_id, StartTransaction(
+                    connector_id=connector_id,
+                    id_tag=tag,
+                    start_time=_timestamp(),
+                    meter_start=0
+                ))
+            )
+            if response.get('queued'):
+                # charging point is offline, transaction id is not known
+                self.queued += 1
+                return
+
+            self.started += 1
+            await self._charge(duration)
+            await self._timed(
+                'stop_transaction',
+                execute_stop_transaction(cp_id, StopTransaction(
+                    transaction_id=response['transaction_id'],
+                    stop_time=_timestamp(),
+                    id_tag=tag
+                ))
+            )
+            self.completed += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self.failed += 1
+        finally:
+            self._tags.append(tag)
+            cp = cp_db.get_cp(cp_id)
+            if (
+                cp is not None and cp.state_machine.connectors.get(
+                    connector_id
+                ) == ChargePointStatus.available
+            ):
+                self._connectors.append(connector)
+
+    async def _charge(self, duration: float) -> None:
+        if self.scenario.drain:
+            await asyncio.sleep(duration)
+            return
+
+        # sessions running when scenario ends are stopped at once
+        try:
+            await asyncio.wait_for(self._ended.wait(), duration)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _timed(self, operation: str, coroutine: Awaitable) -> Any:
+        """
+        Awaits operation and records its latency or error.
+
+        :param operation: Name of operation.
+        :param coroutine: Operation coroutine.
+        :return: Operation result.
+        """
+        start = time.perf_counter()
+        try:
+            result = await coroutine
+        except HTTPException as e:
+            self.errors[operation][str(e.status_code)] += 1
+            raise
+        except asyncio.TimeoutError:
+            self.errors[operation]['timeout'] += 1
+            raise
+        except Exception as e:
+            self.errors[operation][type(e).__name__] += 1
+            raise
+
+        self.latencies[operation].append(time.perf_counter() - start)
+        return result
+
+    def _elapsed(self) -> float:
+        if self._start_time is None:
+            return 0.0
+
+        return (self._end_time or time.perf_counter()) - self._start_time
+
+    def _target_rate(self) -> float:
+        duration = sum(phase.duration for phase in self.scenario.phases)
+        if not duration:
+            return 0.0
+
+        return sum(
+            phase.duration * phase.arrival_rate
+            for phase in self.scenario.phases
+        ) / duration
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Returns progress of run, which is its report once run ends.
+        Throughput is related to time of arrival phases.
+
+        :return: Run progress data.
+        """
+        elapsed = self._elapsed()
+        operations = {}
+        for operation in OPERATIONS:
+            count = len(self.latencies[operation])
+            errors = dict(self.errors[operation])
+            if not count and not errors:
+                continue
+
+            operations[operation] = {
+                'count': count,
+                'rate': count / elapsed if elapsed else 0.0,
+                'errors': errors,
+                'latency': _summary(self.latencies[operation]),
+            }
+
+        return {
+            'run_id': self.run_id,
+            'name': self.scenario.name,
+            'state': self.state,
+            'elapsed': elapsed,
+            'target_rate': self._target_rate(),
+            'arrivals': self.arrivals,
+            'sessions': {
+                'started': self.started,
+                'completed': self.completed,
+                'failed': self.failed,
+                'queued': self.queued,
+                'running': len(self._sessions),
+                'dropped': dict(self.dropped),
+            },
+            'throughput': {
+                'arrivals': self.arrivals / elapsed if elapsed else 0.0,
+                'completed': self.completed / elapsed if elapsed else 0.0,
+                'operations': (
+                    sum(item['count'] for item in operations.values()) /
+                    elapsed if elapsed else 0.0
+                ),
+            },
+            'schedule_lag': _summary(self.schedule_lag),
+            'operations': operations,
+            'error': self.error,
+        }
+
+    def _write_report(self) -> None:
+        if self.scenario.report_file is None:
+            return
+
+        try:
+            path = resolve_path(
+                config.SCENARIO_REPORT_DIR, self.scenario.report_file
+            )
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with open(path, 'w') as report_file:
+                json.dump(self.to_dict(), report_file, indent=2)
+        except (OSError, ValueError) as e:
+            logger.error('Report of scenario run {} not written: {}'.format(
+                self.run_id, str(e)
+            ))
+            return
+
+        logger.info('Report of scenario run {} written to {}'.format(
+            self.run_id, path
+        ))
+
+
+def get_run(run_id: str) -> Optional[ScenarioRun]:
+    """
+    Returns scenario run with provided id or None.
+
+    :param run_id: Id of scenario run.
+    :return: Found run.
+    """
+    return _runs.get(run_id)
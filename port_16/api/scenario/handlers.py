@@ -0,0 +1,70 @@
+from typing import Dict, Any
+
+from fastapi import APIRouter
+
+from .schemas import ScenarioModel, ScenarioFileModel, ScenarioRunModel
+from .operations import (
+    start_scenario, start_scenario_file, get_scenario_run
+)
+
+router = APIRouter()
+
+
+@router.post(
+    path='',
+    response_model=ScenarioRunModel,
+    status_code=202,
+    summary='Scenario run',
+    description=(
+        'Runs charging sessions of provided scenario on connected charging '
+        'points within application process'
+    ),
+    response_description='Started scenario run progress',
+)
+async def run_scenario(scenario: ScenarioModel) -> Dict[str, Any]:
+    """
+    Starts scenario run and returns its progress.
+
+    :return: Scenario run progress.
+    """
+    return await start_scenario(scenario)
+
+
+@router.post(
+    path='/file',
+    response_model=ScenarioRunModel,
+    status_code=202,
+    summary='Scenario run from file',
+    description=(
+        'Runs scenario read from YAML or JSON file on application host'
+    ),
+    response_description='Started scenario run progress',
+)
+async def run_scenario_file(
+    scenario_file: ScenarioFileModel
+) -> Dict[str, Any]:
+    """
+    Starts run of scenario file and returns its progress.
+
+    :return: Scenario run progress.
+    """
+    return await start_scenario_file(scenario_file.path)
+
+
+@router.get(
+    path='/{run_id}',
+    response_model=ScenarioRunModel,
+    summary='Scenario run progress',
+    description=(
+        'Returns progress of scenario run, latency and throughput report '
+        'once run ends'
+    ),
+    response_description='Scenario run progress',
+)
+async def get_scenario(run_id: str) -> Dict[str, Any]:
+    """
+    Gets scenario run progress.
+
+    :return: Scenario run progress.
+    """
+    return await get_scenario_run(run_id)
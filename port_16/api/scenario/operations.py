@@ -0,0 +1,98 @@
+import logging
+from typing import Any, Dict
+
+import yaml
+from fastapi.exceptions import HTTPException
+from pydantic import ValidationError
+
+from port_16 import config
+from .engine import ScenarioRun, load_scenario, get_run, resolve_path
+from .schemas import ScenarioModel
+
+logger = logging.getLogger(__name__)
+
+
+async def start_scenario(scenario: ScenarioModel) -> Dict[str, Any]:
+    """
+    Starts run of provided scenario in background and returns its progress
+    data.
+
+    :param scenario: Scenario which will be run.
+    :return: Started scenario run data.
+    """
+    if scenario.report_file is not None:
+        try:
+            resolve_path(config.SCENARIO_REPORT_DIR, scenario.report_file)
+        except ValueError as e:
+            logger.warning('Scenario report file not valid: {}'.format(
+                str(e)
+            ))
+            raise HTTPException(
+                status_code=422,
+                detail=f'Scenario report file is not valid: {e}'
+            )
+
+    scenario_run = ScenarioRun(scenario).start()
+    logger.info('Scenario run {} created for scenario {}'.format(
+        scenario_run.run_id, scenario.name
+    ))
+    return scenario_run.to_dict()
+
+
+async def start_scenario_file(path: str) -> Dict[str, Any]:
+    """
+    Starts run of scenario read from YAML or JSON file of SCENARIO_DIR. If
+    file is not found, it is not placed in SCENARIO_DIR or it is not valid
+    scenario proper exception will be raised.
+
+    :param path: Path of scenario file relative to SCENARIO_DIR.
+    :return: Started scenario run data.
+    """
+    try:
+        file_path = resolve_path(config.SCENARIO_DIR, path)
+    except ValueError as e:
+        logger.warning('Scenario file {} not allowed: {}'.format(
+            path, str(e)
+        ))
+        raise HTTPException(
+            status_code=422,
+            detail=f'Scenario file {path} is not valid: {e}'
+        )
+
+    try:
+        scenario = load_scenario(file_path)
+    except OSError as e:
+        logger.warning('Scenario file {} not read: {}'.format(path, str(e)))
+        raise HTTPException(
+            status_code=404,
+            detail=f'Scenario file {path} not found'
+        )
+    except (ValueError, ValidationError, yaml.YAMLError) as e:
+        logger.warning('Scenario file {} not valid: {}'.format(path, str(e)))
+        raise HTTPException(
+            status_code=422,
+            detail=f'Scenario file {path} is not valid: {e}'
+        )
+
+    return await start_scenario(scenario)
+
+
+async def get_scenario_run(run_id: str) -> Dict[str, Any]:
+    """
+    Returns progress of scenario run with provided id. If run is not found
+    proper exception will be raised.
+
+    :param run_id: Id of scenario run.
+    :return: Scenario run data.
+    """
+    scenario_run = get_run(run_id)
+    if scenario_run is None:
+        logger.warning('Scenario run not found with provided id: {}'.format(
+            run_id
+        ))
+        raise HTTPException(
+            status_code=404,
+            detail=f'Scenario run with id {run_id} not found in system'
+        )
+
+    return scenario_run.to_dict()
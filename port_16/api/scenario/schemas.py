@@ -0,0 +1,107 @@
+from typing import Any, Dict, List, Optional
+
+from pydantic import BaseModel
+from pydantic.main import Enum
+
+from port_16.api.charge_point.schemas import BulkChargingPointsModel
+
+
+class Distribution(str, Enum):
+    FIXED = 'fixed'
+    UNIFORM = 'uniform'
+    EXPONENTIAL = 'exponential'
+    NORMAL = 'normal'
+
+
+class DurationModel(BaseModel):
+    distribution: Distribution = Distribution.FIXED
+    #: Mean seconds, duration of fixed distribution.
+    mean: float = 60
+    #: Standard deviation of normal distribution.
+    stddev: float = 0
+    #: Sampled durations are clipped to min - max seconds, min - max is range
+    #: of uniform distribution.
+    min: float = 0
+    max: Optional[float] = None
+
+
+class ArrivalPhaseModel(BaseModel):
+    #: Seconds of phase.
+    duration: float
+    #: Mean number of sessions arriving per second (Poisson arrivals).
+    arrival_rate: float
+
+
+class TagPoolModel(BaseModel):
+    #: Pattern of tag ids, formatted with numbers from range
+    #: start - start + count.
+    id_pattern: str = 'TAG-{:06d}'
+    start: int = 1
+    count: int = 100
+    #: Explicit tag ids, used instead of id_pattern and range if provided.
+    identities: Optional[List[str]] = None
+
+
+class ScenarioModel(BaseModel):
+    name: str = 'scenario'
+    #: Charging points provisioned and connected before scenario.
+    provision: Optional[BulkChargingPointsModel] = None
+    #: Identities of connected charging points used by scenario, all
+    #: connected (or provisioned) charging points if not provided.
+    charging_points: Optional[List[str]] = None
+    #: Send boot notification of every charging point before sessions, its
+    #: accepted connectors become available for sessions.
+    boot_notification: bool = True
+    #: Max boot notifications sent at once.
+    boot_concurrency: int = 100
+    #: Authorize tag before start transaction. Without it tags must be
+    #: already authorized.
+    authorize: bool = True
+    phases: List[ArrivalPhaseModel]
+    session_duration: DurationModel = DurationModel()
+    tags: TagPoolModel = TagPoolModel()
+    #: Max sessions running at once, further arrivals are dropped.
+    max_sessions: Optional[int] = None
+    #: After last phase wait until sessions end, otherwise running sessions
+    #: are stopped at once.
+    drain: bool = False
+    #: Seed of random arrivals, durations and picked connectors and tags.
+    seed: Optional[int] = None
+    #: Name of JSON report file written to SCENARIO_REPORT_DIR when scenario
+    #: ends.
+    report_file: Optional[str] = None
+
+
+class ScenarioFileModel(BaseModel):
+    #: Path of YAML or JSON scenario file relative to SCENARIO_DIR.
+    path: str
+
+
+class ScenarioRunState(str, Enum):
+    PENDING = 'PENDING'
+    PREPARING = 'PREPARING'
+    RUNNING = 'RUNNING'
+    DRAINING = 'DRAINING'
+    DONE = 'DONE'
+    FAILED = 'FAILED'
+
+
+class ScenarioRunModel(BaseModel):
+    run_id: str
+    name: str
+    state: ScenarioRunState
+    #: Seconds elapsed since first arrival.
+    elapsed: float
+    #: Mean arrival rate of all phases.
+    target_rate: float
+    arrivals: int
+    #: Numbers of started, completed, failed and running sessions and
+    #: dropped arrivals by reason.
+    sessions: Dict[str, Any]
+    #: Arrivals, completed sessions and operations per second.
+    throughput: Dict[str, float]
+    #: Percentiles of seconds arrivals were dispatched late.
+    schedule_lag: Dict[str, float]
+    #: Count, rate, errors by status and latency percentiles of operations.
+    operations: Dict[str, Dict[str, Any]]
+    error: Optional[str] = None
@@ -1,8 +1,15 @@
-from typing import Dict
+from typing import Dict, Any
 
+import inject
 from fastapi import APIRouter
 
-from ..schema.status import StatusResponse
+from port_16 import config
+from port_16.api.common import cp_db
+from ..schema.status import (
+    StatusResponse, StorageCacheStatusResponse, RedisPoolStatusResponse,
+    ShardStatusResponse, ReconnectStatusResponse, OfflineQueueStatusResponse,
+    LoopStatusResponse
+)
 
 
 router = APIRouter()
@@ -24,3 +31,153 @@ async def status() -> Dict[str, str]:
         'version': '1.0',
         'status': 'ok',
     }
+
+
+@router.get(
+    path='/storage-cache',
+    response_model=StorageCacheStatusResponse,
+    summary='Storage cache status',
+    description='Returns storage cache size and hit/miss/eviction counters',
+    response_description='Storage cache information',
+)
+async def storage_cache_status() -> Dict[str, Any]:
+    """Returns storage cache counters which could be used for cache sizing.
+    :return: Storage cache information
+    """
+    #: :type: :class:`port_16.api.common.service.cache.StorageCache`
+    storage_cache = inject.instance('storage_cache')
+    if storage_cache is None:
+        return {'enabled': False}
+
+    return {'enabled': True, **storage_cache.stats()}
+
+
+@router.get(
+    path='/redis-pool',
+    response_model=RedisPoolStatusResponse,
+    summary='Redis pool status',
+    description=(
+        'Returns redis connections pool utilisation and wait times '
+        'in seconds'
+    ),
+    response_description='Redis pool information',
+)
+async def redis_pool_status() -> Dict[str, Any]:
+    """Returns redis pool statistics which show if commands are waiting for
+    free connection.
+    :return: Redis pool information
+    """
+    redis = inject.instance('redis')
+    if redis is None:
+        return {'enabled': False}
+
+    return {'enabled': True, **redis.connection.get_stats()}
+
+
+@router.get(
+    path='/reconnect',
+    response_model=ReconnectStatusResponse,
+    summary='Reconnect status',
+    description=(
+        'Returns number of reconnecting charging points and reconnect '
+        'attempt counters'
+    ),
+    response_description='Reconnect information',
+)
+async def reconnect_status() -> Dict[str, Any]:
+    """Returns reconnect statistics and failed attempts of every charging
+    point which is reconnecting.
+    :return: Reconnect information
+    """
+    if not config.RECONNECT_ENABLED:
+        return {'enabled': False}
+
+    #: :type: :class:`port_16.api.common.reconnect.ReconnectSupervisor`
+    reconnect_supervisor = inject.instance('reconnect_supervisor')
+    return {'enabled': True, **reconnect_supervisor.stats()}
+
+
+@router.get(
+    path='/offline-queue',
+    response_model=OfflineQueueStatusResponse,
+    summary='Offline queue status',
+    description=(
+        'Returns number of messages queued by offline charging points and '
+        'replay counters'
+    ),
+    response_description='Offline queue information',
+)
+async def offline_queue_status() -> Dict[str, Any]:
+    """Returns offline queue statistics and queue length of every charging
+    point with queued messages.
+    :return: Offline queue information
+    """
+    #: :type: :class:`port_16.api.common.offline.OfflineQueueManager`
+    offline_queues = inject.instance('offline_queues')
+    return offline_queues.stats()
+
+
+@router.get(
+    path='/loop',
+    response_model=LoopStatusResponse,
+    summary='Event loop status',
+    description=(
+        'Returns event loop lag percentiles in seconds and load shedding '
+        'counters'
+    ),
+    response_description='Event loop information',
+)
+async def loop_status() -> Dict[str, Any]:
+    """Returns event loop lag of last samples, which shows if charge points
+    and requests wait for saturated loop, and if load is shed.
+    :return: Event loop information
+    """
+    #: :type: :class:`port_16.api.common.loop.LoopMonitor`
+    loop_monitor = inject.instance('loop_monitor')
+    return loop_monitor.stats()
+
+
+@router.get(
+    path='/shard',
+    response_model=ShardStatusResponse,
+    summary='Shard status',
+    description=(
+        'Returns shard of worker which handles request and number of its '
+        'connected charging points'
+    ),
+    response_description='Shard information',
+)
+async def shard_status() -> Dict[str, Any]:
+    """Returns shard of worker and its size.
+    :return: Shard information
+    """
+    #: :type: :class:`port_16.sharding.ShardRouter`
+    shard_router = inject.instance('shard_router')
+    if shard_router is None:
+        return {'enabled': False, 'chargers': cp_db.count()}
+
+    return {
+        'enabled': True,
+        'slot': shard_router.slot,
+        'shard_count': shard_router.worker.shard_count,
+        'worker_id': shard_router.worker.worker_id,
+        'chargers': cp_db.count(),
+    }
+
+
+@router.get(
+    path='/shard/{slot}',
+    response_model=ShardStatusResponse,
+    summary='Status of provided shard',
+    description=(
+        'Returns status of provided shard, request is forwarded to worker '
+        'of that shard'
+    ),
+    response_description='Shard information',
+)
+async def slot_shard_status(slot: int) -> Dict[str, Any]:
+    """Returns shard of worker and its size. Request is handled by worker
+    of provided shard.
+    :return: Shard information
+    """
+    return await shard_status()
@@ -1,3 +1,5 @@
+from typing import Optional, Dict
+
 from pydantic import BaseModel
 
 
@@ -5,3 +7,74 @@ class StatusResponse(BaseModel):
     application: str
     version: str
     status: str
+
+
+class RedisPoolStatusResponse(BaseModel):
+    enabled: bool
+    minsize: int = 0
+    maxsize: int = 0
+    size: int = 0
+    freesize: int = 0
+    in_use: int = 0
+    utilisation: float = 0.0
+    waiting: int = 0
+    acquisitions: int = 0
+    timeouts: int = 0
+    wait_avg: float = 0.0
+    wait_max: float = 0.0
+    wait_p50: float = 0.0
+    wait_p95: float = 0.0
+    wait_p99: float = 0.0
+
+
+class StorageCacheStatusResponse(BaseModel):
+    enabled: bool
+    size: int = 0
+    max_size: int = 0
+    ttl: Optional[float] = None
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    invalidations: int = 0
+
+
+class ShardStatusResponse(BaseModel):
+    enabled: bool
+    slot: Optional[int] = None
+    shard_count: int = 0
+    worker_id: Optional[str] = None
+    chargers: int = 0
+
+
+class ReconnectStatusResponse(BaseModel):
+    enabled: bool
+    reconnecting: int = 0
+    reconnects: int = 0
+    failures: int = 0
+    gave_up: int = 0
+    attempts: Dict[str, int] = {}
+
+
+class OfflineQueueStatusResponse(BaseModel):
+    queued: int = 0
+    replaying: int = 0
+    replayed: int = 0
+    failed: int = 0
+    queues: Dict[str, int] = {}
+
+
+class LoopStatusResponse(BaseModel):
+    enabled: bool
+    interval: float = 0.0
+    samples: int = 0
+    lag: float = 0.0
+    lag_p50: float = 0.0
+    lag_p90: float = 0.0
+    lag_p99: float = 0.0
+    lag_max: float = 0.0
+    overloaded: bool = False
+    shed_threshold: float = 0.0
+    recover_threshold: float = 0.0
+    shed: int = 0
+    slow_callbacks: int = 0
+    ramp_pauses: int = 0
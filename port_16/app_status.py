@@ -32,7 +32,7 @@ class ApplicationStatusService:
         :return: Current stored app status.
         :rtype: AppStatus
         """
-        return self.service
+        return self.status
 
     def set_status(self, status: AppStatus = AppStatus.EXITING):
         """
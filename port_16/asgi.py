@@ -7,5 +7,6 @@ from port_16 import event_handler
 app = FastAPI(version='1.0.0', title='port-16')
 server.attach_routes(app=app)
 server.attach_error_handlers(app=app)
+server.attach_middlewares(app=app)
 app.add_event_handler('startup', event_handler.startup_handler)
 app.add_event_handler('shutdown', event_handler.shutdown_handler)
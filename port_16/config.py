@@ -0,0 +1,237 @@
+"""Module for application configuration. Every value can be overridden with
+an environment variable of the same name."""
+import os
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.environ.get(name)
+    if value is None:
+        return default
+
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def _env_float(name: str, default=None):
+    value = os.environ.get(name)
+    return float(value) if value else default
+
+
+def _env_float_map(name: str) -> dict:
+    # format: KEY=1.5,OTHER_KEY=10
+    value = os.environ.get(name, '')
+    return {
+        key.strip(): float(item)
+        for key, _, item in (
+            pair.partition('=') for pair in value.split(',') if pair.strip()
+        )
+    }
+
+
+APPLICATION = os.environ.get('APPLICATION', 'PORT-16')
+APP_DBS = {
+    'PORT-16': 1,
+    'TRANZIT': 2
+}
+
+# Redis
+#: Redis URL (redis://host:port), unix socket URL (unix:///path/redis.sock)
+#: or unix socket path.
+REDIS_ADDRESS = os.environ.get('REDIS_ADDRESS', 'redis://localhost')
+REDIS_DB = int(os.environ.get('REDIS_DB', APP_DBS.get(APPLICATION, 0)))
+REDIS_POOL_MINSIZE = int(os.environ.get('REDIS_POOL_MINSIZE', 1))
+REDIS_POOL_MAXSIZE = int(os.environ.get('REDIS_POOL_MAXSIZE', 10))
+#: Seconds for creating new redis connection, not limited by default.
+REDIS_CONNECT_TIMEOUT = _env_float('REDIS_CONNECT_TIMEOUT')
+#: Seconds command could wait for free pool connection, not limited by
+#: default.
+REDIS_ACQUIRE_TIMEOUT = _env_float('REDIS_ACQUIRE_TIMEOUT')
+
+# Storage
+#: Storage backend used for entities: `redis` or in-process `memory`.
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'redis')
+#: When enabled CHARGE_POINT, CONNECTOR and TRANSACTION entities are stored
+#: as redis hashes, so partial updates are written field by field.
+STORAGE_HASH_MODE = _env_bool('STORAGE_HASH_MODE', False)
+#: Codec used for writing stored values: `json`, `orjson` or `msgpack`.
+#: Values written by any codec are readable regardless of this setting.
+STORAGE_CODEC = os.environ.get('STORAGE_CODEC', 'json')
+#: Number of entities fetched within one round trip on bulk reads.
+STORAGE_BULK_CHUNK_SIZE = int(os.environ.get('STORAGE_BULK_CHUNK_SIZE', 500))
+#: Max number of entities kept in in-process storage cache, 0 disables cache.
+STORAGE_CACHE_SIZE = int(os.environ.get('STORAGE_CACHE_SIZE', 0))
+#: Seconds after which cached entity expires, 0 means entities never expire.
+STORAGE_CACHE_TTL = float(os.environ.get('STORAGE_CACHE_TTL', 0))
+#: Publish and receive cache invalidations using redis pub/sub. Required when
+#: multiple workers share same redis database.
+STORAGE_CACHE_INVALIDATION = _env_bool('STORAGE_CACHE_INVALIDATION', False)
+
+# Bulk provisioning
+#: Number of charge point connections opened per second by bulk provisioning.
+BULK_CONNECT_RATE = float(os.environ.get('BULK_CONNECT_RATE', 50))
+#: Max number of charge point connections which are being opened at once by
+#: bulk provisioning.
+BULK_CONNECT_CONCURRENCY = int(
+    os.environ.get('BULK_CONNECT_CONCURRENCY', 100)
+)
+#: Max number of charge points created by single bulk provisioning request.
+BULK_MAX_COUNT = int(os.environ.get('BULK_MAX_COUNT', 50000))
+
+# Load scenarios
+#: Directory of scenario files run by POST /scenarios/file, paths of
+#: requests are relative to it.
+SCENARIO_DIR = os.environ.get('SCENARIO_DIR', 'benchmarks/scenarios')
+#: Directory JSON reports of scenario runs are written to.
+SCENARIO_REPORT_DIR = os.environ.get(
+    'SCENARIO_REPORT_DIR', 'benchmarks/results'
+)
+
+# Heartbeat scheduler
+#: Seconds between two checks of due heartbeats.
+HEARTBEAT_TICK = float(os.environ.get('HEARTBEAT_TICK', 0.1))
+#: Heartbeat interval is randomly changed by up to this fraction, so
+#: heartbeats of charge points do not synchronise.
+HEARTBEAT_JITTER = float(os.environ.get('HEARTBEAT_JITTER', 0.1))
+#: Max number of heartbeats processed within single tick.
+HEARTBEAT_BATCH_SIZE = int(os.environ.get('HEARTBEAT_BATCH_SIZE', 1000))
+
+# Charge point state
+#: Seconds between writes of changed in memory charge point states.
+STATE_FLUSH_INTERVAL = float(os.environ.get('STATE_FLUSH_INTERVAL', 0.1))
+
+# Reconnect
+#: Reopen dropped charge point connections, disabled by default.
+RECONNECT_ENABLED = _env_bool('RECONNECT_ENABLED', False)
+#: Seconds of first reconnect backoff, backoff doubles after every failed
+#: attempt and actual delay is random value between 0 and backoff.
+RECONNECT_BACKOFF_BASE = float(os.environ.get('RECONNECT_BACKOFF_BASE', 1))
+#: Max seconds of reconnect backoff.
+RECONNECT_BACKOFF_CAP = float(os.environ.get('RECONNECT_BACKOFF_CAP', 60))
+#: Number of failed attempts after which charge point is not reconnected
+#: anymore, 0 means charge point is reconnected until it succeeds.
+RECONNECT_MAX_ATTEMPTS = int(os.environ.get('RECONNECT_MAX_ATTEMPTS', 0))
+#: Max number of reconnect attempts per second of all charge points.
+RECONNECT_RATE = float(os.environ.get('RECONNECT_RATE', 20))
+#: Max number of reconnect attempts started at once when limiter is idle.
+RECONNECT_BURST = int(os.environ.get('RECONNECT_BURST', 20))
+
+# Outbound calls
+#: Max number of OCPP calls of one charge point which are sent or waiting
+#: to be sent, further calls are rejected with Too Many Requests.
+CALL_QUEUE_MAX_DEPTH = int(os.environ.get('CALL_QUEUE_MAX_DEPTH', 10))
+#: Seconds charge point waits for response of central system.
+CALL_TIMEOUT = float(os.environ.get('CALL_TIMEOUT', 30))
+#: Response timeouts of specific actions, e.g. Heartbeat=10,Authorize=5.
+CALL_TIMEOUTS = _env_float_map('CALL_TIMEOUTS')
+
+# Meter values
+#: Seconds between MeterValues of transaction, 0 (default) disables sampled
+#: data (OCPP MeterValueSampleInterval).
+METER_VALUE_SAMPLE_INTERVAL = int(
+    os.environ.get('METER_VALUE_SAMPLE_INTERVAL', 0)
+)
+#: Measurands of sampled MeterValues and StopTransaction transaction data
+#: (OCPP MeterValuesSampledData).
+METER_VALUES_SAMPLED_DATA = os.environ.get(
+    'METER_VALUES_SAMPLED_DATA',
+    'Energy.Active.Import.Register,Power.Active.Import,Current.Import,SoC'
+)
+#: Seconds of clock aligned data interval, 0 disables clock aligned
+#: MeterValues (OCPP ClockAlignedDataInterval).
+CLOCK_ALIGNED_DATA_INTERVAL = int(
+    os.environ.get('CLOCK_ALIGNED_DATA_INTERVAL', 0)
+)
+#: Measurands of clock aligned MeterValues (OCPP MeterValuesAlignedData).
+METER_VALUES_ALIGNED_DATA = os.environ.get(
+    'METER_VALUES_ALIGNED_DATA', 'Energy.Active.Import.Register'
+)
+#: Max number of sampled readings in StopTransaction transaction data
+#: (OCPP StopTxnSampledDataMaxLength).
+STOP_TXN_SAMPLED_DATA_MAX_LENGTH = int(
+    os.environ.get('STOP_TXN_SAMPLED_DATA_MAX_LENGTH', 10)
+)
+#: Max charging power of transaction in W.
+METER_MAX_POWER = float(os.environ.get('METER_MAX_POWER', 11000))
+#: Seconds between computations of readings of all transactions.
+METER_VALUES_TICK = float(os.environ.get('METER_VALUES_TICK', 1))
+
+# Offline queue
+#: Max number of messages queued by charge point while it is offline.
+OFFLINE_QUEUE_MAX_LENGTH = int(
+    os.environ.get('OFFLINE_QUEUE_MAX_LENGTH', 1000)
+)
+#: Handling of message queued in full queue: drop_oldest, drop_newest or
+#: reject (command fails with Service Unavailable).
+OFFLINE_QUEUE_OVERFLOW = os.environ.get(
+    'OFFLINE_QUEUE_OVERFLOW', 'drop_oldest'
+)
+#: Mirror offline queues in storage backend lists (redis lists with redis
+#: backend), so they are replayed after application restart.
+OFFLINE_QUEUE_DURABLE = _env_bool('OFFLINE_QUEUE_DURABLE', False)
+#: Max number of charge points replaying theirs offline queues at once.
+OFFLINE_REPLAY_CONCURRENCY = int(
+    os.environ.get('OFFLINE_REPLAY_CONCURRENCY', 50)
+)
+
+# TLS
+#: Verify certificate and hostname of central system for wss connections.
+TLS_VERIFY = _env_bool('TLS_VERIFY', False)
+#: CA bundle used to verify central system, system CAs are used if not set.
+TLS_CA_FILE = os.environ.get('TLS_CA_FILE') or None
+#: Client certificate (PEM, may include key) presented to central system.
+TLS_CERT_FILE = os.environ.get('TLS_CERT_FILE') or None
+#: Private key of client certificate, if not included in TLS_CERT_FILE.
+TLS_KEY_FILE = os.environ.get('TLS_KEY_FILE') or None
+#: Password of client certificate private key.
+TLS_KEY_PASSWORD = os.environ.get('TLS_KEY_PASSWORD') or None
+#: Resume TLS sessions of previous connections to same host.
+TLS_SESSION_RESUMPTION = _env_bool('TLS_SESSION_RESUMPTION', True)
+
+# Sharding
+#: Number of shards (worker processes) charge points are distributed to,
+#: 0 disables sharded mode. Requires redis storage backend.
+SHARD_COUNT = int(os.environ.get('SHARD_COUNT', 0))
+#: Number of points of every shard on consistent hashing ring.
+SHARD_VNODES = int(os.environ.get('SHARD_VNODES', 64))
+#: Seconds shard slot is leased to worker, lease is extended while worker
+#: is running.
+SHARD_SLOT_TTL = int(os.environ.get('SHARD_SLOT_TTL', 10))
+#: Seconds worker waits for response of request forwarded to other shard.
+SHARD_FORWARD_TIMEOUT = float(os.environ.get('SHARD_FORWARD_TIMEOUT', 35))
+
+# Event loop monitor
+#: Seconds between event loop lag samples, 0 disables monitor.
+LOOP_LAG_INTERVAL = float(os.environ.get('LOOP_LAG_INTERVAL', 0.1))
+#: Number of last lag samples used for percentiles.
+LOOP_LAG_WINDOW = int(os.environ.get('LOOP_LAG_WINDOW', 600))
+#: Seconds event loop may be blocked before stack of running callback is
+#: logged, 0 (default) disables slow callback logging.
+LOOP_SLOW_CALLBACK_DURATION = float(
+    os.environ.get('LOOP_SLOW_CALLBACK_DURATION', 0)
+)
+#: Seconds of smoothed event loop lag above which new bulk, command and
+#: scenario requests are rejected with Service Unavailable and connection
+#: ramp-up pauses, 0 (default) disables load shedding.
+LOOP_SHED_THRESHOLD = float(os.environ.get('LOOP_SHED_THRESHOLD', 0))
+#: Seconds of smoothed lag below which shedding stops, half of
+#: LOOP_SHED_THRESHOLD by default.
+LOOP_RECOVER_THRESHOLD = _env_float('LOOP_RECOVER_THRESHOLD')
+
+# Logging
+#: Log records are put to queue and written by background thread, so file
+#: and console output does not block event loop. Disabled by default.
+LOG_QUEUE = _env_bool('LOG_QUEUE', False)
+#: Max number of log records waiting to be written, records logged to full
+#: queue are dropped. 0 means queue is not limited.
+LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', 10000))
+#: Ratio of kept records below WARNING of loggers and theirs children,
+#: e.g. ocpp=0.01,port_16.api.common.service.storage=0.1.
+LOG_SAMPLING = _env_float_map('LOG_SAMPLING')
+#: Max number of records below WARNING per second of loggers and theirs
+#: children, e.g. port_16.api.common.ocpp=100.
+LOG_RATE_LIMITS = _env_float_map('LOG_RATE_LIMITS')
+
+# Profiling
+#: Seconds between stack samples of profiling endpoint.
+PROFILE_INTERVAL = float(os.environ.get('PROFILE_INTERVAL', 0.01))
+#: Max seconds of single profiling request.
+PROFILE_MAX_DURATION = float(os.environ.get('PROFILE_MAX_DURATION', 300))
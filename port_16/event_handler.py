@@ -2,41 +2,149 @@ import logging
 from functools import partial
 
 import inject
-import aioredis
 
+from port_16 import config
 from port_16.ioc import production
+from port_16.logs import stop_logging
 from port_16.app_status import ApplicationStatusService, AppStatus
+from port_16.api.common import (
+    ChargePointService, ConnectorService, AuthTagService, TransactionService,
+    HeartbeatScheduler, StatePersister, ReconnectSupervisor,
+    OfflineQueueManager, MeterValuesEngine, LoopMonitor
+)
+from port_16.api.common.service.cache import StorageCache
+from port_16.api.common.service.backend import (
+    RedisBackend, MemoryBackend, get_codec
+)
+from port_16.api.common.service.backend.redis_pool import create_redis_pool
+from port_16.sharding import ShardWorker, ShardRouter
 
 logger = logging.getLogger(__name__)
-APPLICATION = 'PORT-16'
-APP_DBS = {
-    'PORT-16': 1,
-    'TRANZIT': 2
-}
 
 
 async def startup_handler():
-    redis = await aioredis.create_redis_pool(
-        'redis://localhost', db=APP_DBS[APPLICATION]
-    )
+    if config.STORAGE_BACKEND == MemoryBackend.name:
+        redis = None
+        storage_backend = MemoryBackend()
+    else:
+        redis = await create_redis_pool(
+            config.REDIS_ADDRESS,
+            db=config.REDIS_DB,
+            minsize=config.REDIS_POOL_MINSIZE,
+            maxsize=config.REDIS_POOL_MAXSIZE,
+            connect_timeout=config.REDIS_CONNECT_TIMEOUT,
+            acquire_timeout=config.REDIS_ACQUIRE_TIMEOUT
+        )
+        storage_backend = RedisBackend(
+            redis, codec=get_codec(config.STORAGE_CODEC)
+        )
+    logger.info('Using {} storage backend'.format(storage_backend.name))
+
+    storage_cache = None
+    if config.STORAGE_CACHE_SIZE > 0:
+        storage_cache = StorageCache(
+            max_size=config.STORAGE_CACHE_SIZE,
+            ttl=config.STORAGE_CACHE_TTL,
+            redis_client=(
+                redis if config.STORAGE_CACHE_INVALIDATION else None
+            )
+        )
+        await storage_cache.start_listener()
+
+    shard_router = None
+    if config.SHARD_COUNT > 0:
+        if redis is None:
+            raise RuntimeError('Sharded mode requires redis storage backend')
+
+        shard_worker = ShardWorker(
+            redis, config.SHARD_COUNT, ttl=config.SHARD_SLOT_TTL
+        )
+        await shard_worker.claim()
+        shard_router = ShardRouter(
+            redis, shard_worker,
+            vnodes=config.SHARD_VNODES,
+            timeout=config.SHARD_FORWARD_TIMEOUT
+        )
+        if storage_cache is not None and storage_cache.redis_client is None:
+            logger.warning(
+                'Storage cache is used in sharded mode without '
+                'STORAGE_CACHE_INVALIDATION, workers could read stale data'
+            )
+
+    heartbeat_scheduler = HeartbeatScheduler()
+    state_persister = StatePersister()
+    reconnect_supervisor = ReconnectSupervisor()
+    offline_queues = OfflineQueueManager()
+    meter_engine = MeterValuesEngine()
+    loop_monitor = LoopMonitor()
     inject.configure(partial(production(
         instance_kwargs={
             'redis': redis,
+            'storage_backend': storage_backend,
+            'storage_cache': storage_cache,
+            'heartbeat_scheduler': heartbeat_scheduler,
+            'state_persister': state_persister,
+            'reconnect_supervisor': reconnect_supervisor,
+            'offline_queues': offline_queues,
+            'meter_engine': meter_engine,
+            'loop_monitor': loop_monitor,
+            'shard_router': shard_router,
         },
         provider_kwargs={
             'status_service': ApplicationStatusService.instance
         }
     )))
+    for service_cls in (
+        ChargePointService, ConnectorService,
+        TransactionService, AuthTagService
+    ):
+        service = service_cls(identity='')
+        await service.migrate_keys_index()
+        await service.migrate_entities_format()
+
+    loop_monitor.start()
+    heartbeat_scheduler.start()
+    state_persister.start()
+    meter_engine.start()
+    if shard_router is not None:
+        await shard_router.start()
 
 
 async def shutdown_handler():
-    redis = inject.instance('redis')
-    redis.close()
-    await redis.wait_closed()
-    logger.info('Redis Connection closed... Shutting down')
+    #: :type: :class:`port_16.api.common.scheduler.HeartbeatScheduler`
+    heartbeat_scheduler = inject.instance('heartbeat_scheduler')
+    await heartbeat_scheduler.stop()
+    #: :type: :class:`port_16.api.common.state.StatePersister`
+    state_persister = inject.instance('state_persister')
+    await state_persister.stop()
+    logger.info('Charge point states persisted')
+    #: :type: :class:`port_16.api.common.meter.MeterValuesEngine`
+    meter_engine = inject.instance('meter_engine')
+    await meter_engine.stop()
+    #: :type: :class:`port_16.api.common.loop.LoopMonitor`
+    loop_monitor = inject.instance('loop_monitor')
+    await loop_monitor.stop()
+
+    #: :type: :class:`port_16.sharding.ShardRouter`
+    shard_router = inject.instance('shard_router')
+    if shard_router is not None:
+        await shard_router.stop()
+        await shard_router.worker.release()
+
+    #: :type: :class:`port_16.api.common.service.cache.StorageCache`
+    storage_cache = inject.instance('storage_cache')
+    if storage_cache is not None:
+        await storage_cache.stop_listener()
+
+    #: :type: :class:`port_16.api.common.service.backend.StorageBackend`
+    storage_backend = inject.instance('storage_backend')
+    await storage_backend.close()
+    logger.info('Storage backend closed... Shutting down')
     #: :type: :class:`port_16.app_status.ApplicationStatusService`
     status_service = inject.instance('status_service')
     status_service.set_status(AppStatus.EXITING)
     logger.info('Setting app status: {}'.format(
         status_service.get_status())
     )
+    # queued records are written before process exits
+    stop_logging()
@@ -1,9 +1,31 @@
 import os
 import time
+import queue
+import atexit
+import random
 import logging
 import logging.config
+import logging.handlers
+from typing import Dict, Optional, Tuple
+
+from port_16 import config
+from port_16.metrics import Counter, Gauge
 
 logger = logging.getLogger(__name__)
+
+RECORDS_DROPPED = Counter(
+    'port16_log_records_dropped_total',
+    'Number of log records dropped because log queue was full'
+)
+RECORDS_SUPPRESSED = Counter(
+    'port16_log_records_suppressed_total',
+    'Number of log records suppressed by sampling or rate limit of logger',
+    ('logger', 'reason')
+)
+QUEUE_DEPTH = Gauge(
+    'port16_log_queue_depth',
+    'Number of log records waiting to be written by log writer thread'
+)
 LOGGING_CONFIG = {
     "version": 1,
     "disable_existing_loggers": False,
@@ -39,9 +61,106 @@ LOGGING_CONFIG = {
     },
     "root": {}
 }
+#: Writes queued records while queued logging is configured
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queue handler which never blocks logging thread. Only message is merged
+    with its arguments before record is queued, formatting and exception
+    tracebacks are left to writer thread. Records logged to full queue are
+    dropped.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.args:
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            RECORDS_DROPPED.inc()
+
+
+class _QueueWriter(logging.handlers.QueueListener):
+
+    def enqueue_sentinel(self) -> None:
+        # full queue is drained by writer thread, so this does not hang
+        self.queue.put(self._sentinel)
+
+
+class LoggerRateFilter(logging.Filter):
+    """
+    Samples and rate limits records below WARNING of configured loggers and
+    theirs children, e.g. per charger messages logged on every heartbeat.
+    Sampling keeps random ratio of records, rate limit keeps at most limit
+    records per second. Nearest configured ancestor of logger is used.
+    """
+
+    def __init__(
+        self, sampling: Dict[str, float], rate_limits: Dict[str, float]
+    ):
+        super(LoggerRateFilter, self).__init__()
+        self.sampling = sampling
+        self.rate_limits = rate_limits
+        self._rules: Dict[str, Optional[Tuple[str, float, float]]] = {}
+        #: Second and number of kept records of rate limited loggers
+        self._windows: Dict[str, list] = {
+            name: [0, 0] for name in rate_limits
+        }
+        self._suppressed = {
+            name: {
+                reason: RECORDS_SUPPRESSED.labels(name, reason)
+                for reason in ('sampled', 'rate_limited')
+            }
+            for name in set(sampling) | set(rate_limits)
+        }
 
+    def _rule(self, name: str) -> Optional[Tuple[str, float, float]]:
+        while name:
+            if name in self.sampling or name in self.rate_limits:
+                return (
+                    name, self.sampling.get(name, 1.0),
+                    self.rate_limits.get(name, 0.0)
+                )
+            name = name.rpartition('.')[0]
+        return None
 
-def configure_logging(application, project_dir, debug):
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+
+        try:
+            rule = self._rules[record.name]
+        except KeyError:
+            rule = self._rules[record.name] = self._rule(record.name)
+        if rule is None:
+            return True
+
+        name, ratio, limit = rule
+        if ratio < 1 and random.random() >= ratio:
+            self._suppressed[name]['sampled'].inc()
+            return False
+
+        if limit > 0:
+            second = int(time.monotonic())
+            window = self._windows[name]
+            if window[0] != second:
+                window[0] = second
+                window[1] = 0
+            if window[1] >= limit:
+                self._suppressed[name]['rate_limited'].inc()
+                return False
+            window[1] += 1
+
+        return True
+
+
+def configure_logging(application, project_dir, debug, queued=None):
     """Configure the logging for the current application.
 
     Also if the production environment configuration exists the logging
@@ -56,7 +175,16 @@ def configure_logging(application, project_dir, debug):
     :type project_dir: str
     :param debug: Information if debug mode is enabled
     :type debug: bool
+    :param queued: Write records by background thread, LOG_QUEUE if not
+        provided. Records are then sampled and rate limited by LOG_SAMPLING
+        and LOG_RATE_LIMITS, regardless of queued mode.
+    :type queued: bool
     """
+    global _listener
+    queued = config.LOG_QUEUE if queued is None else queued
+    # handlers of previous configuration are closed by dictConfig
+    stop_logging()
+
     # Get the log directory
     log_dir = (
         '/data/log/{0}'.format(application) if not debug
@@ -87,8 +215,54 @@ def configure_logging(application, project_dir, debug):
     logging.Formatter.converter = time.gmtime
     # Configure logging
     logging.config.dictConfig(LOGGING_CONFIG)
+    root = logging.getLogger()
+    handlers = list(root.handlers)
+    if queued:
+        log_queue = queue.Queue(config.LOG_QUEUE_SIZE)
+        for handler in handlers:
+            root.removeHandler(handler)
+        queue_handler = NonBlockingQueueHandler(log_queue)
+        root.addHandler(queue_handler)
+        _listener = _QueueWriter(
+            log_queue, *handlers, respect_handler_level=True
+        )
+        _listener.start()
+        QUEUE_DEPTH.set_function(log_queue.qsize)
+        handlers = [queue_handler]
+
+    if config.LOG_SAMPLING or config.LOG_RATE_LIMITS:
+        record_filter = LoggerRateFilter(
+            config.LOG_SAMPLING, config.LOG_RATE_LIMITS
+        )
+        for handler in handlers:
+            handler.addFilter(record_filter)
+
     logger.info(
-        'Logging configured for application {}. Log: {}'.format(
-            application, debug_log
+        'Logging configured for application {}. Log: {}{}'.format(
+            application, debug_log, ' (queued)' if queued else ''
         )
     )
+
+
+def stop_logging():
+    """Writes queued log records and attaches handlers back to root logger,
+    so records logged afterwards are written directly. Does nothing if
+    queued logging is not configured.
+    """
+    global _listener
+    if _listener is None:
+        return
+
+    listener, _listener = _listener, None
+    listener.stop()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        if isinstance(handler, NonBlockingQueueHandler):
+            root.removeHandler(handler)
+    for handler in listener.handlers:
+        root.addHandler(handler)
+    QUEUE_DEPTH.set_function(None)
+
+
+# records queued when process exits without shutdown handler are written
+atexit.register(stop_logging)
@@ -0,0 +1,254 @@
+"""Module for lightweight metrics (counters, gauges and histograms) which are
+rendered in Prometheus text exposition format. Children of labelled metrics
+are created once and cached, histogram buckets are preallocated, so
+observing value does not allocate memory."""
+from bisect import bisect_left
+from typing import Dict, Tuple, List, Sequence, Callable, Optional
+
+#: Latency buckets in seconds
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+
+def _escape(value: str) -> str:
+    return (
+        str(value).replace('\\', '\\\\')
+        .replace('"', '\\"').replace('\n', '\\n')
+    )
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ''
+
+    return '{' + ','.join(
+        '{}="{}"'.format(name, _escape(value))
+        for name, value in zip(names, values)
+    ) + '}'
+
+
+class _CounterChild:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+
+class _GaugeChild:
+    __slots__ = ('value', 'function')
+
+    def __init__(self):
+        self.value = 0.0
+        self.function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.value -= amount
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        """
+        Sets function which returns gauge value, so value is computed only
+        when metrics are rendered.
+        """
+        self.function = function
+
+    def get(self) -> float:
+        return self.function() if self.function else self.value
+
+
+class _HistogramChild:
+    __slots__ = ('bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metric:
+    """
+    Base class of metrics. Metric without label names has single child
+    which is used directly.
+    """
+    metric_type = 'untyped'
+
+    def __init__(
+        self, name: str, documentation: str,
+        labelnames: Sequence[str] = (), registry=None
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        (registry or REGISTRY).register(self)
+
+    def _new_child(self):
+        raise NotImplementedError()
+
+    def labels(self, *values: str):
+        """
+        Returns child of metric for provided label values.
+
+        :param values: Label values in order of label names.
+        :return: Metric child.
+        """
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(
+                    'Metric {} expects labels {}'.format(
+                        self.name, self.labelnames
+                    )
+                )
+            child = self._children[values] = self._new_child()
+
+        return child
+
+    def render(self) -> List[str]:
+        lines = [
+            '# HELP {} {}'.format(self.name, self.documentation),
+            '# TYPE {} {}'.format(self.name, self.metric_type),
+        ]
+        for values, child in list(self._children.items()):
+            lines.extend(self._render_child(values, child))
+
+        return lines
+
+    def _render_child(self, values, child) -> List[str]:
+        raise NotImplementedError()
+
+
+class Counter(Metric):
+    metric_type = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+    def _render_child(self, values, child) -> List[str]:
+        return ['{}{} {}'.format(
+            self.name, _format_labels(self.labelnames, values), child.value
+        )]
+
+
+class Gauge(Metric):
+    metric_type = 'gauge'
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value: float) -> None:
+        self.labels().set(value)
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.labels().dec(amount)
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        self.labels().set_function(function)
+
+    def _render_child(self, values, child) -> List[str]:
+        return ['{}{} {}'.format(
+            self.name, _format_labels(self.labelnames, values), child.get()
+        )]
+
+
+class Histogram(Metric):
+    metric_type = 'histogram'
+
+    def __init__(
+        self, name: str, documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS, registry=None
+    ):
+        self.buckets = tuple(sorted(buckets))
+        super(Histogram, self).__init__(
+            name, documentation, labelnames, registry
+        )
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def _render_child(self, values, child) -> List[str]:
+        lines = []
+        names = self.labelnames + ('le',)
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), child.counts):
+            cumulative += count
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            lines.append('{}_bucket{} {}'.format(
+                self.name, _format_labels(names, values + (le,)), cumulative
+            ))
+
+        labels = _format_labels(self.labelnames, values)
+        lines.append('{}_sum{} {}'.format(self.name, labels, child.sum))
+        lines.append('{}_count{} {}'.format(self.name, labels, child.count))
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Collection of all created metrics.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._collectors: List[Callable[[], None]] = []
+
+    def register(self, metric: Metric) -> None:
+        if metric.name in self._metrics:
+            raise ValueError(
+                'Metric {} is already registered'.format(metric.name)
+            )
+        self._metrics[metric.name] = metric
+
+    def register_collector(self, collector: Callable[[], None]) -> None:
+        """
+        Registers function which updates metrics before they are rendered,
+        for values which are cheaper to compute on scrape than to track on
+        every change.
+
+        :param collector: Function which updates metrics.
+        """
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        """
+        Renders all metrics in Prometheus text exposition format.
+
+        :return: Rendered metrics.
+        """
+        for collector in list(self._collectors):
+            collector()
+
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
@@ -0,0 +1 @@
+from .server import MockCentralSystem, MockChargePoint, CentralSystemBehaviour
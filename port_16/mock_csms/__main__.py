@@ -0,0 +1,95 @@
+"""Runs mock OCPP 1.6 central system which port-16 charge points connect to
+instead of real central system.
+
+Usage: python -m port_16.mock_csms --port 8020 --delay 0.01
+    --delays Authorize=0.1 --accept-ratios BootNotification=0.9
+"""
+import json
+import asyncio
+import logging
+import argparse
+from typing import Dict
+
+from .server import (
+    MockCentralSystem, CentralSystemBehaviour, DEFAULT_HOST, DEFAULT_PORT,
+    DEFAULT_PATH
+)
+
+logger = logging.getLogger(__name__)
+
+
+def action_map(value: str) -> Dict[str, float]:
+    # format: Action=1.5,OtherAction=10
+    return {
+        action.strip(): float(item)
+        for action, _, item in (
+            pair.partition('=') for pair in value.split(',') if pair.strip()
+        )
+    }
+
+
+async def run(args):
+    central_system = MockCentralSystem(
+        CentralSystemBehaviour(
+            delay=args.delay,
+            jitter=args.jitter,
+            delays=args.delays,
+            accept_ratio=args.accept_ratio,
+            accept_ratios=args.accept_ratios,
+            heartbeat_interval=args.heartbeat_interval,
+            seed=args.seed
+        ),
+        host=args.host, port=args.port, path=args.path
+    )
+    await central_system.start()
+    # ready line is read by benchmarks which start mock central system
+    print('listening {}'.format(central_system.port), flush=True)
+    try:
+        while True:
+            await asyncio.sleep(args.stats_interval)
+            logger.warning(json.dumps(central_system.stats()))
+    finally:
+        await central_system.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument(
+        '--port', type=int, default=DEFAULT_PORT, help='0 binds free port'
+    )
+    parser.add_argument('--path', default=DEFAULT_PATH)
+    parser.add_argument(
+        '--delay', type=float, default=0.0, help='Seconds of response delay'
+    )
+    parser.add_argument(
+        '--jitter', type=float, default=0.0,
+        help='Max random seconds added to response delay'
+    )
+    parser.add_argument(
+        '--delays', type=action_map, default={},
+        help='Response delays of actions, e.g. Authorize=0.1,Heartbeat=0'
+    )
+    parser.add_argument(
+        '--accept-ratio', type=float, default=1.0,
+        help='Ratio of accepted boot notifications and id tags'
+    )
+    parser.add_argument(
+        '--accept-ratios', type=action_map, default={},
+        help='Accept ratios of actions, e.g. BootNotification=0.9'
+    )
+    parser.add_argument(
+        '--heartbeat-interval', type=int, default=300,
+        help='Interval returned in boot notification response'
+    )
+    parser.add_argument('--seed', type=int)
+    parser.add_argument(
+        '--stats-interval', type=float, default=10,
+        help='Seconds between logged statistics'
+    )
+    arguments = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    try:
+        asyncio.run(run(arguments))
+    except KeyboardInterrupt:
+        pass
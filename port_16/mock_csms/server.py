@@ -0,0 +1,253 @@
+import random
+import asyncio
+import logging
+import itertools
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+
+import websockets
+from ocpp.routing import on
+from ocpp.v16 import ChargePoint as OcppCp
+from ocpp.v16 import call_result
+from ocpp.v16.enums import (
+    Action, AuthorizationStatus, DataTransferStatus, RegistrationStatus
+)
+from websockets.exceptions import ConnectionClosed
+
+logger = logging.getLogger(__name__)
+
+#: Defaults match WS_HOST and WS_MAIN_PATH of charging point model
+DEFAULT_HOST = 'localhost'
+DEFAULT_PORT = 8020
+DEFAULT_PATH = 'websocket/v16'
+SUBPROTOCOL = 'ocpp1.6'
+
+
+def _now(delta: timedelta = timedelta()) -> str:
+    return (datetime.now(timezone.utc) + delta).isoformat()
+
+
+class CentralSystemBehaviour:
+    """
+    Responses of mock central system: seconds every response is delayed,
+    which are randomly increased by up to jitter, and ratio of accepted
+    boot notifications and id tags. Delays and ratios of specific actions
+    override defaults.
+    """
+
+    def __init__(
+        self,
+        delay: float = 0.0,
+        jitter: float = 0.0,
+        delays: Optional[Dict[str, float]] = None,
+        accept_ratio: float = 1.0,
+        accept_ratios: Optional[Dict[str, float]] = None,
+        heartbeat_interval: int = 300,
+        seed: Optional[int] = None
+    ):
+        self.delay = delay
+        self.jitter = jitter
+        self.delays = delays or {}
+        self.accept_ratio = accept_ratio
+        self.accept_ratios = accept_ratios or {}
+        self.heartbeat_interval = heartbeat_interval
+        self.random = random.Random(seed)
+
+    def response_delay(self, action: str) -> float:
+        delay = self.delays.get(action, self.delay)
+        if self.jitter:
+            delay += self.random.uniform(0, self.jitter)
+        return delay
+
+    def accepts(self, action: str) -> bool:
+        ratio = self.accept_ratios.get(action, self.accept_ratio)
+        return ratio >= 1 or self.random.random() < ratio
+
+
+class MockChargePoint(OcppCp):
+    """
+    Central system side of charge point connection. Requests are answered
+    without schema validation, so central system costs as little CPU as
+    possible.
+    """
+
+    def __init__(self, id: str, connection: Any, central_system: Any):
+        super().__init__(id, connection)
+        #: :type: :class:`MockCentralSystem`
+        self.central_system = central_system
+        self.behaviour = central_system.behaviour
+
+    async def _respond(self, action: Action) -> bool:
+        """
+        Counts request, waits for response delay and decides if request is
+        accepted.
+
+        :param action: Action of request.
+        :return: True if request is accepted.
+        """
+        name = action.value
+        self.central_system.requests[name] += 1
+        delay = self.behaviour.response_delay(name)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        accepted = self.behaviour.accepts(name)
+        if not accepted:
+            self.central_system.rejected[name] += 1
+        return accepted
+
+    def _id_tag_info(self, accepted: bool) -> Dict[str, Any]:
+        return {
+            'status': (
+                AuthorizationStatus.accepted if accepted
+                else AuthorizationStatus.invalid
+            ),
+            'expiry_date': _now(timedelta(days=1)),
+        }
+
+    @on(Action.BootNotification, skip_schema_validation=True)
+    async def on_boot_notification(self, **kwargs):
+        accepted = await self._respond(Action.BootNotification)
+        return call_result.BootNotificationPayload(
+            current_time=_now(),
+            interval=self.behaviour.heartbeat_interval,
+            status=(
+                RegistrationStatus.accepted if accepted
+                else RegistrationStatus.rejected
+            )
+        )
+
+    @on(Action.Heartbeat, skip_schema_validation=True)
+    async def on_heartbeat(self, **kwargs):
+        await self._respond(Action.Heartbeat)
+        return call_result.HeartbeatPayload(current_time=_now())
+
+    @on(Action.Authorize, skip_schema_validation=True)
+    async def on_authorize(self, id_tag: str, **kwargs):
+        accepted = await self._respond(Action.Authorize)
+        return call_result.AuthorizePayload(
+            id_tag_info=self._id_tag_info(accepted)
+        )
+
+    @on(Action.StartTransaction, skip_schema_validation=True)
+    async def on_start_transaction(self, id_tag: str, **kwargs):
+        accepted = await self._respond(Action.StartTransaction)
+        return call_result.StartTransactionPayload(
+            transaction_id=next(self.central_system.transaction_ids),
+            id_tag_info=self._id_tag_info(accepted)
+        )
+
+    @on(Action.StopTransaction, skip_schema_validation=True)
+    async def on_stop_transaction(self, id_tag: str = None, **kwargs):
+        accepted = await self._respond(Action.StopTransaction)
+        return call_result.StopTransactionPayload(
+            id_tag_info=self._id_tag_info(accepted) if id_tag else None
+        )
+
+    @on(Action.StatusNotification, skip_schema_validation=True)
+    async def on_status_notification(self, **kwargs):
+        await self._respond(Action.StatusNotification)
+        return call_result.StatusNotificationPayload()
+
+    @on(Action.MeterValues, skip_schema_validation=True)
+    async def on_meter_values(self, **kwargs):
+        await self._respond(Action.MeterValues)
+        return call_result.MeterValuesPayload()
+
+    @on(Action.FirmwareStatusNotification, skip_schema_validation=True)
+    async def on_firmware_status_notification(self, **kwargs):
+        await self._respond(Action.FirmwareStatusNotification)
+        return call_result.FirmwareStatusNotificationPayload()
+
+    @on(Action.DiagnosticsStatusNotification, skip_schema_validation=True)
+    async def on_diagnostics_status_notification(self, **kwargs):
+        await self._respond(Action.DiagnosticsStatusNotification)
+        return call_result.DiagnosticsStatusNotificationPayload()
+
+    @on(Action.DataTransfer, skip_schema_validation=True)
+    async def on_data_transfer(self, **kwargs):
+        accepted = await self._respond(Action.DataTransfer)
+        return call_result.DataTransferPayload(
+            status=(
+                DataTransferStatus.accepted if accepted
+                else DataTransferStatus.rejected
+            )
+        )
+
+
+class MockCentralSystem:
+    """
+    Lightweight OCPP 1.6 central system stand-in, used instead of real
+    central system to measure port-16 itself. Charge points connect to
+    ws://host:port/path/{charge point id}.
+    """
+
+    def __init__(
+        self,
+        behaviour: Optional[CentralSystemBehaviour] = None,
+        host: str = DEFAULT_HOST,
+        port: int = DEFAULT_PORT,
+        path: str = DEFAULT_PATH
+    ):
+        self.behaviour = behaviour or CentralSystemBehaviour()
+        self.host = host
+        self.port = port
+        self.path = '/' + path.strip('/')
+        self.connected = 0
+        self.connections = 0
+        self.requests: Dict[str, int] = defaultdict(int)
+        self.rejected: Dict[str, int] = defaultdict(int)
+        self.transaction_ids = itertools.count(1)
+        self._server = None
+
+    async def start(self) -> None:
+        self._server = await websockets.serve(
+            self._on_connect, self.host, self.port,
+            subprotocols=[SUBPROTOCOL]
+        )
+        if not self.port:
+            # port 0 is bound to free port
+            self.port = self._server.sockets[0].getsockname()[1]
+        logger.info('Mock central system listening on ws://{}:{}{}'.format(
+            self.host, self.port, self.path
+        ))
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _on_connect(self, websocket: Any, path: str) -> None:
+        prefix, _, cp_id = path.rstrip('/').rpartition('/')
+        if prefix != self.path or not cp_id:
+            logger.warning('Connection to unknown path {} closed'.format(path))
+            return await websocket.close(code=1008)
+        if websocket.subprotocol != SUBPROTOCOL:
+            logger.warning('Connection of CP {} without {} closed'.format(
+                cp_id, SUBPROTOCOL
+            ))
+            return await websocket.close(code=1002)
+
+        self.connected += 1
+        self.connections += 1
+        try:
+            await MockChargePoint(cp_id, websocket, self).start()
+        except ConnectionClosed:
+            pass
+        finally:
+            self.connected -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns number of connections and requests by action.
+
+        :return: Dict with central system statistics.
+        """
+        return {
+            'connected': self.connected,
+            'connections': self.connections,
+            'requests': dict(self.requests),
+            'rejected': dict(self.rejected),
+        }
@@ -5,7 +5,11 @@ from fastapi import FastAPI, HTTPException
 from starlette.exceptions import HTTPException as StarletteHTTPException
 
 from port_16.api import attach_cp_routes
+from port_16.api.common import LoadSheddingMiddleware
 from port_16.api.status.handlers import status
+from port_16.api.metrics.handlers import metrics
+from port_16.api.admin import handlers as admin_handlers
+from port_16.sharding import ShardingMiddleware
 from port_16.errors import (
     generic_error_handler,
     http_error_handler,
@@ -21,9 +25,28 @@ def attach_routes(app: FastAPI) -> None:
         tags=['port-16'],
         router=status.router
     )
+    app.include_router(
+        prefix='/metrics',
+        tags=['port-16'],
+        router=metrics.router
+    )
+    app.include_router(
+        prefix='/admin',
+        tags=['port-16'],
+        router=admin_handlers.router
+    )
     attach_cp_routes(app)
 
 
+def attach_middlewares(app: FastAPI) -> None:
+    """Attach middlewares to app
+    :param app: App object
+    """
+    app.add_middleware(ShardingMiddleware)
+    # added last, so overloaded worker rejects requests before reading them
+    app.add_middleware(LoadSheddingMiddleware)
+
+
 def attach_error_handlers(app: FastAPI) -> None:
     """Attach error handlers to app. Error handlers handle specific errors
     thrown by route handlers.
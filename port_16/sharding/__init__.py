@@ -0,0 +1,3 @@
+from .ring import HashRing
+from .worker import ShardWorker
+from .router import ShardRouter, ShardingMiddleware, replay_request
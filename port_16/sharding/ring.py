@@ -0,0 +1,38 @@
+import hashlib
+from bisect import bisect
+from typing import Iterable, Any
+
+
+class HashRing:
+    """
+    Consistent hashing ring. Every node is placed on ring vnodes times, so
+    keys are evenly distributed and only keys of added or removed node
+    change theirs owner.
+    """
+
+    def __init__(self, nodes: Iterable[Any], vnodes: int = 64):
+        points = sorted(
+            (self._hash('{}-{}'.format(node, index)), node)
+            for node in nodes for index in range(vnodes)
+        )
+        if not points:
+            raise ValueError('Hash ring requires at least one node')
+
+        self._keys = [point for point, _ in points]
+        self._nodes = [node for _, node in points]
+
+    @staticmethod
+    def _hash(value: str) -> int:
+        return int.from_bytes(
+            hashlib.md5(value.encode()).digest()[:8], 'big'
+        )
+
+    def get_node(self, key: str) -> Any:
+        """
+        Returns node which owns provided key.
+
+        :param key: Key, e.g. charge point identity.
+        :return: Owner node.
+        """
+        index = bisect(self._keys, self._hash(key)) % len(self._keys)
+        return self._nodes[index]
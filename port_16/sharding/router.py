@@ -0,0 +1,404 @@
+import json
+import uuid
+import base64
+import asyncio
+import logging
+from time import perf_counter
+from urllib.parse import quote
+from typing import Any, Dict, List, Optional, Tuple, NamedTuple
+
+import inject
+
+from port_16.metrics import Counter, Histogram
+from .ring import HashRing
+from .worker import ShardWorker
+
+logger = logging.getLogger(__name__)
+
+REQUEST_CHANNEL = 'PORT-16-SHARD-{}'
+REPLY_CHANNEL = 'PORT-16-SHARD-REPLY-{}'
+
+FORWARDED = Counter(
+    'port16_shard_forwarded_total',
+    'Number of requests forwarded to other shards and received from them',
+    ('direction',)
+)
+FORWARD_LATENCY = Histogram(
+    'port16_shard_forward_seconds',
+    'Round trip time of requests forwarded to other shards'
+)
+
+#: ASGI app which handles requests forwarded by other workers, set by
+#: ShardingMiddleware. It is app behind the middleware, so forwarded
+#: requests are handled locally without any marker which clients could
+#: send as well.
+_local_app = None
+
+
+class ForwardedResponse(NamedTuple):
+    status: int
+    headers: List[Tuple[bytes, bytes]]
+    body: bytes
+
+
+def _encode_headers(headers) -> List[List[str]]:
+    return [
+        [name.decode('latin-1'), value.decode('latin-1')]
+        for name, value in headers
+    ]
+
+
+def _decode_headers(headers) -> List[Tuple[bytes, bytes]]:
+    return [
+        (name.encode('latin-1'), value.encode('latin-1'))
+        for name, value in headers
+    ]
+
+
+def _error_response(status: int, detail: str) -> ForwardedResponse:
+    body = json.dumps({
+        'type': 'generic.http_exception',
+        'title': 'Generic http exception raised',
+        'detail': detail,
+        'instance': None,
+    }).encode()
+    return ForwardedResponse(
+        status, [(b'content-type', b'application/json')], body
+    )
+
+
+async def replay_request(
+    app: Any,
+    method: str,
+    path: str,
+    query_string: bytes = b'',
+    headers: Optional[List[Tuple[bytes, bytes]]] = None,
+    body: bytes = b''
+) -> ForwardedResponse:
+    """
+    Calls ASGI app with provided HTTP request and collects its response.
+
+    :param app: ASGI app.
+    :param method: HTTP method.
+    :param path: Request path.
+    :param query_string: Raw query string.
+    :param headers: Request headers.
+    :param body: Request body.
+    :return: App response.
+    """
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': method,
+        'scheme': 'http',
+        'path': path,
+        'raw_path': quote(path).encode(),
+        'query_string': query_string,
+        'root_path': '',
+        'headers': list(headers or []),
+        'client': None,
+        'server': None,
+    }
+    request_sent = False
+    response = {'status': 500, 'headers': [], 'body': []}
+    disconnected = asyncio.Event()
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+
+        await disconnected.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            response['status'] = message['status']
+            response['headers'] = list(message.get('headers', []))
+        elif message['type'] == 'http.response.body':
+            response['body'].append(message.get('body', b''))
+            if not message.get('more_body', False):
+                disconnected.set()
+
+    await app(scope, receive, send)
+    return ForwardedResponse(
+        response['status'], response['headers'], b''.join(response['body'])
+    )
+
+
+class ShardRouter:
+    """
+    Routes charge points to shards using consistent hashing of theirs
+    identities and forwards REST requests to worker which owns charge
+    point. Requests and responses are sent over redis pub/sub, every shard
+    listens on its request channel and every worker on its reply channel.
+    """
+
+    def __init__(
+        self,
+        redis_client: Any,
+        worker: ShardWorker,
+        vnodes: int = 64,
+        timeout: float = 35
+    ):
+        self.redis = redis_client
+        self.worker = worker
+        self.timeout = timeout
+        self.ring = HashRing(range(worker.shard_count), vnodes)
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._listeners = []
+        self._handlers = set()
+
+    @property
+    def slot(self) -> int:
+        return self.worker.slot
+
+    @property
+    def reply_channel(self) -> str:
+        return REPLY_CHANNEL.format(self.worker.worker_id)
+
+    def owner(self, identity: str) -> int:
+        """
+        Returns shard which owns charge point with provided identity.
+
+        :param identity: Identity of charge point.
+        :return: Owner shard.
+        """
+        return self.ring.get_node(identity)
+
+    def owns(self, identity: str) -> bool:
+        return self.owner(identity) == self.slot
+
+    async def start(self) -> None:
+        """
+        Subscribes to request channel of worker shard and to worker reply
+        channel.
+        """
+        request_channel, reply_channel = await self.redis.subscribe(
+            REQUEST_CHANNEL.format(self.slot), self.reply_channel
+        )
+        self._listeners = [
+            asyncio.ensure_future(self._listen_requests(request_channel)),
+            asyncio.ensure_future(self._listen_replies(reply_channel)),
+        ]
+        logger.info(
+            'Shard {} is listening forwarded requests'.format(self.slot)
+        )
+
+    async def stop(self) -> None:
+        for task in self._listeners:
+            task.cancel()
+        self._listeners = []
+        await self.redis.unsubscribe(
+            REQUEST_CHANNEL.format(self.slot), self.reply_channel
+        )
+        for future in self._pending.values():
+            future.cancel()
+        self._pending = {}
+
+    async def forward(
+        self,
+        slot: int,
+        method: str,
+        path: str,
+        query_string: bytes = b'',
+        headers: Optional[List[Tuple[bytes, bytes]]] = None,
+        body: bytes = b''
+    ) -> ForwardedResponse:
+        """
+        Forwards HTTP request to worker of provided shard and waits for its
+        response. If shard has no worker, Service Unavailable response is
+        returned, if response is not received in time, Gateway Timeout
+        response is returned.
+
+        :param slot: Shard which will handle request.
+        :param method: HTTP method.
+        :param path: Request path.
+        :param query_string: Raw query string.
+        :param headers: Request headers.
+        :param body: Request body.
+        :return: Response of shard worker.
+        """
+        request_id = uuid.uuid4().hex
+        future = asyncio.get_event_loop().create_future()
+        self._pending[request_id] = future
+        start = perf_counter()
+        try:
+            receivers = await self.redis.publish(
+                REQUEST_CHANNEL.format(slot), json.dumps({
+                    'id': request_id,
+                    'reply_to': self.reply_channel,
+                    'method': method,
+                    'path': path,
+                    'query_string': query_string.decode('latin-1'),
+                    'headers': _encode_headers(headers or []),
+                    'body': base64.b64encode(body).decode(),
+                })
+            )
+            if not receivers:
+                logger.warning('Shard {} has no worker'.format(slot))
+                return _error_response(
+                    503, f'Shard {slot} has no running worker'
+                )
+
+            FORWARDED.labels('sent').inc()
+            return await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            logger.warning(
+                'Request {} {} forwarded to shard {} timed out'.format(
+                    method, path, slot
+                )
+            )
+            return _error_response(
+                504, f'Shard {slot} did not respond in {self.timeout} seconds'
+            )
+        finally:
+            self._pending.pop(request_id, None)
+            FORWARD_LATENCY.observe(perf_counter() - start)
+
+    async def _listen_requests(self, channel: Any) -> None:
+        async for message in channel.iter(encoding='utf-8'):
+            task = asyncio.ensure_future(self._handle(json.loads(message)))
+            self._handlers.add(task)
+            task.add_done_callback(self._handlers.discard)
+
+    async def _handle(self, request: Dict[str, Any]) -> None:
+        FORWARDED.labels('received').inc()
+        headers = _decode_headers(request['headers'])
+        if _local_app is None:
+            response = _error_response(
+                503, 'Forwarded requests are not handled by this worker'
+            )
+        else:
+            try:
+                response = await replay_request(
+                    _local_app, request['method'], request['path'],
+                    request['query_string'].encode('latin-1'), headers,
+                    base64.b64decode(request['body'])
+                )
+            except Exception as e:
+                logger.exception('Forwarded request failed')
+                response = _error_response(500, str(e))
+
+        await self.redis.publish(request['reply_to'], json.dumps({
+            'id': request['id'],
+            'status': response.status,
+            'headers': _encode_headers(response.headers),
+            'body': base64.b64encode(response.body).decode(),
+        }))
+
+    async def _listen_replies(self, channel: Any) -> None:
+        async for message in channel.iter(encoding='utf-8'):
+            reply = json.loads(message)
+            future = self._pending.get(reply['id'])
+            if future is not None and not future.done():
+                future.set_result(ForwardedResponse(
+                    reply['status'], _decode_headers(reply['headers']),
+                    base64.b64decode(reply['body'])
+                ))
+
+
+def request_owner(
+    router: ShardRouter, method: str, path: str, body: bytes
+) -> Optional[int]:
+    """
+    Returns shard which must handle request or None if request could be
+    handled by any worker. Charge point and command requests are handled by
+    shard which owns charge point, bulk job and scenario run progress by
+    shard which runs job and shard status by requested shard.
+
+    :param router: Shard router.
+    :param method: HTTP method.
+    :param path: Request path (decoded).
+    :param body: Request body.
+    :return: Owner shard.
+    """
+    parts = path.strip('/').split('/')
+    if parts[0] == 'charging-points':
+        if len(parts) == 1:
+            if method != 'POST':
+                return None
+            try:
+                identity = json.loads(body)['identity']
+            except (ValueError, KeyError, TypeError):
+                return None
+            return router.owner(str(identity))
+
+        if parts[1] == 'bulk':
+            if len(parts) == 3:
+                slot, _, _ = parts[2].partition('-')
+                return int(slot) if slot.isdigit() else None
+            return None
+
+        return router.owner(parts[1])
+
+    if parts[0] == 'scenarios' and len(parts) == 2 and method == 'GET':
+        slot, _, _ = parts[1].partition('-')
+        return int(slot) if slot.isdigit() else None
+
+    if parts[0] == 'commands' and len(parts) >= 2:
+        return router.owner(parts[1])
+
+    if parts[:2] == ['status', 'shard'] and len(parts) == 3:
+        return int(parts[2]) if parts[2].isdigit() else None
+
+    return None
+
+
+class ShardingMiddleware:
+    """
+    ASGI middleware which forwards requests of charge points owned by other
+    shards to theirs workers. Requests received from other workers are
+    handled by app behind this middleware, so they are not forwarded again.
+    Without configured shard router requests are passed to app unchanged.
+    """
+
+    def __init__(self, app: Any):
+        global _local_app
+        self.app = app
+        _local_app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        #: :type: :class:`port_16.sharding.router.ShardRouter`
+        router = inject.instance('shard_router')
+        if router is None:
+            return await self.app(scope, receive, send)
+
+        body = b''
+        more_body = True
+        while more_body:
+            message = await receive()
+            body += message.get('body', b'')
+            more_body = message.get('more_body', False)
+
+        slot = request_owner(router, scope['method'], scope['path'], body)
+        if slot is None or slot == router.slot:
+            body_sent = False
+
+            async def replay_receive():
+                nonlocal body_sent
+                if not body_sent:
+                    body_sent = True
+                    return {
+                        'type': 'http.request', 'body': body,
+                        'more_body': False
+                    }
+                return await receive()
+
+            return await self.app(scope, replay_receive, send)
+
+        response = await router.forward(
+            slot, scope['method'], scope['path'],
+            scope.get('query_string', b''), scope.get('headers', []), body
+        )
+        await send({
+            'type': 'http.response.start',
+            'status': response.status,
+            'headers': response.headers,
+        })
+        await send({'type': 'http.response.body', 'body': response.body})
@@ -0,0 +1,123 @@
+import os
+import socket
+import asyncio
+import logging
+from typing import Any, Optional
+
+logger = logging.getLogger(__name__)
+
+SLOT_KEY = 'PORT-16-SHARD-SLOT-{}'
+
+#: Extends slot lease only if slot is still held by this worker
+REFRESH_SLOT_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+#: Releases slot only if slot is still held by this worker
+RELEASE_SLOT_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class ShardWorker:
+    """
+    Membership of worker process in sharded deployment. Every worker holds
+    one of shard_count slots, slot is leased in redis for ttl seconds and
+    lease is periodically extended. Slot of stopped or crashed worker is
+    released, so its replacement takes over same shard.
+    """
+
+    def __init__(self, redis_client: Any, shard_count: int, ttl: int = 10):
+        self.redis = redis_client
+        self.shard_count = shard_count
+        self.ttl = ttl
+        self.worker_id = '{}-{}'.format(socket.gethostname(), os.getpid())
+        self.slot: Optional[int] = None
+        self._refresher = None
+
+    async def claim(self, timeout: Optional[float] = None) -> int:
+        """
+        Claims first free slot, waiting for free slot if all slots are held
+        by other workers.
+
+        :param timeout: Max number of seconds to wait for free slot, it is
+            twice slot ttl if not provided.
+        :return: Claimed slot.
+        """
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + (timeout or self.ttl * 2)
+        while True:
+            for slot in range(self.shard_count):
+                claimed = await self.redis.set(
+                    SLOT_KEY.format(slot), self.worker_id, expire=self.ttl,
+                    exist=self.redis.SET_IF_NOT_EXIST
+                )
+                if claimed:
+                    self.slot = slot
+                    self._refresher = asyncio.ensure_future(self._refresh())
+                    logger.info(
+                        'Worker {} claimed shard {} of {}'.format(
+                            self.worker_id, slot, self.shard_count
+                        )
+                    )
+                    return slot
+
+            if loop.time() >= deadline:
+                raise RuntimeError(
+                    'All {} shard slots are held by other workers'.format(
+                        self.shard_count
+                    )
+                )
+            await asyncio.sleep(self.ttl / 2)
+
+    async def _refresh(self) -> None:
+        key = SLOT_KEY.format(self.slot)
+        while True:
+            await asyncio.sleep(self.ttl / 3)
+            try:
+                refreshed = await self.redis.eval(
+                    REFRESH_SLOT_SCRIPT, keys=[key],
+                    args=[self.worker_id, self.ttl]
+                )
+                if not refreshed:
+                    claimed = await self.redis.set(
+                        key, self.worker_id, expire=self.ttl,
+                        exist=self.redis.SET_IF_NOT_EXIST
+                    )
+                    logger.error(
+                        'Worker {} lost lease of shard {}, {}'.format(
+                            self.worker_id, self.slot,
+                            'lease is renewed' if claimed else
+                            'shard is held by other worker'
+                        )
+                    )
+            except Exception:
+                logger.exception(
+                    'Lease of shard {} could not be extended'.format(
+                        self.slot
+                    )
+                )
+
+    async def release(self) -> None:
+        """
+        Stops extending slot lease and releases slot.
+        """
+        if self._refresher is not None:
+            self._refresher.cancel()
+            self._refresher = None
+
+        if self.slot is not None:
+            await self.redis.eval(
+                RELEASE_SLOT_SCRIPT, keys=[SLOT_KEY.format(self.slot)],
+                args=[self.worker_id]
+            )
+            logger.info('Worker {} released shard {}'.format(
+                self.worker_id, self.slot
+            ))
+            self.slot = None
@@ -0,0 +1,138 @@
+"""Transactions started and stopped while charge point is offline, replayed
+when it reconnects."""
+import asyncio
+from types import SimpleNamespace
+
+import inject
+import pytest
+from ocpp.v16.enums import ChargePointStatus
+
+from port_16.api.charge_point import ChargingPointModel
+from port_16.api.commands.schemas import StartTransaction, StopTransaction
+from port_16.api.commands.operations import (
+    execute_start_transaction, execute_stop_transaction
+)
+from port_16.api.common import (
+    cp_db, AuthTagService, OfflineQueueManager, MeterValuesEngine,
+    StatePersister
+)
+from port_16.api.common.state import ChargePointStateMachine
+from port_16.api.common.service.backend import MemoryBackend
+
+CP_ID = 'CP-1'
+TAG = 'TAG-1'
+ACCEPTED = {'status': 'Accepted'}
+
+
+class FakeChargePoint:
+    """
+    Charge point which records calls sent to central system, which returns
+    transaction id 42 for every started transaction.
+    """
+
+    def __init__(self):
+        self.id = CP_ID
+        self.online = False
+        self.sent = []
+        self.state_machine = ChargePointStateMachine(
+            ChargingPointModel(
+                identity=CP_ID, ws_host='ws://localhost', ws_path='/'
+            ),
+            connectors={1: ChargePointStatus.available}
+        )
+
+    async def call(self, payload):
+        self.sent.append(payload)
+        return SimpleNamespace(transaction_id=42, id_tag_info=ACCEPTED)
+
+    async def send_stop_transaction(self, transaction):
+        self.sent.append(transaction)
+        return ACCEPTED
+
+    async def send_connector_status(self, connector_id, status):
+        pass
+
+
+@pytest.fixture
+def run():
+    def run_check(check):
+        async def main():
+            offline_queues = OfflineQueueManager(durable=False)
+
+            def configure(binder):
+                binder.bind('storage_backend', MemoryBackend())
+                binder.bind('storage_cache', None)
+                binder.bind('offline_queues', offline_queues)
+                binder.bind('meter_engine', MeterValuesEngine())
+                binder.bind('state_persister', StatePersister())
+
+            inject.clear_and_configure(configure)
+            await AuthTagService(TAG).store_storage_entity(ACCEPTED)
+            cp = FakeChargePoint()
+            cp_db.set_cp(cp)
+            try:
+                await check(cp, offline_queues)
+            finally:
+                cp_db.remove_cp(CP_ID)
+                inject.clear()
+
+        asyncio.run(main())
+
+    return run_check
+
+
+async def start(connector_id=1):
+    return await execute_start_transaction(CP_ID, StartTransaction(
+        connector_id=connector_id, id_tag=TAG,
+        start_time='2026-01-01T00:00:00Z', meter_start=0
+    ))
+
+
+async def stop(transaction_id):
+    return await execute_stop_transaction(CP_ID, StopTransaction(
+        transaction_id=transaction_id, id_tag=TAG,
+        stop_time='2026-01-01T01:00:00Z', meter_stop=100
+    ))
+
+
+async def reconnect(cp, offline_queues):
+    cp.online = True
+    offline_queues.replay(cp)
+    while offline_queues.should_queue(cp):
+        await asyncio.sleep(0)
+
+
+def test_offline_start_and_stop(run):
+    async def check(cp, offline_queues):
+        started = await start()
+        assert started['queued'] is True
+        assert started['transaction_id'] == -1
+
+        stopped = await stop(-1)
+        assert stopped['queued'] is True
+        assert cp.state_machine.transactions == {}
+        assert cp.state_machine.connectors[1] == ChargePointStatus.available
+
+        await reconnect(cp, offline_queues)
+        start_call, stop_call = cp.sent
+        assert start_call.connector_id == 1
+        assert stop_call.transaction_id == 42
+        assert cp.state_machine.transactions == {}
+
+    run(check)
+
+
+def test_offline_start_stopped_after_replay(run):
+    async def check(cp, offline_queues):
+        assert (await start())['transaction_id'] == -1
+        await reconnect(cp, offline_queues)
+        assert cp.state_machine.transactions == {42: 1}
+
+        # provisional id is still accepted after start is replayed
+        stopped = await stop(-1)
+        assert stopped['queued'] is False
+        assert cp.sent[-1].transaction_id == 42
+        assert cp.state_machine.transactions == {}
+        assert cp.state_machine.connectors[1] == ChargePointStatus.available
+
+    run(check)
@@ -0,0 +1,286 @@
+"""Contract of storage backends. Every case runs against memory backend and
+redis backend (fakeredis with Lua), with string and hash entities, so all
+backends behave the same for storage services."""
+import asyncio
+
+import pytest
+
+from port_16.api.common.service.backend import (
+    MemoryBackend, RedisBackend, BatchOperation
+)
+
+fakeredis_aioredis = pytest.importorskip('fakeredis.aioredis')
+
+KEY = 'CHARGE_POINT:CP-1'
+OTHER_KEY = 'CHARGE_POINT:CP-2'
+INDEX = 'CHARGE_POINT:ALL_KEYS'
+LIST_KEY = 'OFFLINE_QUEUE:CP-1'
+
+
+@pytest.fixture(
+    params=[
+        ('memory', False), ('memory', True),
+        ('redis', False), ('redis', True),
+    ],
+    ids=['memory', 'memory-hash', 'redis', 'redis-hash']
+)
+def run(request):
+    """
+    Returns function which runs test coroutine with new backend and
+    hash_entity flag of current parameters.
+    """
+    name, hash_entity = request.param
+
+    def run_check(check):
+        async def main():
+            if name == 'memory':
+                backend = MemoryBackend()
+            else:
+                backend = RedisBackend(
+                    await fakeredis_aioredis.create_redis_pool(maxsize=10)
+                )
+            try:
+                await check(backend, hash_entity)
+            finally:
+                await backend.close()
+
+        asyncio.run(main())
+
+    return run_check
+
+
+async def members(backend, index_key=INDEX):
+    return {member async for member in backend.iter_index(index_key)}
+
+
+def test_get_missing(run):
+    async def check(backend, hash_entity):
+        assert await backend.get(KEY, hash_entity) is None
+        assert await backend.get_many([KEY, OTHER_KEY], hash_entity) == [
+            None, None
+        ]
+
+    run(check)
+
+
+def test_store_and_get(run):
+    async def check(backend, hash_entity):
+        data = {'identity': 'CP-1', 'status': 'AVAILABLE', 'connectors': 2}
+        await backend.store(KEY, data, INDEX, 'CP-1', hash_entity)
+
+        assert await backend.get(KEY, hash_entity) == data
+        assert await backend.get_many([KEY, OTHER_KEY], hash_entity) == [
+            data, None
+        ]
+        assert await members(backend) == {'CP-1'}
+
+    run(check)
+
+
+def test_store_replaces_entity(run):
+    async def check(backend, hash_entity):
+        await backend.store(KEY, {'a': 1, 'b': 2}, INDEX, 'CP-1', hash_entity)
+        await backend.store(KEY, {'a': 3}, INDEX, 'CP-1', hash_entity)
+
+        assert await backend.get(KEY, hash_entity) == {'a': 3}
+
+    run(check)
+
+
+def test_stored_data_is_copied(run):
+    async def check(backend, hash_entity):
+        data = {'tags': ['A']}
+        await backend.store(KEY, data, INDEX, 'CP-1', hash_entity)
+        data['tags'].append('B')
+        stored = await backend.get(KEY, hash_entity)
+        stored['tags'].append('C')
+
+        assert await backend.get(KEY, hash_entity) == {'tags': ['A']}
+
+    run(check)
+
+
+def test_update_creates_missing_entity(run):
+    async def check(backend, hash_entity):
+        merged = await backend.update(
+            KEY, {'status': 'AVAILABLE'}, INDEX, 'CP-1', hash_entity
+        )
+
+        assert merged == {'status': 'AVAILABLE'}
+        assert await backend.get(KEY, hash_entity) == merged
+        assert await members(backend) == {'CP-1'}
+
+    run(check)
+
+
+def test_update_merges_fields(run):
+    async def check(backend, hash_entity):
+        await backend.store(KEY, {'a': 1, 'b': 2}, INDEX, 'CP-1', hash_entity)
+        merged = await backend.update(
+            KEY, {'b': 3, 'c': [1]}, INDEX, 'CP-1', hash_entity
+        )
+
+        assert merged == {'a': 1, 'b': 3, 'c': [1]}
+        assert await backend.get(KEY, hash_entity) == merged
+
+    run(check)
+
+
+def test_update_existing(run):
+    async def check(backend, hash_entity):
+        assert await backend.update_existing(
+            KEY, {'a': 1}, hash_entity
+        ) is None
+        assert await backend.get(KEY, hash_entity) is None
+
+        await backend.store(KEY, {'a': 1, 'b': 2}, INDEX, 'CP-1', hash_entity)
+        merged = await backend.update_existing(KEY, {'b': 3}, hash_entity)
+
+        assert merged == {'a': 1, 'b': 3}
+        assert await backend.get(KEY, hash_entity) == merged
+        assert await backend.update_existing(KEY, {}, hash_entity) == merged
+
+    run(check)
+
+
+def test_pop_fields(run):
+    async def check(backend, hash_entity):
+        assert await backend.pop_fields(KEY, ['a'], hash_entity) == {}
+
+        await backend.store(
+            KEY, {'a': 1, 'b': {'c': 2}, 'd': 3}, INDEX, 'CP-1', hash_entity
+        )
+        removed = await backend.pop_fields(
+            KEY, ['a', 'b', 'missing'], hash_entity
+        )
+
+        assert removed == {'a': 1, 'b': {'c': 2}}
+        assert await backend.get(KEY, hash_entity) == {'d': 3}
+
+    run(check)
+
+
+def test_delete(run):
+    async def check(backend, hash_entity):
+        await backend.store(KEY, {'a': 1}, INDEX, 'CP-1', hash_entity)
+        await backend.store(OTHER_KEY, {'a': 2}, INDEX, 'CP-2', hash_entity)
+        await backend.delete(KEY, INDEX, 'CP-1', hash_entity)
+
+        assert await backend.get(KEY, hash_entity) is None
+        assert await backend.get(OTHER_KEY, hash_entity) == {'a': 2}
+        assert await members(backend) == {'CP-2'}
+
+    run(check)
+
+
+def test_migrate_entities(run):
+    async def check(backend, hash_entity):
+        data = {'a': 1, 'tags': ['A'], 'none': None}
+        # first entity is stored before storage format is switched
+        await backend.store(KEY, data, INDEX, 'CP-1', not hash_entity)
+        await backend.store(OTHER_KEY, data, INDEX, 'CP-2', hash_entity)
+
+        migrated = await backend.migrate_entities(
+            [KEY, OTHER_KEY, 'CHARGE_POINT:missing'], hash_entity
+        )
+        assert migrated == (1 if isinstance(backend, RedisBackend) else 0)
+        assert await backend.get(KEY, hash_entity) == data
+        assert await backend.get(OTHER_KEY, hash_entity) == data
+        assert await backend.migrate_entities(
+            [KEY, OTHER_KEY], hash_entity
+        ) == 0
+
+    run(check)
+
+
+def test_key_index(run):
+    async def check(backend, hash_entity):
+        assert await backend.index_add(INDEX, 'CP-1') is True
+        assert await backend.index_add(INDEX, 'CP-1') is False
+        assert await backend.index_add(INDEX, 'CP-2') is True
+        assert await members(backend) == {'CP-1', 'CP-2'}
+
+        assert await backend.index_remove(INDEX, 'CP-1') is True
+        assert await backend.index_remove(INDEX, 'CP-1') is False
+        assert await members(backend) == {'CP-2'}
+        assert await members(backend, 'OTHER:ALL_KEYS') == set()
+
+    run(check)
+
+
+def test_list(run):
+    async def check(backend, hash_entity):
+        assert await backend.list_range(LIST_KEY) == []
+        assert await backend.list_push(LIST_KEY, ['1', '2']) == 2
+        # length before oldest values are removed is returned
+        assert await backend.list_push(
+            LIST_KEY, ['3', '4'], max_length=3
+        ) == 4
+        assert await backend.list_range(LIST_KEY) == ['2', '3', '4']
+
+        await backend.list_pop(LIST_KEY, 2)
+        assert await backend.list_range(LIST_KEY) == ['4']
+        await backend.list_pop(LIST_KEY, 1)
+        assert await backend.list_range(LIST_KEY) == []
+        await backend.list_pop('missing', 1)
+
+    run(check)
+
+
+def test_execute_batch(run):
+    async def check(backend, hash_entity):
+        results = await backend.execute_batch([
+            BatchOperation(
+                'store', KEY, ({'owner': 'free', 'a': 1}, INDEX, 'CP-1'),
+                hash_entity
+            ),
+            BatchOperation(
+                'update', KEY, ({'b': 2}, INDEX, 'CP-1'), hash_entity
+            ),
+            BatchOperation('pop_fields', KEY, (['a'],), hash_entity),
+            BatchOperation(
+                'update_existing', OTHER_KEY, ({'a': 1},), hash_entity
+            ),
+            BatchOperation(
+                'update', OTHER_KEY, ({'a': 2}, INDEX, 'CP-2'), hash_entity
+            ),
+        ])
+
+        assert results == [
+            None,
+            {'owner': 'free', 'a': 1, 'b': 2},
+            {'a': 1},
+            None,
+            {'a': 2},
+        ]
+        assert await backend.get(KEY, hash_entity) == {
+            'owner': 'free', 'b': 2
+        }
+        assert await backend.get(OTHER_KEY, hash_entity) == {'a': 2}
+        assert await members(backend) == {'CP-1', 'CP-2'}
+
+    run(check)
+
+
+def test_concurrent_updates_are_not_lost(run):
+    async def check(backend, hash_entity):
+        await backend.store(KEY, {'owner': 'free'}, INDEX, 'CP-1', hash_entity)
+        await asyncio.gather(*(
+            backend.update(
+                KEY, {'field{}'.format(number): number}, INDEX, 'CP-1',
+                hash_entity
+            )
+            for number in range(5)
+        ), *(
+            backend.update_existing(
+                KEY, {'other{}'.format(number): number}, hash_entity
+            )
+            for number in range(5)
+        ))
+
+        stored = await backend.get(KEY, hash_entity)
+        for number in range(5):
+            assert stored['field{}'.format(number)] == number
+            assert stored['other{}'.format(number)] == number
+
+    run(check)